@@ -70,16 +70,9 @@ class CartAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'session_id', 'items_count', 'total_price', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('user__username', 'session_id')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'items_count', 'total_price')
     inlines = [CartItemInline]
-    
-    def items_count(self, obj):
-        return obj.items.count()
-    items_count.short_description = 'Кол-во товаров'
-    
-    def total_price(self, obj):
-        return sum(item.quantity * item.sneaker.price for item in obj.items.all())
-    total_price.short_description = 'Общая сумма'
+    list_select_related = ('user',)
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -0,0 +1,63 @@
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+# Движки сессий, которые хранят сессии в таблице django_session
+DB_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+
+def expired_session_filter(timestamp_field, now=None):
+    """
+    Условие для строк анонимных посетителей (по session_id), чья сессия истекла.
+
+    При сессиях в базе строка считается устаревшей, если ее сессии нет
+    среди действующих; при других движках - если она не менялась дольше
+    SESSION_COOKIE_AGE.
+    """
+    now = now or timezone.now()
+    if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+        live = Session.objects.filter(expire_date__gt=now).values('session_key')
+        return Q(user__isnull=True, session_id__isnull=False) & ~Q(session_id__in=live)
+    cutoff = now - timedelta(seconds=settings.SESSION_COOKIE_AGE)
+    return Q(user__isnull=True, session_id__isnull=False, **{f'{timestamp_field}__lt': cutoff})
+
+
+def expired_querysets(now=None):
+    """
+    Устаревшие анонимные корзины и избранное (позиции корзин удаляются каскадом).
+    """
+    from api.models import Cart, Favorite
+
+    return [
+        Cart.objects.filter(expired_session_filter('updated_at', now)),
+        Favorite.objects.filter(expired_session_filter('added_at', now)),
+    ]
+
+
+def purge_queryset(queryset, batch_size=500, pause=0):
+    """
+    Удаляет строки пакетами по batch_size, каждый пакет в своей короткой
+    транзакции, чтобы не держать блокировку записи SQLite долго.
+    Между пакетами можно сделать паузу (в секундах) для других писателей.
+
+    Возвращает Counter удаленных строк по моделям (как QuerySet.delete()).
+    """
+    removed = Counter()
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return removed
+            _, per_model = queryset.model.objects.filter(pk__in=ids).delete()
+        removed.update(per_model)
+        if pause:
+            time.sleep(pause)
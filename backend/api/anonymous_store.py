@@ -0,0 +1,468 @@
+import secrets
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+from djoser.signals import user_registered
+from rest_framework import exceptions, serializers, status
+
+from api.favorites_cache import favorites_owner, refresh_favorites
+from api.models import Cart, CartItem, Favorite, Sneaker
+
+# Соль подписи cookie с состоянием анонимного посетителя
+SIGNING_SALT = 'api.anonymous_store'
+
+DEFAULT_BACKEND = 'api.anonymous_store.CacheAnonymousStore'
+DEFAULT_TIMEOUT = 60 * 60 * 24 * 30
+DEFAULT_MAX_ITEMS = 50
+# Блокировка состояния на время изменяющего запроса: сколько она живет
+# (если процесс упал, не сняв ее) и сколько ждет следующий запрос
+DEFAULT_LOCK_TIMEOUT = 10
+DEFAULT_LOCK_WAIT = 5
+
+
+class AnonymousStateLocked(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Корзина изменяется другим запросом, повторите попытку'
+    default_code = 'anonymous_state_locked'
+
+
+def _get_timeout():
+    return getattr(settings, 'ANONYMOUS_STORE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def _as_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+class AnonymousState:
+    """
+    Корзина и избранное анонимного посетителя.
+
+    Хранится компактно: {sneaker_id: [количество, время добавления]} для корзины
+    и {sneaker_id: время добавления} для избранного. Строк в базе не создает;
+    флаг modified говорит, что состояние нужно сохранить после ответа.
+    """
+
+    def __init__(self, data=None):
+        data = data or {}
+        now = int(time.time())
+        self.cart = {int(sneaker_id): list(line) for sneaker_id, line in data.get('c', {}).items()}
+        self.favorites = {int(sneaker_id): added for sneaker_id, added in data.get('f', {}).items()}
+        self.version = data.get('v', 0)
+        self.created = data.get('t', now)
+        self.updated = data.get('u', self.created)
+        self.modified = False
+        # Данные перенесены в базу, хранилище нужно очистить
+        self.materialized = False
+        # Состояние прочитано для изменения (под блокировкой хранилища, если она есть)
+        self.for_update = False
+        self.lock = None
+        # Ключ сессии, чьи старые строки Cart/Favorite перенесены в состояние
+        self.legacy_session = None
+
+    def to_dict(self):
+        return {
+            'c': {str(sneaker_id): line for sneaker_id, line in self.cart.items()},
+            'f': {str(sneaker_id): added for sneaker_id, added in self.favorites.items()},
+            'v': self.version,
+            't': self.created,
+            'u': self.updated,
+        }
+
+    def is_empty(self):
+        return not self.cart and not self.favorites
+
+    def touch(self):
+        self.modified = True
+        self.updated = int(time.time())
+
+    def _check_limit(self, collection, sneaker_id):
+        max_items = getattr(settings, 'ANONYMOUS_STORE_MAX_ITEMS', DEFAULT_MAX_ITEMS)
+        if sneaker_id not in collection and len(collection) >= max_items:
+            raise serializers.ValidationError(
+                {'error': f'Без регистрации можно сохранить не больше {max_items} товаров'}
+            )
+
+    def add_to_cart(self, quantities, increment=True):
+        """
+        Добавляет товары в корзину: {sneaker_id: количество}.
+        """
+        now = int(time.time())
+        for sneaker_id, quantity in quantities.items():
+            line = self.cart.get(sneaker_id)
+            if line is None:
+                self._check_limit(self.cart, sneaker_id)
+                self.cart[sneaker_id] = [quantity, now]
+            else:
+                line[0] = line[0] + quantity if increment else quantity
+        if quantities:
+            self.touch()
+
+    def set_cart_quantity(self, sneaker_id, quantity):
+        """
+        Меняет количество товара, который уже есть в корзине (0 - удаляет).
+        Возвращает число измененных позиций.
+        """
+        if sneaker_id not in self.cart:
+            return 0
+        if quantity <= 0:
+            del self.cart[sneaker_id]
+        else:
+            self.cart[sneaker_id][0] = quantity
+        self.touch()
+        return 1
+
+    def remove_from_cart(self, sneaker_ids):
+        """
+        Удаляет товары из корзины и возвращает число удаленных позиций.
+        """
+        removed = 0
+        for sneaker_id in sneaker_ids:
+            if self.cart.pop(sneaker_id, None) is not None:
+                removed += 1
+        if removed:
+            self.touch()
+        return removed
+
+    def clear_cart(self):
+        self.cart.clear()
+        self.touch()
+
+    def add_favorite(self, sneaker_id):
+        """
+        Добавляет товар в избранное; False, если он там уже был.
+        """
+        if sneaker_id in self.favorites:
+            return False
+        self._check_limit(self.favorites, sneaker_id)
+        self.favorites[sneaker_id] = int(time.time())
+        self.touch()
+        return True
+
+    def remove_favorite(self, sneaker_id):
+        if self.favorites.pop(sneaker_id, None) is None:
+            return False
+        self.touch()
+        return True
+
+    def favorite_entries(self):
+        """
+        Избранное в формате api.favorites_cache: {sneaker_id: (None, added_at)}.
+        """
+        return {sneaker_id: (None, _as_datetime(added)) for sneaker_id, added in self.favorites.items()}
+
+
+class BaseAnonymousStore:
+    """
+    Хранилище состояния анонимного посетителя. Наследники реализуют
+    load, save и clear; cookie выставляется только при изменении данных.
+    """
+    default_cookie_name = 'anonymous_state'
+
+    @property
+    def cookie_name(self):
+        return getattr(settings, 'ANONYMOUS_COOKIE_NAME', self.default_cookie_name)
+    
+    def acquire(self, request):
+        """
+        Блокирует состояние посетителя до конца запроса и возвращает
+        блокировку (или None, если блокировать нечего).
+        """
+        return None
+    
+    def release(self, lock):
+        pass
+
+    def load(self, request):
+        """
+        Сохраненные данные (словарь AnonymousState.to_dict()) или None.
+        """
+        raise NotImplementedError
+
+    def save(self, request, response, state):
+        raise NotImplementedError
+
+    def clear(self, request, response):
+        raise NotImplementedError
+
+    def set_cookie(self, response, value):
+        response.set_cookie(
+            self.cookie_name,
+            value,
+            max_age=_get_timeout(),
+            httponly=True,
+            samesite='Lax',
+            secure=settings.SESSION_COOKIE_SECURE,
+        )
+
+
+class CacheAnonymousStore(BaseAnonymousStore):
+    """
+    Данные хранятся в кэше Django, в cookie - только случайный ключ.
+    Для нескольких процессов нужен общий кэш (Redis, Memcached, файловый).
+    """
+    default_cookie_name = 'anonymous_id'
+
+    @cached_property
+    def cache(self):
+        return caches[getattr(settings, 'ANONYMOUS_STORE_CACHE_ALIAS', 'default')]
+
+    def get_cache_key(self, token):
+        return f'anonymous:{token}'
+    
+    def acquire(self, request):
+        """
+        Блокировка через cache.add: изменяющие запросы одного посетителя
+        (например, из двух вкладок) выполняются по очереди, и ни одно
+        изменение не затирается. Атомарна в Redis и Memcached.
+        """
+        token = request.COOKIES.get(self.cookie_name)
+        if not token:
+            # Новый посетитель: общего с другими запросами состояния еще нет
+            return None
+        key = f'{self.get_cache_key(token)}:lock'
+        timeout = getattr(settings, 'ANONYMOUS_STORE_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)
+        deadline = time.monotonic() + getattr(settings, 'ANONYMOUS_STORE_LOCK_WAIT', DEFAULT_LOCK_WAIT)
+        while not self.cache.add(key, 1, timeout):
+            if time.monotonic() >= deadline:
+                raise AnonymousStateLocked()
+            time.sleep(0.02)
+        return key
+    
+    def release(self, lock):
+        if lock is not None:
+            self.cache.delete(lock)
+
+    def load(self, request):
+        token = request.COOKIES.get(self.cookie_name)
+        if not token:
+            return None
+        return self.cache.get(self.get_cache_key(token))
+
+    def save(self, request, response, state):
+        token = request.COOKIES.get(self.cookie_name) or secrets.token_urlsafe(24)
+        self.cache.set(self.get_cache_key(token), state.to_dict(), _get_timeout())
+        # Продлеваем cookie вместе с записью в кэше
+        self.set_cookie(response, token)
+
+    def clear(self, request, response):
+        token = request.COOKIES.get(self.cookie_name)
+        if token:
+            self.cache.delete(self.get_cache_key(token))
+            response.delete_cookie(self.cookie_name, samesite='Lax')
+
+
+class SignedCookieAnonymousStore(BaseAnonymousStore):
+    """
+    Данные хранятся прямо в подписанной сжатой cookie: ни база, ни кэш не нужны.
+    Размер ограничен ANONYMOUS_STORE_MAX_ITEMS, чтобы cookie уложилась в 4 КБ.
+    Одновременные изменения из разных вкладок не объединяются: остается
+    cookie последнего ответа.
+    """
+
+    def load(self, request):
+        value = request.COOKIES.get(self.cookie_name)
+        if not value:
+            return None
+        try:
+            return signing.loads(value, salt=SIGNING_SALT, max_age=_get_timeout())
+        except signing.BadSignature:
+            return None
+
+    def save(self, request, response, state):
+        self.set_cookie(response, signing.dumps(state.to_dict(), salt=SIGNING_SALT, compress=True))
+
+    def clear(self, request, response):
+        if self.cookie_name in request.COOKIES:
+            response.delete_cookie(self.cookie_name, samesite='Lax')
+
+
+_store = None
+
+
+def get_anonymous_store():
+    """
+    Хранилище из настройки ANONYMOUS_STORE_BACKEND.
+    """
+    global _store
+    path = getattr(settings, 'ANONYMOUS_STORE_BACKEND', DEFAULT_BACKEND)
+    if _store is None or _store[0] != path:
+        _store = (path, import_string(path)())
+    return _store[1]
+
+
+def get_anonymous_state(request, for_update=False):
+    """
+    Состояние анонимного посетителя, загружаемое один раз за запрос.
+    Сохраняется после ответа в AnonymousStoreMiddleware.
+    
+    for_update=True блокирует состояние до конца запроса и перечитывает его
+    под блокировкой: параллельные изменения не теряются.
+    """
+    request = getattr(request, '_request', request)
+    state = getattr(request, '_anonymous_state', None)
+    if state is None or (for_update and not state.for_update and not state.modified):
+        store = get_anonymous_store()
+        lock = store.acquire(request) if for_update else None
+        try:
+            data = store.load(request)
+            state = AnonymousState(data)
+            state.for_update, state.lock = for_update, lock
+            if data is None:
+                import_legacy_session(request, state, store)
+        except BaseException:
+            store.release(lock)
+            raise
+        request._anonymous_state = state
+    return state
+
+
+def _legacy_checked_key(session_key):
+    return f'anonymous:legacy-checked:{session_key}'
+
+
+def import_legacy_session(request, state, store):
+    """
+    Переносит в пустое состояние корзину и избранное, которые раньше
+    хранились в строках Cart/Favorite по ключу сессии Django.
+    Сами строки удаляются после сохранения состояния (drop_legacy_session).
+    
+    В базу обращаемся только для сессии без cookie нового хранилища
+    (с ней перенос уже выполнялся) и только один раз: сессия без старых
+    строк запоминается в кэше.
+    """
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not session_key or store.cookie_name in request.COOKIES:
+        return
+    cache = caches[getattr(settings, 'ANONYMOUS_STORE_CACHE_ALIAS', 'default')]
+    if cache.get(_legacy_checked_key(session_key)):
+        return
+    max_items = getattr(settings, 'ANONYMOUS_STORE_MAX_ITEMS', DEFAULT_MAX_ITEMS)
+    cart_items = CartItem.objects.filter(
+        cart__session_id=session_key, cart__user__isnull=True
+    ).order_by('added_at').values_list('sneaker_id', 'quantity', 'added_at')[:max_items]
+    favorites = Favorite.objects.filter(
+        session_id=session_key, user__isnull=True
+    ).order_by('added_at').values_list('sneaker_id', 'added_at')[:max_items]
+    
+    for sneaker_id, quantity, added in cart_items:
+        state.cart[sneaker_id] = [quantity, int(added.timestamp())]
+    for sneaker_id, added in favorites:
+        state.favorites[sneaker_id] = int(added.timestamp())
+    if not state.is_empty():
+        state.legacy_session = session_key
+        state.touch()
+    else:
+        cache.set(_legacy_checked_key(session_key), True, _get_timeout())
+
+
+def drop_legacy_session(session_key):
+    """
+    Удаляет перенесенные строки Cart/Favorite старой сессии.
+    """
+    with transaction.atomic():
+        Cart.objects.filter(session_id=session_key, user__isnull=True).delete()
+        # Кэш избранного сессии сбрасывает обработчик post_delete
+        Favorite.objects.filter(session_id=session_key, user__isnull=True).delete()
+
+
+class AnonymousCart:
+    """
+    Корзина анонимного посетителя с интерфейсом, которого ждет CartSerializer.
+    Позиции - несохраненные CartItem с кроссовками, загруженными одним запросом.
+    """
+    pk = id = 0
+
+    def __init__(self, state):
+        self.state = state
+
+    @property
+    def version(self):
+        return self.state.version
+
+    @property
+    def created_at(self):
+        return _as_datetime(self.state.created)
+
+    @property
+    def updated_at(self):
+        return _as_datetime(self.state.updated)
+
+    def load_items(self, queryset=None):
+        """
+        Загружает позиции корзины одним запросом. Товары, удаленные
+        из каталога, пропускаются.
+        """
+        queryset = Sneaker.objects.all() if queryset is None else queryset
+        sneakers = queryset.in_bulk(list(self.state.cart)) if self.state.cart else {}
+        self.loaded_items = []
+        for sneaker_id, (quantity, added) in self.state.cart.items():
+            sneaker = sneakers.get(sneaker_id)
+            if sneaker is not None:
+                self.loaded_items.append(
+                    CartItem(sneaker=sneaker, quantity=quantity, added_at=_as_datetime(added))
+                )
+        return self.loaded_items
+
+    @property
+    def items(self):
+        # CartSerializer перебирает позиции как обычный список
+        if not hasattr(self, 'loaded_items'):
+            self.load_items()
+        return self.loaded_items
+
+    @property
+    def total_price(self):
+        return sum(item.sneaker.price * item.quantity for item in self.items)
+
+    @property
+    def items_count(self):
+        return sum(item.quantity for item in self.items)
+
+
+def materialize(request, user):
+    """
+    Переносит корзину и избранное анонимного посетителя в строки базы
+    пользователя (при регистрации или оформлении заказа).
+
+    Количество уже лежащих в корзине товаров складывается, дубликаты
+    избранного пропускаются. Хранилище очищается после ответа.
+    Возвращает True, если было что переносить.
+    """
+    state = get_anonymous_state(request, for_update=True)
+    if state.is_empty():
+        return False
+
+    existing = set(
+        Sneaker.objects.filter(pk__in=[*state.cart, *state.favorites]).values_list('pk', flat=True)
+    )
+    quantities = {sneaker_id: line[0] for sneaker_id, line in state.cart.items() if sneaker_id in existing}
+    with transaction.atomic():
+        if quantities:
+            cart, _ = Cart.objects.get_or_create(user=user)
+            CartItem.objects.upsert(cart, quantities)
+            Cart.objects.filter(pk=cart.pk).bump_version()
+        Favorite.objects.bulk_create(
+            [Favorite(user=user, sneaker_id=sneaker_id) for sneaker_id in state.favorites if sneaker_id in existing],
+            ignore_conflicts=True,
+        )
+        if state.favorites:
+            refresh_favorites(favorites_owner(user))
+        # Хранилище очищается, только если перенос (и внешняя транзакция) зафиксирован
+        transaction.on_commit(lambda: setattr(state, 'materialized', True))
+    return True
+
+
+@receiver(user_registered)
+def materialize_on_registration(sender, user, request, **kwargs):
+    """
+    Регистрация через djoser (/api/auth/users/).
+    """
+    materialize(request, user)
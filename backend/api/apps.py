@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Перенос анонимной корзины и избранного при регистрации через djoser
+        from api import anonymous_store  # noqa: F401
+        # Проверка, что кэши поколений и посетителей общие для воркеров
+        from api import checks  # noqa: F401
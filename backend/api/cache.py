@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# Ключ счетчика поколений каталога в кэше Django. Кэш (CATALOG_CACHE_ALIAS)
+# должен быть общим для воркеров, иначе изменение в одном процессе
+# не сбросит ответы, закэшированные в остальных
+GENERATION_KEY = 'catalog:generation'
+
+_MISSING = object()
+
+
+def generation_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _new_generation():
+    # Поколения только сравниваются на равенство: важна уникальность, а не порядок
+    return time.time_ns()
+
+
+def get_catalog_generation():
+    """
+    Возвращает текущее поколение каталога.
+
+    Начальное значение берется от текущего времени, чтобы после вытеснения
+    ключа из кэша не совпасть со старыми поколениями.
+    """
+    return generation_cache().get_or_set(GENERATION_KEY, _new_generation, None)
+
+
+def _bump():
+    # Новое уникальное значение, а не incr(): в файловом кэше incr - это
+    # чтение и запись, и два процесса могли записать одно и то же N+1
+    generation_cache().set(GENERATION_KEY, _new_generation(), None)
+
+    from api.snapshots import schedule_rebuild
+    schedule_rebuild()
+
+
+def bump_catalog_generation():
+    """
+    Меняет поколение каталога после фиксации транзакции,
+    чтобы никто не успел закэшировать незафиксированные данные.
+    """
+    transaction.on_commit(_bump)
+
+
+class CatalogResponseCache:
+    """
+    Ограниченный по размеру LRU-кэш ответов каталога в памяти процесса.
+
+    Ключ включает поколение каталога, поэтому любое изменение кроссовок
+    делает старые записи недостижимыми - они вытесняются по LRU.
+    Одновременные промахи по одному ключу строят ответ один раз:
+    остальные потоки ждут результат первого.
+    """
+
+    def __init__(self, max_entries=None, timeout=None):
+        self.max_entries = max_entries or getattr(settings, 'CATALOG_CACHE_MAX_ENTRIES', 512)
+        self.timeout = timeout if timeout is not None else getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._building = {}
+
+    def make_key(self, request, action, *parts):
+        """
+        Ключ из поколения каталога, хоста (ответы содержат абсолютные URL)
+        и нормализованных параметров запроса.
+        """
+        params = tuple(sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values
+            if value != ''
+        ))
+        host = request.build_absolute_uri('/')
+        return (get_catalog_generation(), action, host, parts, params)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        """
+        Найденные значения для списка ключей: {ключ: значение}.
+        """
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.timeout if self.timeout else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, key, builder):
+        """
+        Возвращает значение из кэша или строит его вызовом builder().
+        """
+        value = self.get(key)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+
+        with build_lock:
+            # Пока ждали блокировку, ответ мог построить другой поток
+            value = self.get(key)
+            if value is _MISSING:
+                try:
+                    value = builder()
+                    self.set(key, value)
+                finally:
+                    with self._lock:
+                        self._building.pop(key, None)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+catalog_cache = CatalogResponseCache()
+
+# Карточки отдельных кроссовок (например, в списке избранного)
+sneaker_card_cache = CatalogResponseCache(
+    max_entries=getattr(settings, 'SNEAKER_CARD_CACHE_MAX_ENTRIES', 5000)
+)
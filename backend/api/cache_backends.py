@@ -0,0 +1,36 @@
+import os
+import tempfile
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class FileCache(FileBasedCache):
+    """
+    Файловый кэш, общий для всех процессов на одной машине, с атомарным add.
+
+    Стандартный FileBasedCache.add сначала проверяет ключ, а потом пишет:
+    два процесса могут одновременно решить, что ключ свободен. Здесь запись
+    связывается с именем через os.link, который не перезаписывает
+    существующий файл, - на add можно строить блокировки.
+    """
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, fname)
+                    return True
+                except FileExistsError:
+                    # has_key удаляет просроченную запись - тогда пробуем еще раз
+                    if self.has_key(key, version):
+                        return False
+            return False
+        finally:
+            os.remove(tmp_path)
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core import checks
+
+# Настройки с алиасами кэшей, которые должны быть общими для всех процессов
+SHARED_CACHE_SETTINGS = (
+    'CATALOG_CACHE_ALIAS',
+    'ANONYMOUS_STORE_CACHE_ALIAS',
+    'FAVORITES_CACHE_ALIAS',
+)
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    """
+    Счетчики поколений и данные посетителей в кэше процесса расходятся
+    между воркерами: каждый видит только свои изменения.
+    """
+    errors = []
+    for name in SHARED_CACHE_SETTINGS:
+        alias = getattr(settings, name, 'default')
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in LOCAL_CACHE_BACKENDS:
+            errors.append(checks.Warning(
+                f'{name} указывает на кэш "{alias}" ({backend}), который не общий для процессов',
+                hint='Используйте файловый кэш, Redis или Memcached, если сервер запускает несколько воркеров.',
+                id='api.W001',
+            ))
+    return errors
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# Короткое время жизни - страховка от изменений в обход сигналов (QuerySet.update)
+DEFAULT_TIMEOUT = 60 * 5
+
+
+def _cache():
+    return caches[getattr(settings, 'FAVORITES_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'FAVORITES_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def favorites_owner(user=None, session_id=None):
+    """
+    Условие выборки избранного владельца: {'user_id': ...} или {'session_id': ...}.
+    """
+    if user is not None:
+        return {'user_id': user.pk}
+    return {'session_id': session_id}
+
+
+def _key(owner):
+    if owner.get('user_id') is not None:
+        return f'favorites:user:{owner["user_id"]}'
+    return f'favorites:session:{owner["session_id"]}'
+
+
+def _load(owner):
+    from api.models import Favorite
+
+    rows = Favorite.objects.filter(**owner).order_by('pk').values_list('sneaker_id', 'pk', 'added_at')
+    return {sneaker_id: (pk, added_at) for sneaker_id, pk, added_at in rows}
+
+
+def get_favorites(owner):
+    """
+    Избранное владельца из кэша: {sneaker_id: (id записи, added_at)} в порядке добавления.
+    При промахе загружается одним запросом.
+    """
+    cache = _cache()
+    key = _key(owner)
+    favorites = cache.get(key)
+    if favorites is None:
+        favorites = _load(owner)
+        cache.set(key, favorites, _timeout())
+    return favorites
+
+
+def refresh_favorites(owner):
+    """
+    Перечитывает избранное владельца в кэш после фиксации транзакции.
+
+    Набор читается из базы целиком, а не правится на месте: параллельные
+    изменения не теряются, последний писатель видит их все.
+    """
+    def refresh():
+        _cache().set(_key(owner), _load(owner), _timeout())
+    transaction.on_commit(refresh)
+
+
+def forget_favorites(*owners):
+    """
+    Удаляет наборы владельцев из кэша после фиксации транзакции.
+    """
+    keys = [_key(owner) for owner in owners]
+    if keys:
+        transaction.on_commit(lambda: _cache().delete_many(keys))
+
@@ -0,0 +1,137 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+
+from api.models import Sneaker
+from api.serializers.mixins import ImageUrlResolver
+
+# Поля выгрузки каталога в порядке колонок CSV
+FEED_FIELDS = [
+    'id', 'title', 'slug', 'price', 'description', 'available', 'availability',
+    'image_url', 'created_at', 'updated_at',
+]
+
+# Значения колонки availability в принятом у маркетплейсов виде
+AVAILABILITY = {True: 'in stock', False: 'out of stock'}
+
+FEED_FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# Сколько строк склеивается в один отдаваемый кусок ответа
+ROWS_PER_CHUNK = 500
+
+
+def parse_updated_since(value):
+    """
+    Разбирает дату или дату-время для инкрементальной выгрузки.
+    Возвращает aware datetime или None, если значение некорректно.
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        moment = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def feed_queryset(updated_since=None):
+    """
+    Все кроссовки каталога. Отсутствующие не отбрасываются, а помечаются
+    availability=out of stock: инкрементальная выгрузка должна сообщать,
+    что товар закончился.
+    """
+    queryset = Sneaker.objects.all()
+    if updated_since is not None:
+        queryset = queryset.filter(updated_at__gt=updated_since).order_by('updated_at', 'id')
+    else:
+        queryset = queryset.order_by('id')
+    return queryset
+
+
+def feed_rows(queryset, request=None, chunk_size=2000):
+    """
+    Потоково отдает строки выгрузки как словари с уже отформатированными значениями.
+    """
+    resolver = ImageUrlResolver(request)
+    price_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+    datetime_field = serializers.DateTimeField()
+
+    rows = queryset.values(
+        'id', 'title', 'slug', 'price', 'description', 'available',
+        'image', 'image_url', 'created_at', 'updated_at',
+    ).iterator(chunk_size=chunk_size)
+
+    for row in rows:
+        yield {
+            'id': row['id'],
+            'title': row['title'],
+            'slug': row['slug'],
+            'price': price_field.to_representation(row['price']),
+            'description': row['description'],
+            'available': row['available'],
+            'availability': AVAILABILITY[row['available']],
+            'image_url': resolver.image_url(row['image'], row['image_url']),
+            'created_at': datetime_field.to_representation(row['created_at']),
+            'updated_at': datetime_field.to_representation(row['updated_at']),
+        }
+
+
+def ndjson_chunks(rows):
+    buffer = []
+    for row in rows:
+        buffer.append(json.dumps(row, ensure_ascii=False, separators=(',', ':')))
+        if len(buffer) >= ROWS_PER_CHUNK:
+            yield ('\n'.join(buffer) + '\n').encode('utf-8')
+            buffer = []
+    if buffer:
+        yield ('\n'.join(buffer) + '\n').encode('utf-8')
+
+
+def csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FEED_FIELDS)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Сжимает поток кусков в gzip, не накапливая его в памяти.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def render_feed(queryset, fmt, request=None, compress=False, chunk_size=2000):
+    """
+    Итератор байтов выгрузки в формате ndjson или csv.
+    """
+    rows = feed_rows(queryset, request=request, chunk_size=chunk_size)
+    chunks = csv_chunks(rows) if fmt == 'csv' else ndjson_chunks(rows)
+    if compress:
+        chunks = gzip_chunks(chunks)
+    return chunks
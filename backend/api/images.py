@@ -0,0 +1,207 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Каталог производных изображений внутри MEDIA_ROOT
+DERIVATIVES_DIR = os.path.join('sneakers', 'derivatives')
+
+DEFAULT_WIDTHS = (320, 640, 960)
+DEFAULT_FORMATS = ('avif', 'webp')
+
+# Форматы без прозрачности: для них альфа-канал накладывается на белый фон
+OPAQUE_FORMATS = {'jpeg'}
+
+# Параметры кодирования для каждого формата
+FORMAT_OPTIONS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'avif': {'format': 'AVIF', 'quality': 60},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+
+def get_widths():
+    return tuple(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', DEFAULT_WIDTHS))
+
+
+def get_formats():
+    """
+    Форматы из настроек, которые умеет кодировать установленный Pillow.
+    """
+    from PIL import Image
+
+    Image.init()
+    formats = getattr(settings, 'IMAGE_DERIVATIVE_FORMATS', DEFAULT_FORMATS)
+    return tuple(fmt for fmt in formats if FORMAT_OPTIONS[fmt]['format'] in Image.SAVE)
+
+
+def derivative_name(source_name, width, fmt):
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    return os.path.join(DERIVATIVES_DIR, f'{stem}-{width}w.{fmt}').replace(os.sep, '/')
+
+
+def render_derivatives(source_name, media_root, widths, formats):
+    """
+    Создает уменьшенные копии изображения во всех форматах.
+
+    Выполняется в отдельном процессе, поэтому не использует Django:
+    работает только с путями файловой системы. Возвращает словарь
+    {'source': имя исходника, формат: {ширина: имя файла}}.
+    """
+    from PIL import Image, ImageOps
+
+    variants = {'source': source_name}
+    with Image.open(os.path.join(media_root, source_name)) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            # LA, PA и палитра с прозрачностью сохраняют альфа-канал
+            has_alpha = 'A' in original.getbands() or 'transparency' in original.info
+            original = original.convert('RGBA' if has_alpha else 'RGB')
+
+        # Не увеличиваем изображение: ширины больше исходной пропускаем,
+        # но хотя бы один вариант (в исходной ширине) создаем всегда
+        targets = sorted({min(width, original.width) for width in widths})
+
+        os.makedirs(os.path.join(media_root, DERIVATIVES_DIR), exist_ok=True)
+        for width in targets:
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS) if width != original.width else original
+            for fmt in formats:
+                name = derivative_name(source_name, width, fmt)
+                path = os.path.join(media_root, name)
+                image = resized
+                if fmt in OPAQUE_FORMATS and image.mode == 'RGBA':
+                    image = Image.new('RGB', image.size, (255, 255, 255))
+                    image.paste(resized, mask=resized.getchannel('A'))
+                # Одинаковые исходники (хранилище по хэшу) могут обрабатываться параллельно
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                image.save(tmp_path, **FORMAT_OPTIONS[fmt])
+                os.replace(tmp_path, path)
+                variants.setdefault(fmt, {})[str(width)] = name
+    return variants
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Пул процессов для обработки изображений (создается при первом обращении).
+    """
+    global _executor
+    with _executor_lock:
+        # Если рабочий процесс упал, пул непригоден - создаем новый
+        if _executor is None or getattr(_executor, '_broken', False):
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def submit_derivatives(source_name):
+    """
+    Ставит изображение в очередь на обработку. Возвращает Future.
+    """
+    return get_executor().submit(
+        render_derivatives, source_name, str(settings.MEDIA_ROOT), get_widths(), get_formats()
+    )
+
+
+def save_variants(sneaker_id, variants):
+    """
+    Записывает готовые варианты, если изображение за это время не сменилось.
+    """
+    from api.models import Sneaker
+
+    return Sneaker.objects.filter(pk=sneaker_id, image=variants['source']).update(image_variants=variants)
+
+
+_jobs = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _writer_loop():
+    """
+    Отправляет изображения в пул и записывает готовые варианты в базу.
+
+    Запись идет из этого потока, а не из колбэка пула: у служебного потока
+    пула свое соединение с базой, которое никто не закрывает, а исключения
+    в колбэках теряются. Поток завершается, когда очередь пуста и все
+    задания записаны, и закрывает свои соединения.
+    """
+    global _writer
+    pending = {}
+    try:
+        while True:
+            try:
+                while True:
+                    sneaker_id, source_name = _jobs.get(timeout=0 if pending else 1)
+                    try:
+                        pending[submit_derivatives(source_name)] = sneaker_id
+                    except Exception:
+                        logger.exception('Не удалось поставить в очередь изображение кроссовок %s', sneaker_id)
+            except queue.Empty:
+                pass
+            if not pending:
+                with _writer_lock:
+                    if _jobs.empty():
+                        _writer = None
+                        return
+                continue
+
+            done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                sneaker_id = pending.pop(future)
+                try:
+                    save_variants(sneaker_id, future.result())
+                except Exception:
+                    logger.exception('Не удалось обработать изображение кроссовок %s', sneaker_id)
+    finally:
+        # Поток упал - следующее задание запустит новый
+        with _writer_lock:
+            if _writer is threading.current_thread():
+                _writer = None
+        connections.close_all()
+
+
+def schedule_derivatives(sneaker):
+    """
+    Запускает обработку изображения после фиксации транзакции,
+    вне потока обработки запроса.
+    """
+    sneaker_id, source_name = sneaker.pk, sneaker.image.name
+
+    def submit():
+        global _writer
+        with _writer_lock:
+            _jobs.put((sneaker_id, source_name))
+            if _writer is None:
+                _writer = threading.Thread(target=_writer_loop, name='image-derivatives', daemon=True)
+                _writer.start()
+
+    transaction.on_commit(submit)
+
+
+def needs_derivatives(sneaker):
+    return bool(sneaker.image) and (sneaker.image_variants or {}).get('source') != sneaker.image.name
+
+
+def variant_names(variants):
+    """
+    Имена всех файлов производных изображений.
+    """
+    names = []
+    for fmt, by_width in (variants or {}).items():
+        if fmt != 'source':
+            names.extend(by_width.values())
+    return names
@@ -0,0 +1,75 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from api.renderers import FastJSONRenderer, orjson
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость JSONRenderer и FastJSONRenderer на больших ответах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Количество элементов в ответе')
+        parser.add_argument('--repeat', type=int, default=5, help='Количество повторов (берется лучший)')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson не установлен: FastJSONRenderer использует json'))
+
+        rows = options['rows']
+        now = timezone.now()
+        payloads = {
+            # Страница каталога: цены уже строки (COERCE_DECIMAL_TO_STRING)
+            'catalog': {
+                'count': rows, 'next': None, 'previous': None,
+                'results': [
+                    {
+                        'id': i, 'title': f'Кроссовки {i}', 'price': f'{9990 + i}.00',
+                        'image_url': f'http://localhost:8000/media/sneakers/sneaker-{i}.jpg',
+                        'imageUrl': f'http://localhost:8000/media/sneakers/sneaker-{i}.jpg',
+                        'available': bool(i % 3), 'srcset': {},
+                    }
+                    for i in range(rows)
+                ],
+            },
+            # Заказы с "сырыми" Decimal и datetime, которые кодирует JSONEncoder DRF
+            'orders': [
+                {
+                    'id': i, 'status': 'pending', 'total_price': Decimal('19980.00') + i,
+                    'created_at': now - timedelta(minutes=i, microseconds=i),
+                    'items': [
+                        {'sneaker': j, 'quantity': 2, 'price': Decimal('9990.00') + j}
+                        for j in range(3)
+                    ],
+                }
+                for i in range(rows // 3)
+            ],
+        }
+
+        for name, data in payloads.items():
+            baseline = JSONRenderer().render(data)
+            if FastJSONRenderer().render(data) != baseline:
+                self.stderr.write(self.style.ERROR(f'{name}: результаты рендереров различаются'))
+                continue
+
+            results = {}
+            for renderer_class in (JSONRenderer, FastJSONRenderer):
+                best = min(self._measure(renderer_class, data) for _ in range(options['repeat']))
+                results[renderer_class.__name__] = best
+                self.stdout.write(
+                    f'{name:>8} {renderer_class.__name__:>17}: {best * 1000:8.1f} мс, '
+                    f'{len(baseline) / 1024 / 1024:.1f} МБ'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'{name:>8} ускорение: x{results["JSONRenderer"] / results["FastJSONRenderer"]:.1f}'
+            ))
+
+    @staticmethod
+    def _measure(renderer_class, data):
+        started = time.perf_counter()
+        renderer_class().render(data)
+        return time.perf_counter() - started
@@ -0,0 +1,74 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from api.models import Sneaker
+from api.serializers.sneaker_serializers import SneakerListSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает скорость сериализации страницы каталога: '
+        'построчный SneakerListSerializer против быстрого пути по values()'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Количество строк на странице')
+        parser.add_argument('--repeat', type=int, default=5, help='Количество повторов (берется лучший)')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        request = Request(RequestFactory().get('/api/sneakers/', HTTP_HOST='localhost:8000'))
+        context = {'request': request}
+
+        # Данные в памяти: измеряется только сериализация, без базы
+        instances = []
+        values_rows = []
+        for i in range(rows):
+            image = f'sneakers/sneaker-{i}.jpg' if i % 4 else ''
+            image_url = None if i % 4 else f'https://cdn.example.com/{i}.jpg'
+            image_variants = {
+                'source': image,
+                'webp': {'320': f'sneakers/variants/{i}-320.webp', '640': f'sneakers/variants/{i}-640.webp'},
+            } if image else {}
+            sneaker = Sneaker(
+                id=i + 1, title=f'Кроссовки {i}', price=Decimal('9990.00') + i,
+                image=image, image_url=image_url, image_variants=image_variants, available=True,
+            )
+            instances.append(sneaker)
+            # Те же ключи, что дает values() в SneakerViewSet.build_list_data
+            values_rows.append({
+                'id': sneaker.id, 'title': sneaker.title, 'price': sneaker.price,
+                'image': image, 'image_url': image_url, 'image_variants': image_variants,
+                'available': True, 'created_at': None,
+            })
+
+        def per_row():
+            # Классический путь DRF: отдельный вызов сериализатора на каждую модель
+            child = SneakerListSerializer(context=context)
+            return [child.to_representation(obj) for obj in instances]
+
+        def fast_path():
+            return SneakerListSerializer(values_rows, many=True, context=context).data
+
+        if per_row() != list(fast_path()):
+            raise CommandError('Результаты двух путей различаются')
+
+        results = {}
+        for name, func in (('per-row', per_row), ('fast-path', fast_path)):
+            best = min(self._measure(func) for _ in range(options['repeat']))
+            results[name] = rows / best
+            self.stdout.write(f'{name:>10}: {best * 1000:8.1f} мс, {results[name]:12,.0f} строк/с')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение: x{results["fast-path"] / results["per-row"]:.1f}'
+        ))
+
+    @staticmethod
+    def _measure(func):
+        started = time.perf_counter()
+        func()
+        return time.perf_counter() - started
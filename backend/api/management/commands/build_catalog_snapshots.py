@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.snapshots import build_snapshots, get_snapshot_dir, rebuild_once
+
+
+class Command(BaseCommand):
+    help = 'Строит сжатые снимки первых страниц каталога для отдачи с диска'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--watch', action='store_true',
+            help='Не завершаться: пересобирать снимки при каждом изменении каталога',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=2,
+            help='Как часто (в секундах) проверять поколение каталога в режиме --watch',
+        )
+
+    def handle(self, *args, **options):
+        if not options['watch']:
+            self.report(build_snapshots())
+            return
+
+        if options['interval'] <= 0:
+            raise CommandError('--interval должен быть больше нуля')
+        # Единственный процесс, который пересобирает снимки для всех воркеров
+        try:
+            while True:
+                manifest = rebuild_once()
+                if manifest is not None:
+                    self.report(manifest)
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def report(self, manifest):
+        self.stdout.write(self.style.SUCCESS(
+            f"Снимков: {len(manifest['entries'])}, поколение {manifest['generation']}, "
+            f"каталог: {get_snapshot_dir()}"
+        ))
@@ -0,0 +1,41 @@
+import time
+from concurrent.futures import as_completed
+
+from django.core.management.base import BaseCommand
+
+from api.images import needs_derivatives, save_variants, submit_derivatives
+from api.models import Sneaker
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии (WebP/AVIF) для уже загруженных изображений кроссовок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать варианты даже для уже обработанных изображений',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        queryset = Sneaker.objects.exclude(image='').exclude(image__isnull=True).only('id', 'image', 'image_variants')
+
+        futures = {}
+        for sneaker in queryset.iterator(chunk_size=500):
+            if options['force'] or needs_derivatives(sneaker):
+                futures[submit_derivatives(sneaker.image.name)] = sneaker.pk
+
+        done = failed = 0
+        for future in as_completed(futures):
+            sneaker_id = futures[future]
+            try:
+                save_variants(sneaker_id, future.result())
+                done += 1
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f'Кроссовки {sneaker_id}: {exc}')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {done}, ошибок: {failed}, время: {elapsed:.1f} с'
+        ))
@@ -0,0 +1,41 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+
+from api.models import Cart
+
+
+class Command(BaseCommand):
+    help = 'Сверяет хранимые итоги корзин с их позициями и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать корзины с расхождениями')
+        parser.add_argument('--batch-size', type=int, default=500, help='Сколько корзин исправлять одним запросом')
+
+    def handle(self, *args, **options):
+        drifted = Cart.objects.with_totals().annotate(
+            expected_count=Coalesce('annotated_items_count', 0),
+            expected_price=Coalesce('annotated_total_price', Decimal('0.00')),
+        ).filter(
+            ~Q(items_count=F('expected_count')) | ~Q(total_price=F('expected_price'))
+        ).values_list('pk', 'items_count', 'expected_count', 'total_price', 'expected_price')
+
+        # Список собирается целиком: исправления не должны менять выборку во время чтения
+        found = []
+        for pk, count, expected_count, price, expected_price in drifted.iterator(chunk_size=options['batch_size']):
+            found.append(pk)
+            if options['verbosity'] > 1 or options['dry_run']:
+                self.stdout.write(
+                    f'Корзина {pk}: товаров {count} вместо {expected_count}, сумма {price} вместо {expected_price}'
+                )
+
+        if not options['dry_run']:
+            for start in range(0, len(found), options['batch_size']):
+                Cart.objects.filter(pk__in=found[start:start + options['batch_size']]).refresh_totals()
+
+        if options['dry_run']:
+            self.stdout.write(f'Корзин с расхождениями: {len(found)}')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Исправлено корзин: {len(found)}'))
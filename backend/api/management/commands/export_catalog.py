@@ -0,0 +1,49 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.feed import FEED_FORMATS, feed_queryset, parse_updated_since, render_feed
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка каталога кроссовок в NDJSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(FEED_FORMATS), default='ndjson', help='Формат выгрузки')
+        parser.add_argument('--output', '-o', default='-', help='Файл для записи или "-" для stdout')
+        parser.add_argument('--gzip', action='store_true', help='Сжать выгрузку gzip')
+        parser.add_argument(
+            '--updated-since',
+            help='Выгрузить только товары, измененные после даты (ISO 8601)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Размер порции чтения из базы')
+
+    def handle(self, *args, **options):
+        updated_since = None
+        if options['updated_since']:
+            updated_since = parse_updated_since(options['updated_since'])
+            if updated_since is None:
+                raise CommandError('Некорректное значение --updated-since')
+
+        started = time.perf_counter()
+        chunks = render_feed(
+            feed_queryset(updated_since), options['format'],
+            compress=options['gzip'], chunk_size=options['chunk_size'],
+        )
+
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        written = 0
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        if options['output'] != '-':
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Выгружено {written / 1024 / 1024:.1f} МБ за {elapsed:.1f} с'
+            ))
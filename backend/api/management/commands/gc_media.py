@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from api.media_gc import DEFAULT_PREFIX, delete_orphans, find_orphans
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из хранилища изображения кроссовок, на которые больше нет ссылок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет удалено')
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пакета при чтении и удалении')
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Не трогать файлы моложе указанного числа секунд',
+        )
+        parser.add_argument('--prefix', default=DEFAULT_PREFIX, help='Каталог хранилища для проверки')
+
+    def handle(self, *args, **options):
+        orphans = find_orphans(
+            default_storage, prefix=options['prefix'],
+            min_age=timedelta(seconds=options['min_age']), batch_size=options['batch_size'],
+        )
+
+        if options['dry_run']:
+            count = total = 0
+            for name, size in orphans:
+                count += 1
+                total += size
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{name} ({size} байт)')
+            self.stdout.write(f'Будет удалено файлов: {count}, освободится {self._format_size(total)}')
+            return
+
+        deleted, reclaimed = delete_orphans(default_storage, orphans, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено файлов: {deleted}, освобождено {self._format_size(reclaimed)}'
+        ))
+
+    @staticmethod
+    def _format_size(size):
+        for unit in ('байт', 'КБ', 'МБ'):
+            if size < 1024:
+                return f'{size:.0f} {unit}' if unit == 'байт' else f'{size:.1f} {unit}'
+            size /= 1024
+        return f'{size:.1f} ГБ'
@@ -0,0 +1,163 @@
+import csv
+import json
+import os
+import sys
+import time
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import slugify
+
+from api.images import schedule_derivatives
+from api.models import Sneaker
+from api.search import get_search_backend
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да', '+'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковый импорт каталога кроссовок из CSV или JSONL. '
+        'Поля: title, price, description, available, slug, image_url, image (путь к файлу)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу или "-" для чтения из stdin')
+        parser.add_argument(
+            '--format', choices=['csv', 'jsonl'],
+            help='Формат входных данных (по умолчанию определяется по расширению)',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пакета bulk_create')
+        parser.add_argument(
+            '--images-dir', default='.',
+            help='Каталог, относительно которого ищутся файлы из колонки image',
+        )
+        parser.add_argument('--delimiter', default=',', help='Разделитель колонок CSV')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or self._detect_format(options['path'])
+        self.images_dir = options['images_dir']
+        self.image_field = Sneaker._meta.get_field('image')
+        self.search_backend = get_search_backend()
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+
+        started = time.perf_counter()
+        # Все существующие slug загружаются один раз: уникальность проверяется в памяти
+        self.taken_slugs = set(Sneaker.objects.values_list('slug', flat=True).iterator(chunk_size=10000))
+
+        imported = skipped = 0
+        batch = []
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8', newline='')
+        try:
+            rows = self._read_csv(stream, options['delimiter']) if fmt == 'csv' else self._read_jsonl(stream)
+            for line_no, row in rows:
+                try:
+                    if fmt == 'jsonl':
+                        # Разбор внутри try: битая строка пропускается, как и строка CSV
+                        row = json.loads(row)
+                    batch.append(self._build_sneaker(row))
+                except (KeyError, TypeError, ValueError, InvalidOperation, OSError) as exc:
+                    skipped += 1
+                    self.stderr.write(f'Строка {line_no} пропущена: {exc!r}')
+                    continue
+                if len(batch) >= batch_size:
+                    imported += self._flush(batch)
+                    batch = []
+                    if options['verbosity'] > 1:
+                        self._report(imported, started)
+            if batch:
+                imported += self._flush(batch)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.perf_counter() - started
+        rate = imported / elapsed * 60 if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано: {imported}, пропущено: {skipped}, '
+            f'время: {elapsed:.1f} с ({rate:,.0f} строк/мин)'
+        ))
+
+    @staticmethod
+    def _detect_format(path):
+        if path.endswith('.csv'):
+            return 'csv'
+        if path.endswith(('.jsonl', '.ndjson')):
+            return 'jsonl'
+        raise CommandError('Не удалось определить формат файла, укажите --format')
+
+    @staticmethod
+    def _read_csv(stream, delimiter):
+        reader = csv.DictReader(stream, delimiter=delimiter)
+        for line_no, row in enumerate(reader, start=2):
+            yield line_no, row
+
+    @staticmethod
+    def _read_jsonl(stream):
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if line:
+                yield line_no, line
+
+    def _allocate_slug(self, title, slug=None):
+        """
+        Та же схема, что и в Sneaker.save(), но без запроса к базе на каждую строку.
+        """
+        base = slugify(slug or title)
+        slug = base
+        while not slug or slug in self.taken_slugs:
+            slug = f"{base}-{uuid.uuid4().hex[:6]}"
+        self.taken_slugs.add(slug)
+        return slug
+
+    def _build_sneaker(self, row):
+        title = (row['title'] or '').strip()
+        if not title:
+            raise ValueError('пустое название')
+
+        available = row.get('available', True)
+        if isinstance(available, str):
+            available = available.strip().lower() in TRUE_VALUES if available.strip() else True
+
+        sneaker = Sneaker(
+            title=title,
+            price=Decimal(str(row['price']).strip()),
+            description=row.get('description') or None,
+            image_url=row.get('image_url') or None,
+            available=bool(available),
+        )
+        sneaker.slug = self._allocate_slug(title, row.get('slug'))
+
+        image = row.get('image')
+        if image:
+            self._attach_image(sneaker, image)
+        return sneaker
+
+    def _attach_image(self, sneaker, image):
+        path = os.path.join(self.images_dir, image)
+        with open(path, 'rb') as fh:
+            name = self.image_field.generate_filename(sneaker, os.path.basename(path))
+            name = self.image_field.storage.save(name, File(fh), max_length=self.image_field.max_length)
+        sneaker.image = name
+        # Как и в Sneaker.save(): если изображение загружено, сохраняем его URL
+        if not sneaker.image_url:
+            sneaker.image_url = sneaker.image.url
+
+    def _flush(self, batch):
+        with transaction.atomic():
+            created = Sneaker.objects.bulk_create(batch)
+            # bulk_create не вызывает save() и сигналы - синхронизируем индекс и изображения сами
+            self.search_backend.index_many(created)
+            for sneaker in created:
+                if sneaker.image:
+                    schedule_derivatives(sneaker)
+        return len(created)
+
+    def _report(self, imported, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{imported} строк, {imported / elapsed:,.0f} строк/с')
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.anonymous_purge import expired_querysets, purge_queryset
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет корзины, их товары и избранное анонимных посетителей с истекшей сессией. '
+        'Сами сессии удаляет стандартная команда clearsessions'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, что будет удалено')
+        parser.add_argument('--batch-size', type=int, default=500, help='Сколько строк удалять в одной транзакции')
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Пауза между пакетами в секундах, чтобы пропустить другие записи в базу',
+        )
+
+    def handle(self, *args, **options):
+        querysets = expired_querysets(now=timezone.now())
+
+        if options['dry_run']:
+            for queryset in querysets:
+                self.stdout.write(f'{queryset.model._meta.verbose_name_plural}: {queryset.count()}')
+            return
+
+        started = time.monotonic()
+        total = 0
+        for queryset in querysets:
+            removed = purge_queryset(queryset, batch_size=options['batch_size'], pause=options['pause'])
+            for label, count in sorted(removed.items()):
+                self.stdout.write(f'{label}: {count}')
+                total += count
+        elapsed = time.monotonic() - started
+
+        rate = total / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено строк: {total} за {elapsed:.2f} с ({rate:.0f} строк/с)'
+        ))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import Sneaker
+from api.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс каталога кроссовок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Количество записей, индексируемых за один запрос',
+        )
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        started = time.perf_counter()
+        total = backend.rebuild(Sneaker.objects.all(), batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{backend.__class__.__name__}: проиндексировано {total} записей за {elapsed:.2f} с'
+        ))
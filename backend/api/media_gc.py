@@ -0,0 +1,119 @@
+import posixpath
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from api.images import DERIVATIVES_DIR, variant_names
+
+# Каталог загрузок кроссовок внутри хранилища (см. sneaker_image_path)
+DEFAULT_PREFIX = 'sneakers'
+
+# Каталог уменьшенных копий в виде имен хранилища
+DERIVATIVES_PREFIX = DERIVATIVES_DIR.replace('\\', '/') + '/'
+
+
+def walk_storage(storage, path):
+    """
+    Рекурсивно перечисляет имена файлов хранилища внутри каталога.
+    """
+    try:
+        directories, files = storage.listdir(path)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield posixpath.join(path, name)
+    for directory in directories:
+        yield from walk_storage(storage, posixpath.join(path, directory))
+
+
+def referenced_in(names):
+    """
+    Те из имен файлов, на которые ссылаются кроссовки: как изображение
+    или как уменьшенная копия из image_variants.
+
+    Проверяются только переданные имена, поэтому память не зависит
+    от размера каталога.
+    """
+    from api.models import Sneaker
+
+    names = set(names)
+    found = set(Sneaker.objects.filter(image__in=names).order_by().values_list('image', flat=True))
+
+    # Копии ищутся по тексту JSON, совпадение уточняется по самому словарю
+    derivatives = [name for name in names - found if name.startswith(DERIVATIVES_PREFIX)]
+    if derivatives:
+        condition = Q()
+        for name in derivatives:
+            condition |= Q(image_variants__icontains=name)
+        rows = Sneaker.objects.filter(condition).order_by().values_list('image_variants', flat=True).iterator()
+        for variants in rows:
+            found.update(names.intersection(variant_names(variants)))
+    return found
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def find_orphans(storage, prefix=DEFAULT_PREFIX, min_age=timedelta(hours=1), batch_size=500):
+    """
+    Файлы хранилища без ссылок из базы, не изменявшиеся дольше min_age.
+
+    Имена из хранилища сверяются с базой пакетами по batch_size.
+    Свежие файлы пропускаются: загрузка сохраняется в хранилище раньше,
+    чем фиксируется запись в базе, а уменьшенные копии - раньше,
+    чем записываются в image_variants.
+    Возвращает пары (имя, размер).
+    """
+    threshold = timezone.now() - min_age
+    for chunk in _chunks(walk_storage(storage, prefix), batch_size):
+        referenced = referenced_in(chunk)
+        for name in chunk:
+            if name in referenced:
+                continue
+            try:
+                if storage.get_modified_time(name) > threshold:
+                    continue
+                size = storage.size(name)
+            except FileNotFoundError:
+                continue
+            yield name, size
+
+
+def delete_orphans(storage, orphans, batch_size=500):
+    """
+    Удаляет файлы пакетами, перед каждым пакетом перепроверяя по базе,
+    что на изображения так и не появилось ссылок. Возвращает (файлов, байт).
+    """
+    from api.models import Sneaker
+
+    deleted = reclaimed = 0
+    batch = []
+
+    def flush():
+        nonlocal deleted, reclaimed
+        names = [name for name, _ in batch]
+        still_used = set(Sneaker.objects.filter(image__in=names).values_list('image', flat=True))
+        for name, size in batch:
+            if name in still_used:
+                continue
+            storage.delete(name)
+            deleted += 1
+            reclaimed += size
+        batch.clear()
+
+    for orphan in orphans:
+        batch.append(orphan)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return deleted, reclaimed
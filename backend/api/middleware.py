@@ -0,0 +1,126 @@
+import os
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from api.anonymous_store import drop_legacy_session, get_anonymous_store
+from api.snapshots import get_snapshot_dir, get_snapshot_path, manifest, normalize_query
+
+
+def accepted_encodings(header):
+    """
+    Кодировки из заголовка Accept-Encoding, кроме явно запрещенных (q=0).
+    """
+    encodings = set()
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        params = params.replace(' ', '')
+        if name and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            encodings.add(name.lower())
+    return encodings
+
+
+class CatalogSnapshotMiddleware:
+    """
+    Отдает первые страницы каталога из заранее построенных сжатых снимков
+    (см. api.snapshots) без обращения к ORM и сериализаторам.
+
+    Если подходящего актуального снимка нет, запрос обрабатывается как обычно.
+    Клиент с актуальным If-None-Match получает 304 без тела.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_snapshot_response(request)
+        if response is None:
+            response = self.get_response(request)
+        return response
+
+    def get_snapshot_response(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        # Остальные пути не должны читать поколение каталога из общего кэша
+        if request.path_info != get_snapshot_path():
+            return None
+        # Браузер, открывший API напрямую, должен получить HTML-интерфейс DRF
+        if 'text/html' in request.headers.get('Accept', ''):
+            return None
+
+        data = manifest.current()
+        if data is None or request.path_info != data['path']:
+            return None
+        entry = data['entries'].get(normalize_query(request.GET))
+        if entry is None or request.build_absolute_uri('/') != data['base_url']:
+            return None
+
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        if_none_match = self.get_if_none_match(request)
+        for encoding in ('br', 'gzip', 'identity'):
+            name = entry['files'].get(encoding)
+            if name is None or (encoding != 'identity' and encoding not in accepted):
+                continue
+            etag = f'"{entry["etag"]}"' if encoding == 'identity' else f'"{entry["etag"]}-{encoding}"'
+            if '*' in if_none_match or etag in if_none_match:
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                response['Vary'] = 'Accept, Accept-Encoding'
+                return response
+            try:
+                with open(os.path.join(get_snapshot_dir(), name), 'rb') as fh:
+                    body = fh.read()
+            except FileNotFoundError:
+                # Снимок удален параллельной пересборкой
+                return None
+            # Обычный ответ, а не FileResponse: имя файла снимка не попадает в Content-Disposition
+            response = HttpResponse(body, content_type='application/json')
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+            response['ETag'] = etag
+            response['Vary'] = 'Accept, Accept-Encoding'
+            return response
+        return None
+
+    def get_if_none_match(self, request):
+        """
+        ETag из If-None-Match; слабые (W/) сравниваются как сильные.
+        """
+        header = request.headers.get('If-None-Match')
+        if not header:
+            return set()
+        return {etag.removeprefix('W/') for etag in parse_etags(header)}
+
+
+class AnonymousStoreMiddleware:
+    """
+    Сохраняет измененные корзину и избранное анонимного посетителя
+    (см. api.anonymous_store) или очищает их после переноса в базу.
+
+    Состояние записывается только при успешном ответе: изменения,
+    отклоненные проверками (400, 412), не сохраняются. Блокировка,
+    взятая изменяющим запросом, снимается после записи.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        state = getattr(request, '_anonymous_state', None)
+        if state is None:
+            return response
+
+        store = get_anonymous_store()
+        try:
+            if state.materialized:
+                store.clear(request, response)
+            elif state.modified and response.status_code < 400:
+                store.save(request, response, state)
+            else:
+                return response
+            if state.legacy_session:
+                drop_legacy_session(state.legacy_session)
+        finally:
+            store.release(state.lock)
+        return response
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_alter_sneaker_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sneaker',
+            index=models.Index(fields=['-created_at', '-id'], name='sneaker_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sneaker',
+            index=models.Index(fields=['available', '-created_at', '-id'], name='sneaker_avail_created_id_idx'),
+        ),
+    ]
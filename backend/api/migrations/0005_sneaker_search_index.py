@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 06:02
+
+from django.db import migrations
+
+from api.search import FTS_TABLE, create_fts_table
+
+
+def create_search_index(apps, schema_editor):
+    if not create_fts_table(schema_editor):
+        return
+    Sneaker = apps.get_model('api', 'Sneaker')
+    rows = [
+        (pk, title or '', description or '')
+        for pk, title, description in Sneaker.objects.values_list('id', 'title', 'description')
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO {} (rowid, title, description) VALUES (%s, %s, %s)'.format(FTS_TABLE),
+            rows,
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS {}'.format(FTS_TABLE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_sneaker_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
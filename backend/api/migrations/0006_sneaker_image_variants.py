@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 07:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_sneaker_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sneaker',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Варианты изображения'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_sneaker_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sneaker',
+            index=models.Index(fields=['updated_at', 'id'], name='sneaker_updated_id_idx'),
+        ),
+    ]
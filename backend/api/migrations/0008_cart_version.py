@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_sneaker_updated_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Версия'),
+        ),
+    ]
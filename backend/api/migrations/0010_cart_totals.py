@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 11:10
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_cart_totals(apps, schema_editor):
+    Cart = apps.get_model('api', 'Cart')
+    CartItem = apps.get_model('api', 'CartItem')
+    items = CartItem.objects.filter(cart=models.OuterRef('pk')).order_by().values('cart')
+    price_field = models.DecimalField(max_digits=12, decimal_places=2)
+    Cart.objects.update(
+        items_count=Coalesce(models.Subquery(items.annotate(total=models.Sum('quantity')).values('total')), 0),
+        total_price=Coalesce(
+            models.Subquery(items.annotate(
+                total=models.Sum(models.F('quantity') * models.F('sneaker__price'), output_field=price_field)
+            ).values('total')),
+            models.Value(Decimal('0.00')),
+            output_field=price_field,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_cart_session_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество товаров'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Общая сумма'),
+        ),
+        migrations.RunPython(fill_cart_totals, migrations.RunPython.noop),
+    ]
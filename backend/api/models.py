@@ -1,12 +1,18 @@
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.text import slugify
-from django.core.files.storage import default_storage
 import os
 import uuid
+from decimal import Decimal
 from django.conf import settings
+from .search import get_search_backend
+from .cache import bump_catalog_generation
+from .favorites_cache import forget_favorites, refresh_favorites
+from .images import needs_derivatives, schedule_derivatives
 
 # Create your models here.
 
@@ -14,26 +20,94 @@ def sneaker_image_path(instance, filename):
     """Функция для определения пути загрузки изображения"""
     # Получаем расширение файла
     ext = filename.split('.')[-1]
-    # Формируем имя файла на основе slug и случайного UUID для уникальности
-    filename = f"{instance.slug}-{uuid.uuid4()}.{ext}"
+    # Имя файла задает хранилище (хэш содержимого), здесь важны только каталог и расширение
+    filename = f"{instance.slug or 'sneaker'}.{ext}"
     # Возвращаем путь для сохранения
     return os.path.join('sneakers', filename)
 
+# Поля кроссовок, которые попадают в поисковый индекс
+SEARCH_FIELDS = frozenset({'title', 'description'})
+
+
+class SneakerQuerySet(models.QuerySet):
+    """
+    QuerySet кроссовок: массовые изменения в обход save() тоже
+    сбрасывают кэш каталога и обновляют поисковый индекс.
+    """
+    
+    def update(self, **kwargs):
+        reprice = 'price' in kwargs
+        reindex = not SEARCH_FIELDS.isdisjoint(kwargs)
+        if not (reprice or reindex):
+            rows = super().update(**kwargs)
+        else:
+            # Итоги корзин и поисковый индекс обновляются в той же транзакции
+            with transaction.atomic():
+                ids = list(self.values_list('pk', flat=True))
+                rows = super().update(**kwargs)
+                if reprice:
+                    Cart.objects.containing(ids).refresh_totals()
+                if reindex:
+                    get_search_backend().index_many(
+                        self.model._base_manager.filter(pk__in=ids).only('pk', *SEARCH_FIELDS)
+                    )
+        if rows:
+            bump_catalog_generation()
+        return rows
+    
+    def delete(self):
+        with transaction.atomic():
+            ids = list(self.values_list('pk', flat=True))
+            carts = list(Cart.objects.containing(ids).values_list('pk', flat=True))
+            result = super().delete()
+            Cart.objects.filter(pk__in=carts).refresh_totals()
+            get_search_backend().remove_many(ids)
+        bump_catalog_generation()
+        return result
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            bump_catalog_generation()
+        return objs
+    
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        with transaction.atomic():
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            if rows and 'price' in fields:
+                Cart.objects.containing([obj.pk for obj in objs]).refresh_totals()
+            if rows and not SEARCH_FIELDS.isdisjoint(fields):
+                get_search_backend().index_many(objs)
+        if rows:
+            bump_catalog_generation()
+        return rows
+
+
 class Sneaker(models.Model):
     title = models.CharField(max_length=255, verbose_name="Название")
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена")
     image_url = models.URLField(blank=True, null=True, verbose_name="URL изображения")
     image = models.ImageField(upload_to=sneaker_image_path, blank=True, null=True, verbose_name="Изображение")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты изображения")
     description = models.TextField(blank=True, null=True, verbose_name="Описание")
     available = models.BooleanField(default=True, verbose_name="В наличии")
     slug = models.SlugField(max_length=255, blank=True, unique=True, verbose_name="URL-slug")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
     
+    objects = SneakerQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Кроссовки"
         verbose_name_plural = "Кроссовки"
         ordering = ['-created_at']
+        indexes = [
+            # Ключ keyset-пагинации каталога (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='sneaker_created_id_idx'),
+            models.Index(fields=['available', '-created_at', '-id'], name='sneaker_avail_created_id_idx'),
+            # Инкрементальная выгрузка каталога (updated_since)
+            models.Index(fields=['updated_at', 'id'], name='sneaker_updated_id_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -50,19 +124,121 @@ class Sneaker(models.Model):
         if self.image and not self.image_url:
             self.image_url = self.get_image_url()
         
-        super(Sneaker, self).save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        reprice = (
+            self.pk is not None
+            and (update_fields is None or 'price' in update_fields)
+            and self.price != getattr(self, '_loaded_price', None)
+        )
+        with transaction.atomic():
+            super(Sneaker, self).save(*args, **kwargs)
+            if reprice:
+                # Новая цена сразу попадает в итоги корзин с этими кроссовками
+                Cart.objects.containing([self.pk]).refresh_totals()
+        self._loaded_price = self.price
+        
+        # Синхронизируем поисковый индекс
+        get_search_backend().index(self)
     
     def get_image_url(self):
         if self.image:
             return self.image.url
         return self.image_url
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Цена при загрузке: save() пересчитывает корзины, только если она изменилась
+        instance._loaded_price = instance.__dict__.get('price')
+        return instance
+    
     def delete(self, *args, **kwargs):
-        # Удаляем файл изображения при удалении записи
-        if self.image:
-            if os.path.isfile(self.image.path):
-                default_storage.delete(self.image.path)
-        super(Sneaker, self).delete(*args, **kwargs)
+        # Файлы изображений не удаляются в запросе: их могут использовать другие кроссовки,
+        # а осиротевшие файлы собирает команда gc_media
+        pk = self.pk
+        with transaction.atomic():
+            carts = list(Cart.objects.containing([pk]).values_list('pk', flat=True))
+            result = super(Sneaker, self).delete(*args, **kwargs)
+            Cart.objects.filter(pk__in=carts).refresh_totals()
+        get_search_backend().remove(pk)
+        return result
+
+
+def cart_totals_from_items():
+    """
+    Выражения для пересчета итогов корзины по ее позициям в UPDATE.
+    """
+    items = CartItem.objects.filter(cart=models.OuterRef('pk')).order_by().values('cart')
+    price_field = models.DecimalField(max_digits=12, decimal_places=2)
+    return {
+        'items_count': Coalesce(
+            models.Subquery(items.annotate(total=models.Sum('quantity')).values('total')),
+            0,
+        ),
+        'total_price': Coalesce(
+            models.Subquery(items.annotate(
+                total=models.Sum(models.F('quantity') * models.F('sneaker__price'), output_field=price_field)
+            ).values('total')),
+            models.Value(Decimal('0.00')),
+            output_field=price_field,
+        ),
+    }
+
+
+class CartQuerySet(models.QuerySet):
+    """
+    QuerySet корзин: хранимые итоги и их пересчет по позициям.
+    """
+    
+    def with_totals(self):
+        """
+        Добавляет annotated_total_price (сумма по позициям) и
+        annotated_items_count (общее количество товаров), посчитанные
+        по позициям, а не взятые из хранимых полей (см. check_cart_totals).
+        Для пустой корзины оба значения - None.
+        """
+        return self.annotate(
+            annotated_total_price=models.Sum(
+                models.F('items__quantity') * models.F('items__sneaker__price'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+            annotated_items_count=models.Sum('items__quantity'),
+        )
+    
+    def with_items(self):
+        """
+        Загружает позиции корзины вместе с кроссовками одним запросом.
+        """
+        return self.prefetch_related(
+            models.Prefetch('items', queryset=CartItem.objects.select_related('sneaker'))
+        )
+    
+    def containing(self, sneaker_ids):
+        """
+        Корзины, в которых лежит хотя бы один из указанных кроссовок.
+        """
+        return self.filter(pk__in=CartItem.objects.filter(sneaker_id__in=sneaker_ids).values('cart_id'))
+    
+    def refresh_totals(self):
+        """
+        Пересчитывает хранимые итоги корзин одним UPDATE.
+        """
+        return self.update(**cart_totals_from_items())
+    
+    def bump_version(self, expected=None):
+        """
+        Увеличивает версию корзин после изменения их содержимого
+        и тем же запросом пересчитывает их итоги.
+        
+        expected - допустимые текущие версии (If-Match): корзины с другой
+        версией не изменяются. Возвращает количество обновленных корзин.
+        """
+        queryset = self if expected is None else self.filter(version__in=expected)
+        return queryset.update(
+            version=models.F('version') + 1,
+            updated_at=timezone.now(),
+            **cart_totals_from_items(),
+        )
 
 
 class Cart(models.Model):
@@ -70,17 +246,89 @@ class Cart(models.Model):
     session_id = models.CharField(max_length=255, blank=True, null=True, verbose_name="ID сессии")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+    # Растет при каждом изменении содержимого: ETag корзины и проверка If-Match
+    version = models.PositiveBigIntegerField(default=0, editable=False, verbose_name="Версия")
+    # Итоги хранятся в корзине и пересчитываются вместе с изменением позиций (bump_version)
+    items_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество товаров")
+    total_price = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, editable=False, verbose_name="Общая сумма"
+    )
     
     class Meta:
         verbose_name = "Корзина"
         verbose_name_plural = "Корзины"
+        indexes = [
+            # Поиск корзины анонимного посетителя и очистка purge_anonymous
+            models.Index(fields=['session_id'], name='cart_session_idx'),
+        ]
+    
+    objects = CartQuerySet.as_manager()
     
     def __str__(self):
         return f"Корзина {self.user.username if self.user else self.session_id}"
+
+
+class CartItemQuerySet(models.QuerySet):
+    """
+    QuerySet позиций корзины с атомарным добавлением товаров.
+    """
     
-    @property
-    def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+    def upsert(self, cart, quantities, increment=True):
+        """
+        Добавляет товары в корзину одним запросом.
+        
+        quantities - словарь {id кроссовок: количество}. При increment=True
+        количество прибавляется к уже лежащему в корзине, иначе заменяет его.
+        Одновременные добавления из разных вкладок не теряются: прибавление
+        выполняет сама база (INSERT ... ON CONFLICT DO UPDATE).
+        """
+        if not quantities:
+            return
+        self._for_write = True
+        connection = connections[self.db]
+        if connection.vendor in ('sqlite', 'postgresql'):
+            self._upsert_on_conflict(connection, cart, quantities, increment)
+        else:
+            self._upsert_fallback(cart, quantities, increment)
+    
+    def _upsert_on_conflict(self, connection, cart, quantities, increment):
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        table = qn(opts.db_table)
+        cart_col, sneaker_col, quantity_col, added_col = (
+            qn(opts.get_field(name).column) for name in ('cart', 'sneaker', 'quantity', 'added_at')
+        )
+        added_at = opts.get_field('added_at').get_db_prep_value(timezone.now(), connection)
+        
+        rows = [(cart.pk, sneaker_id, quantity, added_at) for sneaker_id, quantity in quantities.items()]
+        if increment:
+            new_quantity = f'{table}.{quantity_col} + excluded.{quantity_col}'
+        else:
+            new_quantity = f'excluded.{quantity_col}'
+        sql = (
+            f'INSERT INTO {table} ({cart_col}, {sneaker_col}, {quantity_col}, {added_col}) '
+            f'VALUES {", ".join(["(%s, %s, %s, %s)"] * len(rows))} '
+            f'ON CONFLICT ({cart_col}, {sneaker_col}) DO UPDATE SET {quantity_col} = {new_quantity}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for row in rows for value in row])
+    
+    def _upsert_fallback(self, cart, quantities, increment):
+        # Для остальных баз: UPDATE с F(), а при отсутствии строки - INSERT
+        with transaction.atomic(using=self.db):
+            for sneaker_id, quantity in quantities.items():
+                new_quantity = models.F('quantity') + quantity if increment else quantity
+                items = self.filter(cart=cart, sneaker_id=sneaker_id)
+                if items.update(quantity=new_quantity):
+                    continue
+                try:
+                    # bulk_create, а не create: CartItem.save сам увеличил бы версию корзины,
+                    # а ее увеличивает вызывающий код - ровно один раз на изменение
+                    with transaction.atomic(using=self.db):
+                        self.bulk_create([self.model(cart=cart, sneaker_id=sneaker_id, quantity=quantity)])
+                except IntegrityError:
+                    # Позицию успели создать параллельно - обновляем ее
+                    items.update(quantity=new_quantity)
 
 
 class CartItem(models.Model):
@@ -94,9 +342,23 @@ class CartItem(models.Model):
         verbose_name_plural = "Товары в корзине"
         unique_together = ['cart', 'sneaker']
     
+    objects = CartItemQuerySet.as_manager()
+    
     def __str__(self):
         return f"{self.sneaker.title} ({self.quantity}) в корзине {self.cart}"
     
+    def save(self, *args, **kwargs):
+        # Изменение одной позиции (админка, перенос корзины) обновляет версию и итоги корзины
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Cart.objects.filter(pk=self.cart_id).bump_version()
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Cart.objects.filter(pk=self.cart_id).bump_version()
+        return result
+    
     @property
     def total_price(self):
         return self.sneaker.price * self.quantity
@@ -115,6 +377,88 @@ class Favorite(models.Model):
     
     def __str__(self):
         return f"{self.sneaker.title} в избранном у {self.user.username if self.user else self.session_id}"
+    
+    @property
+    def owner(self):
+        # Условие выборки избранного того же владельца (ключ кэша набора)
+        if self.user_id:
+            return {'user_id': self.user_id}
+        return {'session_id': self.session_id}
+
+
+
+class OrderQuerySet(models.QuerySet):
+    """
+    QuerySet заказов с оформлением заказа прямо из корзины.
+    """
+    
+    def with_items_count(self):
+        """
+        Добавляет items_count - общее количество товаров в заказе.
+        Считается коррелированным подзапросом только для выбранных строк,
+        без GROUP BY по всем колонкам заказа.
+        """
+        items = OrderItem.objects.filter(order=models.OuterRef('pk')).order_by().values('order')
+        return self.annotate(items_count=Coalesce(
+            models.Subquery(items.annotate(total=models.Sum('quantity')).values('total')),
+            0,
+        ))
+    
+
+    def create_from_cart(self, cart, **fields):
+        """
+        Создает заказ из позиций корзины и очищает ее в одной транзакции.
+        
+        Позиции копируются в OrderItem с текущими ценами одним
+        INSERT ... SELECT, сумма заказа считается по скопированным строкам,
+        поэтому число запросов не зависит от размера корзины.
+        Возвращает None, если копировать нечего (корзина пуста).
+        """
+        self._for_write = True
+        connection = connections[self.db]
+        item_opts = OrderItem._meta
+        cart_item_opts = CartItem._meta
+        qn = connection.ops.quote_name
+        
+        with transaction.atomic(using=self.db):
+            order = self.create(total_price=0, **fields)
+            sql = (
+                'INSERT INTO {order_item} ({order_col}, {sneaker_col}, {price_col}, {quantity_col}) '
+                'SELECT %s, ci.{cart_sneaker_col}, s.{sneaker_price_col}, ci.{cart_quantity_col} '
+                'FROM {cart_item} ci INNER JOIN {sneaker} s ON s.{sneaker_pk_col} = ci.{cart_sneaker_col} '
+                'WHERE ci.{cart_col} = %s'
+            ).format(
+                order_item=qn(item_opts.db_table),
+                order_col=qn(item_opts.get_field('order').column),
+                sneaker_col=qn(item_opts.get_field('sneaker').column),
+                price_col=qn(item_opts.get_field('price').column),
+                quantity_col=qn(item_opts.get_field('quantity').column),
+                cart_item=qn(cart_item_opts.db_table),
+                cart_col=qn(cart_item_opts.get_field('cart').column),
+                cart_sneaker_col=qn(cart_item_opts.get_field('sneaker').column),
+                cart_quantity_col=qn(cart_item_opts.get_field('quantity').column),
+                sneaker=qn(Sneaker._meta.db_table),
+                sneaker_pk_col=qn(Sneaker._meta.pk.column),
+                sneaker_price_col=qn(Sneaker._meta.get_field('price').column),
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [order.pk, cart.pk])
+                copied = cursor.rowcount
+            if not copied:
+                transaction.set_rollback(True, using=self.db)
+                return None
+            
+            items = OrderItem.objects.filter(order=models.OuterRef('pk')).order_by().values('order')
+            total = models.Subquery(items.annotate(
+                total=models.Sum(models.F('price') * models.F('quantity'), output_field=order._meta.get_field('total_price'))
+            ).values('total'))
+            self.filter(pk=order.pk).update(total_price=total)
+            
+            CartItem.objects.filter(cart=cart).delete()
+            Cart.objects.filter(pk=cart.pk).bump_version()
+        
+        order.refresh_from_db(fields=['total_price'])
+        return order
 
 
 class Order(models.Model):
@@ -142,6 +486,12 @@ class Order(models.Model):
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ['-created_at']
+        indexes = [
+            # История заказов пользователя и keyset-пагинация по (created_at, id)
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ]
+    
+    objects = OrderQuerySet.as_manager()
     
     def __str__(self):
         return f"Заказ №{self.id} от {self.created_at.strftime('%d.%m.%Y')}"
@@ -178,6 +528,33 @@ class UserProfile(models.Model):
         return f"Профиль пользователя {self.user.username}"
 
 
+@receiver(post_save, sender=Sneaker)
+@receiver(post_delete, sender=Sneaker)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    # Сохранение в админке (в том числе list_editable) и удаление меняют каталог
+    bump_catalog_generation()
+
+
+@receiver(post_save, sender=Sneaker)
+def build_image_derivatives(sender, instance, raw=False, **kwargs):
+    # Новое или замененное изображение обрабатывается в пуле процессов
+    if not raw and needs_derivatives(instance):
+        schedule_derivatives(instance)
+
+
+@receiver(post_save, sender=Favorite)
+def refresh_favorites_cache(sender, instance, raw=False, **kwargs):
+    # Кэш набора избранного обновляется вместе с записью (см. api.favorites_cache)
+    if not raw:
+        refresh_favorites(instance.owner)
+
+
+@receiver(post_delete, sender=Favorite)
+def forget_favorites_cache(sender, instance, **kwargs):
+    # Удаления через админку, QuerySet.delete и каскад тоже сбрасывают набор
+    forget_favorites(instance.owner)
+
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
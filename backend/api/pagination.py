@@ -0,0 +1,191 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from urllib import parse
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация по стабильному ключу (created_at, id).
+
+    В отличие от PageNumberPagination не выполняет COUNT(*) и OFFSET:
+    каждая страница - это диапазонный запрос по составному индексу,
+    поэтому время ответа не зависит от номера страницы.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    mode_query_value = 'cursor'
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Некорректный курсор'
+
+    @classmethod
+    def is_requested(cls, request):
+        """
+        Курсорный режим включается явно: параметром ?pagination=cursor
+        или наличием курсора в запросе.
+        """
+        params = request.query_params
+        return (
+            params.get(cls.mode_query_param) == cls.mode_query_value
+            or cls.cursor_query_param in params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        if self.cursor is None:
+            reverse = False
+        else:
+            created_at, pk, reverse = self.cursor
+            if reverse:
+                # Идем назад: берем строки "новее" курсора в обратном порядке
+                queryset = queryset.filter(
+                    Q(created_at__gte=created_at),
+                    Q(created_at__gt=created_at) | Q(id__gt=pk),
+                )
+            else:
+                # Условие created_at <= X позволяет использовать диапазонный
+                # поиск по индексу, второе - отсекает уже отданные строки
+                queryset = queryset.filter(
+                    Q(created_at__lte=created_at),
+                    Q(created_at__lt=created_at) | Q(id__lt=pk),
+                )
+
+        if reverse:
+            queryset = queryset.order_by('created_at', 'id')
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_previous = has_more
+            self.has_next = True
+        else:
+            self.has_previous = self.cursor is not None
+            self.has_next = has_more
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # Пустая страница после последнего элемента - возвращаемся к началу
+            return self._build_url(None)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_position(self, item):
+        """
+        Возвращает ключ (created_at, id) строки - модели или словаря из values().
+        """
+        if isinstance(item, dict):
+            return item['created_at'], item['id']
+        return item.created_at, item.pk
+
+    def encode_cursor(self, item, reverse):
+        created_at, pk = self.get_position(item)
+        tokens = {'t': created_at.isoformat(), 'i': pk}
+        if reverse:
+            tokens['r'] = '1'
+        querystring = parse.urlencode(tokens, doseq=True)
+        return self._build_url(b64encode(querystring.encode('ascii')).decode('ascii'))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            created_at = parse_datetime(tokens['t'][0])
+            pk = int(tokens['i'][0])
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+        except (TypeError, ValueError, KeyError, IndexError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk, reverse
+
+    def _build_url(self, encoded):
+        url = remove_query_param(self.base_url, self.cursor_query_param)
+        url = replace_query_param(url, self.mode_query_param, self.mode_query_value)
+        if encoded is None:
+            return url
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+
+class KeysetPaginationMixin:
+    """
+    Примесь для ViewSet: в списке можно явно запросить keyset-пагинацию
+    (?pagination=cursor), иначе используется пагинация по умолчанию из настроек.
+    """
+    keyset_pagination_class = KeysetPagination
+
+    def get_keyset_pagination_error(self):
+        """
+        Причина, по которой курсор по (created_at, id) неприменим
+        к этому списку (например, сортировка по релевантности), или None.
+        """
+        return None
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.action == 'list' and self.keyset_pagination_class.is_requested(self.request):
+                error = self.get_keyset_pagination_error()
+                if error:
+                    raise ValidationError({self.keyset_pagination_class.mode_query_param: error})
+                self._paginator = self.keyset_pagination_class()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
@@ -0,0 +1,78 @@
+import io
+import re
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson - необязательная зависимость
+    orjson = None
+
+# Datetime, date и time orjson передает в default: формат тот же, что у DRF
+# (миллисекунды, "Z" для UTC), ключи-числа приводятся к строкам, как в json
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+# orjson читает целые длиннее 64 бит как float - такие тела разбирает json
+LONG_NUMBER_RE = re.compile(rb'\d{19,}')
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson, если он установлен.
+
+    Вывод побайтно совпадает с JSONRenderer: компактные разделители,
+    UTF-8 без \\u-экранирования, экранированные U+2028/U+2029;
+    Decimal, даты, генераторы и ленивые строки кодируются JSONEncoder DRF.
+    Отступы (браузерный API, ?indent) и все, что orjson не умеет
+    (например, целые больше 64 бит), обрабатываются стандартным рендерером.
+    Единственное отличие: NaN и Infinity orjson записывает как null,
+    тогда как JSONRenderer в строгом режиме на них падает.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if not (self.compact and not self.ensure_ascii):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self._default, option=ORJSON_OPTIONS)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Как и JSONRenderer: эти символы допустимы в JSON, но не в JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+    def _default(self, obj):
+        encoder = getattr(self, '_encoder', None)
+        if encoder is None:
+            encoder = self._encoder = self.encoder_class()
+        return encoder.default(obj)
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser на orjson, если он установлен.
+    Тела, которые orjson не разобрал, и тела с очень длинными числами
+    разбираются стандартным парсером, чтобы ошибки и крайние случаи остались прежними.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read() if stream is not None else b''
+        if LONG_NUMBER_RE.search(body):
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
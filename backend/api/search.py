@@ -0,0 +1,216 @@
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections
+from django.db.models import Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+# Имя виртуальной таблицы полнотекстового индекса (SQLite FTS5)
+FTS_TABLE = 'api_sneaker_fts'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    """
+    Разбивает поисковую строку на слова в нижнем регистре.
+    """
+    return TOKEN_RE.findall(query.lower())
+
+
+class BaseSearchBackend:
+    """
+    Базовый класс поискового движка каталога.
+    """
+
+    def search(self, queryset, query):
+        """
+        Фильтрует queryset по поисковому запросу и сортирует по релевантности.
+        """
+        raise NotImplementedError
+
+    def index(self, sneaker):
+        """
+        Добавляет или обновляет кроссовки в индексе.
+        """
+
+    def index_many(self, sneakers):
+        for sneaker in sneakers:
+            self.index(sneaker)
+
+    def remove(self, pk):
+        """
+        Удаляет кроссовки из индекса.
+        """
+
+    def remove_many(self, pks):
+        for pk in pks:
+            self.remove(pk)
+
+    def rebuild(self, queryset, batch_size=2000):
+        """
+        Полностью перестраивает индекс. Возвращает количество записей.
+        """
+        return 0
+
+
+class PortableSearchBackend(BaseSearchBackend):
+    """
+    Переносимый поиск без отдельного индекса (для любых СУБД).
+
+    Каждое слово запроса должно встречаться в названии или описании,
+    совпадения в названии ценятся выше.
+    """
+
+    def search(self, queryset, query):
+        terms = tokenize(query) or [query.strip().lower()]
+        rank = Value(0)
+        for term in terms:
+            queryset = queryset.filter(Q(title__icontains=term) | Q(description__icontains=term))
+            rank = rank + Case(
+                When(title__icontains=term, then=Value(10)),
+                When(description__icontains=term, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        return queryset.annotate(search_rank=rank).order_by('-search_rank', '-created_at', '-id')
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    Полнотекстовый поиск на SQLite FTS5 по названию и описанию.
+
+    Индекс хранится в отдельной виртуальной таблице, где rowid совпадает
+    с id кроссовок, и обновляется при каждом сохранении/удалении модели.
+    Релевантность считается функцией bm25, название весит больше описания.
+    Совпадения и ранг выбираются подзапросами в том же SQL, поэтому
+    COUNT и LIMIT/OFFSET пагинации работают по всем совпадениям.
+    """
+    title_weight = 10.0
+    description_weight = 1.0
+
+    def __init__(self):
+        self.fallback = PortableSearchBackend()
+
+    @staticmethod
+    def build_match(terms):
+        # Каждое слово экранируем кавычками и ищем по префиксу
+        return ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return self.fallback.search(queryset, query)
+
+        # Таблица FTS5 не описана моделью: совпадения и релевантность
+        # задаются подзапросами к ней по rowid (он совпадает с id кроссовок)
+        opts = queryset.model._meta
+        qn = connections[queryset.db].ops.quote_name
+        match = self.build_match(terms)
+        matches = RawSQL('SELECT rowid FROM {fts} WHERE {fts} MATCH %s'.format(fts=FTS_TABLE), (match,))
+        rank = RawSQL(
+            'SELECT bm25({fts}, %s, %s) FROM {fts} WHERE {fts}.rowid = {table}.{pk} AND {fts} MATCH %s'.format(
+                fts=FTS_TABLE, table=qn(opts.db_table), pk=qn(opts.pk.column),
+            ),
+            (self.title_weight, self.description_weight, match),
+            output_field=FloatField(),
+        )
+        return (
+            queryset.filter(pk__in=matches)
+            .annotate(search_rank=rank)
+            .order_by('search_rank', '-created_at', '-id')
+        )
+
+    def index(self, sneaker):
+        self.index_many([sneaker])
+
+    def index_many(self, sneakers):
+        rows = [(s.pk, s.title or '', s.description or '') for s in sneakers if s.pk is not None]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'DELETE FROM {} WHERE rowid = %s'.format(FTS_TABLE),
+                [(row[0],) for row in rows],
+            )
+            cursor.executemany(
+                'INSERT INTO {} (rowid, title, description) VALUES (%s, %s, %s)'.format(FTS_TABLE),
+                rows,
+            )
+
+    def remove(self, pk):
+        self.remove_many([pk])
+
+    def remove_many(self, pks):
+        if not pks:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany('DELETE FROM {} WHERE rowid = %s'.format(FTS_TABLE), [(pk,) for pk in pks])
+
+    def rebuild(self, queryset, batch_size=2000):
+        total = 0
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(FTS_TABLE))
+            batch = []
+            for row in queryset.values_list('id', 'title', 'description').iterator(chunk_size=batch_size):
+                batch.append((row[0], row[1] or '', row[2] or ''))
+                if len(batch) >= batch_size:
+                    cursor.executemany(
+                        'INSERT INTO {} (rowid, title, description) VALUES (%s, %s, %s)'.format(FTS_TABLE),
+                        batch,
+                    )
+                    total += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(
+                    'INSERT INTO {} (rowid, title, description) VALUES (%s, %s, %s)'.format(FTS_TABLE),
+                    batch,
+                )
+                total += len(batch)
+            cursor.execute("INSERT INTO {table} ({table}) VALUES ('optimize')".format(table=FTS_TABLE))
+        return total
+
+
+def create_fts_table(schema_editor):
+    """
+    Создает таблицу FTS5, если это SQLite с поддержкой FTS5.
+    Возвращает True, если таблица создана.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5("
+            "title, description, tokenize = 'unicode61 remove_diacritics 2')".format(FTS_TABLE)
+        )
+    except DatabaseError:
+        # SQLite собран без FTS5 - будет использован переносимый поиск
+        return False
+    return True
+
+
+def fts_available():
+    if connection.vendor != 'sqlite':
+        return False
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Возвращает поисковый движок: из настройки SEARCH_BACKEND,
+    иначе FTS5 при его наличии, иначе переносимый поиск.
+    """
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'SEARCH_BACKEND', None)
+        if backend_path:
+            _backend = import_string(backend_path)()
+        elif fts_available():
+            _backend = SQLiteFTSBackend()
+        else:
+            _backend = PortableSearchBackend()
+    return _backend
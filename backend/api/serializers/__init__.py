@@ -4,9 +4,14 @@ from .sneaker_serializers import (
     SneakerDetailSerializer,
     SneakerCreateUpdateSerializer
 )
-from .cart_serializers import CartSerializer, CartItemSerializer, CartItemCreateSerializer, CartItemUpdateSerializer
-from .favorite_serializers import FavoriteSerializer, FavoriteCreateSerializer
-from .order_serializers import OrderSerializer, OrderDetailSerializer, OrderItemSerializer, OrderCreateSerializer
+from .cart_serializers import (
+    CartSerializer, CartItemSerializer, CartItemCreateSerializer, CartItemUpdateSerializer,
+    CartItemsBulkSerializer,
+)
+from .favorite_serializers import FavoriteSerializer, FavoriteCreateSerializer, FavoriteMembershipSerializer
+from .order_serializers import (
+    OrderSerializer, OrderDetailSerializer, OrderItemSerializer, OrderCreateSerializer, OrderFromCartSerializer,
+)
 from .user_serializers import UserSerializer, UserProfileSerializer, UserRegistrationSerializer
 
 __all__ = [
@@ -18,12 +23,15 @@ __all__ = [
     'CartItemSerializer',
     'CartItemCreateSerializer',
     'CartItemUpdateSerializer',
+    'CartItemsBulkSerializer',
     'FavoriteSerializer',
     'FavoriteCreateSerializer',
+    'FavoriteMembershipSerializer',
     'OrderSerializer',
     'OrderDetailSerializer',
     'OrderItemSerializer',
     'OrderCreateSerializer',
+    'OrderFromCartSerializer',
     'UserSerializer',
     'UserProfileSerializer',
     'UserRegistrationSerializer',
@@ -1,9 +1,10 @@
 from rest_framework import serializers
-from api.models import Cart, CartItem
+from api.models import Cart, CartItem, Sneaker
 from .sneaker_serializers import SneakerSerializer
+from .mixins import SparseFieldsetsMixin
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Сериализатор для элементов корзины.
     """
@@ -14,6 +15,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         model = CartItem
         fields = ['id', 'sneaker', 'quantity', 'total_price', 'added_at']
         read_only_fields = ['id', 'added_at']
+        only_sources = {'total_price': ['quantity', 'sneaker', 'sneaker__price']}
     
     def get_total_price(self, obj):
         """
@@ -22,7 +24,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         return obj.quantity * obj.sneaker.price
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Сериализатор для корзины.
     """
@@ -32,20 +34,21 @@ class CartSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Cart
-        fields = ['id', 'items', 'total_price', 'items_count', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = ['id', 'items', 'total_price', 'items_count', 'version', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'version', 'created_at', 'updated_at']
+        only_sources = {'total_price': ['total_price'], 'items_count': ['items_count']}
     
     def get_total_price(self, obj):
         """
-        Вычисляет общую стоимость корзины.
+        Общая стоимость корзины (хранится в корзине, см. CartQuerySet.bump_version).
         """
-        return sum(item.quantity * item.sneaker.price for item in obj.items.all())
+        return obj.total_price or 0
     
     def get_items_count(self, obj):
         """
-        Вычисляет общее количество товаров в корзине.
+        Общее количество товаров в корзине.
         """
-        return sum(item.quantity for item in obj.items.all())
+        return obj.items_count or 0
 
 
 class CartItemCreateSerializer(serializers.ModelSerializer):
@@ -70,4 +73,44 @@ class CartItemUpdateSerializer(serializers.Serializer):
         """
         if value < 0:
             raise serializers.ValidationError("Количество не может быть отрицательным.")
-        return value 
\ No newline at end of file
+        return value 
+
+class CartItemsBulkEntrySerializer(serializers.Serializer):
+    """
+    Одна позиция в массовом изменении корзины.
+    """
+    sneaker = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0)
+
+
+class CartItemsBulkSerializer(serializers.Serializer):
+    """
+    Сериализатор для добавления или установки количества нескольких товаров сразу.
+    
+    mode=add прибавляет количество к уже лежащему в корзине,
+    mode=set заменяет его (0 удаляет товар из корзины).
+    """
+    MAX_ITEMS = 100
+    
+    items = CartItemsBulkEntrySerializer(many=True, allow_empty=False, max_length=MAX_ITEMS)
+    mode = serializers.ChoiceField(choices=['add', 'set'], default='add')
+    
+    def validate(self, attrs):
+        """
+        Объединяет повторы и проверяет, что все кроссовки существуют.
+        """
+        quantities = {}
+        for item in attrs['items']:
+            sneaker_id = item['sneaker']
+            if attrs['mode'] == 'add':
+                quantities[sneaker_id] = quantities.get(sneaker_id, 0) + item['quantity']
+            else:
+                quantities[sneaker_id] = item['quantity']
+        
+        existing = set(Sneaker.objects.filter(pk__in=quantities).values_list('pk', flat=True))
+        missing = [sneaker_id for sneaker_id in quantities if sneaker_id not in existing]
+        if missing:
+            raise serializers.ValidationError({'items': f'Кроссовки не найдены: {missing}'})
+        
+        attrs['quantities'] = quantities
+        return attrs
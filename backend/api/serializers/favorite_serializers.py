@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from api.models import Favorite
 from .sneaker_serializers import SneakerSerializer
+from .mixins import SparseFieldsetsMixin
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Сериализатор для избранных товаров.
     """
@@ -29,4 +30,22 @@ class FavoriteCheckSerializer(serializers.Serializer):
     Сериализатор для проверки наличия товара в избранном.
     """
     sneaker_id = serializers.IntegerField()
-    is_favorite = serializers.BooleanField(read_only=True) 
\ No newline at end of file
+    is_favorite = serializers.BooleanField(read_only=True)
+
+
+class FavoriteMembershipSerializer(serializers.Serializer):
+    """
+    Сериализатор для пакетной проверки избранного: {"ids": [1, 2, 3]}.
+    """
+    MAX_IDS = 100
+    
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=MAX_IDS
+    )
+    
+    def to_internal_value(self, data):
+        # В GET-запросе список передается строкой ?ids=1,2,3
+        if hasattr(data, 'getlist') and 'ids' in data and len(data.getlist('ids')) == 1:
+            data = {'ids': [value for value in data['ids'].split(',') if value.strip()]}
+        return super().to_internal_value(data)
+
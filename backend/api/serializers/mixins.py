@@ -0,0 +1,234 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+
+from api.models import Sneaker
+
+# Домен, который используется для ссылок, когда в контексте нет request
+DEFAULT_MEDIA_HOST = 'http://localhost:8000'
+
+
+class ImageUrlResolver:
+    """
+    Строит абсолютные URL изображений кроссовок.
+
+    Префикс медиа (схема, хост и MEDIA_URL) вычисляется один раз на запрос,
+    поэтому для файлового хранилища URL строки - это склейка строк
+    без обращений к storage и build_absolute_uri.
+    """
+
+    def __init__(self, request=None):
+        self.request = request
+        self.storage = Sneaker._meta.get_field('image').storage
+        self.media_prefix = None
+        base_url = getattr(self.storage, 'base_url', None)
+        if isinstance(self.storage, FileSystemStorage) and base_url and base_url.startswith('/'):
+            if request is not None:
+                self.media_prefix = request.build_absolute_uri(base_url)
+            else:
+                self.media_prefix = DEFAULT_MEDIA_HOST + base_url
+
+    def file_url(self, name):
+        """
+        Абсолютный URL файла из хранилища по его имени.
+        """
+        if self.media_prefix is not None and '..' not in name:
+            return self.media_prefix + filepath_to_uri(name).lstrip('/')
+        url = self.storage.url(name)
+        if self.request is not None:
+            return self.request.build_absolute_uri(url)
+        return f"{DEFAULT_MEDIA_HOST}{url}"
+
+    def image_url(self, image_name, image_url):
+        """
+        URL изображения: загруженный файл важнее внешней ссылки.
+        """
+        if image_name:
+            return self.file_url(image_name)
+        if image_url:
+            # Если это уже полный URL, возвращаем как есть
+            if image_url.startswith('http'):
+                return image_url
+            # Иначе добавляем домен
+            return f"{DEFAULT_MEDIA_HOST}{image_url}"
+        return None
+
+    def srcset(self, variants):
+        """
+        Строки srcset по форматам: {'webp': 'url 320w, url 640w', ...}.
+        """
+        result = {}
+        for fmt, by_width in (variants or {}).items():
+            if fmt == 'source':
+                continue
+            result[fmt] = ', '.join(
+                f'{self.file_url(name)} {width}w'
+                for width, name in sorted(by_width.items(), key=lambda item: int(item[0]))
+            )
+        return result
+
+
+class SneakerImageUrlMixin:
+    """
+    Общие поля image_url / imageUrl для сериализаторов кроссовок.
+    """
+
+    @property
+    def image_url_resolver(self):
+        resolver = getattr(self, '_image_url_resolver', None)
+        if resolver is None:
+            resolver = ImageUrlResolver(self.context.get('request'))
+            self._image_url_resolver = resolver
+        return resolver
+
+    def get_image_url(self, obj):
+        """
+        Возвращает полный URL для изображения
+        """
+        # image_url и imageUrl запрашиваются подряд для одного объекта - считаем один раз
+        cached = getattr(self, '_image_url_cache', None)
+        if cached is not None and cached[0] is obj:
+            return cached[1]
+        url = self.image_url_resolver.image_url(obj.image.name if obj.image else None, obj.image_url)
+        self._image_url_cache = (obj, url)
+        return url
+
+    def get_imageUrl(self, obj):
+        """
+        Дублирует get_image_url для совместимости с React (camelCase)
+        """
+        return self.get_image_url(obj)
+
+    def get_srcset(self, obj):
+        """
+        Уменьшенные копии изображения для атрибута srcset
+        """
+        if not obj.image:
+            return {}
+        return self.image_url_resolver.srcset(obj.image_variants)
+
+
+def parse_field_spec(value):
+    """
+    Разбирает список полей вида "id,sneaker.title,sneaker.price" в дерево
+    {'id': {}, 'sneaker': {'title': {}, 'price': {}}}.
+    """
+    tree = {}
+    for item in (value or '').split(','):
+        node = tree
+        for part in item.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+class SparseFieldsetsMixin:
+    """
+    Ограничение набора полей через параметры запроса ?fields= и ?exclude=.
+
+    Вложенные сериализаторы адресуются через точку: ?fields=id,sneaker.title
+    оставляет у элемента только id и sneaker, а у sneaker - только title.
+    """
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None:
+            return fields
+
+        params = getattr(request, 'query_params', request.GET)
+        path = self._sparse_path()
+
+        include = self._spec_node(params.get(self.fields_query_param), path)
+        if include:
+            fields = {name: field for name, field in fields.items() if name in include}
+
+        exclude = self._spec_node(params.get(self.exclude_query_param), path)
+        for name, children in (exclude or {}).items():
+            # Исключаем поле целиком, только если не указаны его вложенные поля
+            if not children:
+                fields.pop(name, None)
+        return fields
+
+    def _sparse_path(self):
+        """
+        Путь от корневого сериализатора до текущего, например ['items', 'sneaker'].
+        """
+        parts = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                parts.append(node.field_name)
+            node = node.parent
+        return parts[::-1]
+
+    @staticmethod
+    def _spec_node(value, path):
+        if not value:
+            return None
+        node = parse_field_spec(value)
+        for part in path:
+            node = node.get(part)
+            if not node:
+                return None
+        return node
+
+
+class _CannotNarrow(Exception):
+    pass
+
+
+def _collect_only(serializer, prefix=''):
+    model = serializer.Meta.model
+    sources = getattr(serializer.Meta, 'only_sources', {})
+    paths = []
+    for name, field in serializer.fields.items():
+        if name in sources:
+            paths.extend(prefix + source for source in sources[name])
+        elif isinstance(field, serializers.ListSerializer):
+            # Связи "один ко многим" загружаются отдельным prefetch-запросом
+            continue
+        elif isinstance(field, serializers.BaseSerializer):
+            paths.append(prefix + field.source)
+            paths.extend(_collect_only(field, f'{prefix}{field.source}__'))
+        else:
+            try:
+                model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                # Поле вычисляется из неизвестных колонок - сужать выборку небезопасно
+                raise _CannotNarrow(name)
+            paths.append(prefix + field.source)
+    return paths
+
+
+def get_only_fields(serializer, extra=()):
+    """
+    Колонки для QuerySet.only(), достаточные для вывода сериализатора
+    с учетом ?fields=/?exclude=. Возвращает None, если сужать не нужно или нельзя.
+    """
+    request = serializer.context.get('request')
+    if request is None:
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    if not params.get(SparseFieldsetsMixin.fields_query_param) and not params.get(SparseFieldsetsMixin.exclude_query_param):
+        return None
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    try:
+        paths = _collect_only(serializer)
+    except _CannotNarrow:
+        return None
+    return list(dict.fromkeys([*paths, *extra]))
+
+
+def apply_sparse_only(queryset, serializer, extra=()):
+    """
+    Сужает SQL-выборку до колонок, нужных сериализатору.
+    """
+    only = get_only_fields(serializer, extra)
+    if only is None:
+        return queryset
+    return queryset.only(*only)
@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from api.models import Order, OrderItem, Sneaker
 from .sneaker_serializers import SneakerSerializer
+from .mixins import SparseFieldsetsMixin
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Сериализатор для элементов заказа.
     """
@@ -14,6 +15,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ['id', 'sneaker', 'price', 'quantity', 'total_price']
         read_only_fields = ['id', 'price']
+        only_sources = {'total_price': ['price', 'quantity']}
     
     def get_total_price(self, obj):
         """
@@ -22,7 +24,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         return obj.price * obj.quantity
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Сериализатор для списка заказов.
     """
@@ -36,15 +38,20 @@ class OrderSerializer(serializers.ModelSerializer):
             'items_count', 'created_at'
         ]
         read_only_fields = ['id', 'total_price', 'created_at']
+        only_sources = {'status_display': ['status'], 'items_count': []}
     
     def get_items_count(self, obj):
         """
         Вычисляет общее количество товаров в заказе.
         """
+        # В списке заказов значение уже посчитано в SQL (OrderQuerySet.with_items_count)
+        items_count = getattr(obj, 'items_count', None)
+        if items_count is not None:
+            return items_count
         return sum(item.quantity for item in obj.items.all())
 
 
-class OrderDetailSerializer(serializers.ModelSerializer):
+class OrderDetailSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Детальный сериализатор для заказа.
     """
@@ -59,12 +66,27 @@ class OrderDetailSerializer(serializers.ModelSerializer):
             'items', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'total_price', 'created_at', 'updated_at']
+        only_sources = {'status_display': ['status']}
+
+
+class OrderFromCartSerializer(serializers.ModelSerializer):
+    """
+    Контактные данные заказа, оформляемого из корзины.
+    Позиции и цены берутся из корзины (OrderQuerySet.create_from_cart).
+    """
+    
+    class Meta:
+        model = Order
+        fields = ['first_name', 'last_name', 'email', 'phone', 'address']
 
 
 class OrderItemCreateSerializer(serializers.ModelSerializer):
     """
     Сериализатор для создания элемента заказа.
     """
+    # Существование кроссовок проверяется одним запросом для всего заказа (OrderCreateSerializer.validate_items)
+    sneaker = serializers.IntegerField(min_value=1, source='sneaker_id')
+    
     class Meta:
         model = OrderItem
         fields = ['sneaker', 'quantity']
@@ -73,6 +95,9 @@ class OrderItemCreateSerializer(serializers.ModelSerializer):
 class OrderCreateSerializer(serializers.ModelSerializer):
     """
     Сериализатор для создания заказа.
+    
+    Заказ создается за постоянное число запросов при любом количестве позиций:
+    цены загружаются одним in_bulk, позиции пишутся одним bulk_create.
     """
     items = OrderItemCreateSerializer(many=True)
     
@@ -83,17 +108,29 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             'address', 'items'
         ]
     
+    def validate_items(self, items):
+        """
+        Проверяет, что все кроссовки существуют, и запоминает их текущие цены.
+        """
+        prices = dict(
+            Sneaker.objects.filter(pk__in={item['sneaker_id'] for item in items}).order_by().values_list('pk', 'price')
+        )
+        missing = list(dict.fromkeys(item['sneaker_id'] for item in items if item['sneaker_id'] not in prices))
+        if missing:
+            raise serializers.ValidationError(f'Кроссовки не найдены: {missing}')
+        
+        for item in items:
+            item['price'] = prices[item['sneaker_id']]
+        return items
+    
     def create(self, validated_data):
         """
         Создание заказа с элементами.
         """
         items_data = validated_data.pop('items')
         
-        # Рассчитываем общую сумму заказа
-        total_price = sum(
-            Sneaker.objects.get(id=item_data['sneaker'].id).price * item_data['quantity']
-            for item_data in items_data
-        )
+        # Общая сумма считается по ценам, загруженным при проверке
+        total_price = sum(item['price'] * item['quantity'] for item in items_data)
         
         # Создаем заказ
         order = Order.objects.create(
@@ -101,14 +138,15 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             total_price=total_price
         )
         
-        # Создаем элементы заказа
-        for item_data in items_data:
-            sneaker = item_data['sneaker']
-            OrderItem.objects.create(
+        # Создаем элементы заказа одним запросом
+        OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
-                sneaker=sneaker,
-                price=sneaker.price,
-                quantity=item_data['quantity']
+                sneaker_id=item['sneaker_id'],
+                price=item['price'],
+                quantity=item['quantity']
             )
+            for item in items_data
+        ])
         
-        return order 
\ No newline at end of file
+        return order
@@ -1,9 +1,33 @@
 from rest_framework import serializers
+from django.db.models import QuerySet
 from api.models import Sneaker
-from django.conf import settings
+from .mixins import ImageUrlResolver, SneakerImageUrlMixin, SparseFieldsetsMixin
 
+# Поля, зависящие от посетителя: выводятся в списке только по запросу
+# ?include=is_favorite,in_cart_quantity (такой ответ не кэшируется)
+VISITOR_FIELDS = ('is_favorite', 'in_cart_quantity')
 
-class SneakerSerializer(serializers.ModelSerializer):
+
+def get_requested_visitor_fields(request):
+    """
+    Поля посетителя, запрошенные через ?include=, в порядке VISITOR_FIELDS.
+    """
+    if request is None:
+        return []
+    params = getattr(request, 'query_params', request.GET)
+    requested = {name.strip() for name in params.get('include', '').split(',')}
+    return [name for name in VISITOR_FIELDS if name in requested]
+
+
+# Колонки модели, из которых вычисляются поля изображения (для ?fields= и only())
+IMAGE_ONLY_SOURCES = {
+    'image_url': ['image', 'image_url'],
+    'imageUrl': ['image', 'image_url'],
+    'srcset': ['image', 'image_variants'],
+}
+
+
+class SneakerSerializer(SparseFieldsetsMixin, SneakerImageUrlMixin, serializers.ModelSerializer):
     """
     Сериализатор для модели Sneaker (кроссовки).
     """
@@ -17,72 +41,102 @@ class SneakerSerializer(serializers.ModelSerializer):
             'available', 'slug', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'slug', 'created_at', 'updated_at']
+        only_sources = IMAGE_ONLY_SOURCES
+
+
+class SneakerFastListSerializer(serializers.ListSerializer):
+    """
+    Быстрый путь для списка кроссовок.
     
-    def get_image_url(self, obj):
-        """
-        Возвращает полный URL для изображения
-        """
-        if obj.image:
-            request = self.context.get('request')
-            if request is not None:
-                return request.build_absolute_uri(obj.image.url)
-            else:
-                # Если нет request, используем домен из настроек
-                return f"http://localhost:8000{obj.image.url}"
-        if obj.image_url:
-            # Если это уже полный URL, возвращаем как есть
-            if obj.image_url.startswith('http'):
-                return obj.image_url
-            # Иначе добавляем домен
-            return f"http://localhost:8000{obj.image_url}"
-        return None
+    Принимает строки из QuerySet.values() (или модели) и собирает словари
+    напрямую, без per-row вызовов SerializerMethodField и хранилища.
+    Результат совпадает с выводом SneakerListSerializer поле в поле.
+    """
+    
+    def to_representation(self, data):
+        if isinstance(data, QuerySet):
+            data = data.values(*self.get_values_fields())
+        
+        resolver = ImageUrlResolver(self.context.get('request'))
+        price_field = self.child.fields.get('price')
+        field_names = list(self.child.fields)
+        with_image_url = 'image_url' in field_names or 'imageUrl' in field_names
+        
+        result = []
+        for row in data:
+            if not isinstance(row, dict):
+                row = self._row_from_instance(row)
+            values = {}
+            if with_image_url:
+                url = resolver.image_url(row['image'], row['image_url'])
+                values['image_url'] = values['imageUrl'] = url
+            for name in field_names:
+                if name == 'price':
+                    values[name] = price_field.to_representation(row['price'])
+                elif name == 'srcset':
+                    values[name] = resolver.srcset(row['image_variants']) if row['image'] else {}
+                elif name not in values:
+                    values[name] = row[name]
+            result.append({name: values[name] for name in field_names})
+        return result
     
-    def get_imageUrl(self, obj):
+    def get_values_fields(self):
         """
-        Дублирует get_image_url для совместимости с React (camelCase)
+        Колонки для values() с учетом ?fields=/?exclude= (id и created_at нужны всегда).
         """
-        return self.get_image_url(obj)
+        sources = self.child.Meta.only_sources
+        columns = ['id']
+        for name in self.child.fields:
+            columns.extend(sources.get(name, [name]))
+        columns.append('created_at')
+        return list(dict.fromkeys(columns))
+    
+    @staticmethod
+    def _row_from_instance(obj):
+        return {
+            'id': obj.pk,
+            'title': obj.title,
+            'price': obj.price,
+            'image': obj.image.name if obj.image else None,
+            'image_url': obj.image_url,
+            'available': obj.available,
+            'image_variants': obj.image_variants,
+            'is_favorite': getattr(obj, 'is_favorite', False),
+            'in_cart_quantity': getattr(obj, 'in_cart_quantity', 0),
+        }
 
 
-class SneakerListSerializer(serializers.ModelSerializer):
+class SneakerListSerializer(SparseFieldsetsMixin, SneakerImageUrlMixin, serializers.ModelSerializer):
     """
     Сериализатор для списка кроссовок (с меньшим количеством полей).
     """
     image_url = serializers.SerializerMethodField()
     imageUrl = serializers.SerializerMethodField()  # Дублируем поле в camelCase для React
+    srcset = serializers.SerializerMethodField()
+    # Аннотации queryset (см. SneakerViewSet.annotate_visitor_fields)
+    is_favorite = serializers.BooleanField(read_only=True)
+    in_cart_quantity = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Sneaker
-        fields = ['id', 'title', 'price', 'image_url', 'imageUrl', 'available']
+        fields = [
+            'id', 'title', 'price', 'image_url', 'imageUrl', 'available', 'srcset',
+            'is_favorite', 'in_cart_quantity',
+        ]
         read_only_fields = ['id']
+        only_sources = IMAGE_ONLY_SOURCES
+        list_serializer_class = SneakerFastListSerializer
     
-    def get_image_url(self, obj):
-        """
-        Возвращает полный URL для изображения
-        """
-        if obj.image:
-            request = self.context.get('request')
-            if request is not None:
-                return request.build_absolute_uri(obj.image.url)
-            else:
-                # Если нет request, используем домен из настроек
-                return f"http://localhost:8000{obj.image.url}"
-        if obj.image_url:
-            # Если это уже полный URL, возвращаем как есть
-            if obj.image_url.startswith('http'):
-                return obj.image_url
-            # Иначе добавляем домен
-            return f"http://localhost:8000{obj.image_url}"
-        return None
-    
-    def get_imageUrl(self, obj):
-        """
-        Дублирует get_image_url для совместимости с React (camelCase)
-        """
-        return self.get_image_url(obj)
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = get_requested_visitor_fields(self.context.get('request'))
+        for name in VISITOR_FIELDS:
+            if name not in requested:
+                fields.pop(name, None)
+        return fields
 
 
-class SneakerDetailSerializer(serializers.ModelSerializer):
+class SneakerDetailSerializer(SparseFieldsetsMixin, SneakerImageUrlMixin, serializers.ModelSerializer):
     """
     Расширенный сериализатор для детальной информации о кроссовках.
     """
@@ -96,31 +150,7 @@ class SneakerDetailSerializer(serializers.ModelSerializer):
             'available', 'slug', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'slug', 'created_at', 'updated_at']
-    
-    def get_image_url(self, obj):
-        """
-        Возвращает полный URL для изображения
-        """
-        if obj.image:
-            request = self.context.get('request')
-            if request is not None:
-                return request.build_absolute_uri(obj.image.url)
-            else:
-                # Если нет request, используем домен из настроек
-                return f"http://localhost:8000{obj.image.url}"
-        if obj.image_url:
-            # Если это уже полный URL, возвращаем как есть
-            if obj.image_url.startswith('http'):
-                return obj.image_url
-            # Иначе добавляем домен
-            return f"http://localhost:8000{obj.image_url}"
-        return None
-    
-    def get_imageUrl(self, obj):
-        """
-        Дублирует get_image_url для совместимости с React (camelCase)
-        """
-        return self.get_image_url(obj)
+        only_sources = IMAGE_ONLY_SOURCES
 
 
 class SneakerCreateUpdateSerializer(serializers.ModelSerializer):
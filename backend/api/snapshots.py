@@ -0,0 +1,246 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.db import connections
+from django.http import QueryDict
+from django.test import RequestFactory
+from django.urls import get_script_prefix, reverse
+
+from api.cache import generation_cache, get_catalog_generation
+
+try:
+    import brotli
+except ImportError:  # brotli - необязательная зависимость
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+# Блокировка пересборки в общем кэше: снимки поколения строит один процесс
+REBUILD_LOCK_KEY = 'catalog:snapshots:rebuild'
+
+DEFAULT_QUERIES = ('', 'page=2', 'page=3')
+
+# Расширения файлов для каждого Content-Encoding (identity - без сжатия)
+ENCODING_SUFFIXES = {
+    'br': '.json.br',
+    'gzip': '.json.gz',
+    'identity': '.json',
+}
+
+
+def get_snapshot_dir():
+    return str(getattr(settings, 'CATALOG_SNAPSHOT_DIR', os.path.join(settings.BASE_DIR, 'snapshots')))
+
+
+def get_snapshot_queries():
+    return tuple(getattr(settings, 'CATALOG_SNAPSHOT_QUERIES', DEFAULT_QUERIES))
+
+
+def get_snapshot_path():
+    """
+    Путь списка кроссовок в том виде, в каком его видит request.path_info.
+    """
+    return '/' + reverse('sneaker-list').removeprefix(get_script_prefix())
+
+
+def normalize_query(params):
+    """
+    Канонический вид параметров запроса: непустые пары, отсортированные по имени.
+    """
+    return urlencode(sorted(
+        (name, value)
+        for name, values in params.lists()
+        for value in values
+        if value != ''
+    ))
+
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp_path, path)
+
+
+def _compress(body):
+    encoded = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded['br'] = brotli.compress(body, quality=11)
+    return encoded
+
+
+def build_snapshots(queries=None):
+    """
+    Строит снимки списка кроссовок через обычное представление каталога
+    и записывает их на диск вместе с манифестом.
+
+    Файлы называются по хэшу содержимого: неизменившиеся страницы
+    не перезаписываются. Манифест помечен поколением каталога, под которым
+    строились данные, - устаревшие снимки не отдаются.
+    """
+    from api.views import SneakerViewSet
+
+    queries = get_snapshot_queries() if queries is None else queries
+    base_url = urlsplit(getattr(settings, 'CATALOG_SNAPSHOT_BASE_URL', 'http://localhost:8000'))
+    root = get_snapshot_dir()
+    os.makedirs(root, exist_ok=True)
+
+    generation = get_catalog_generation()
+    path = get_snapshot_path()
+    factory = RequestFactory()
+    view = SneakerViewSet.as_view({'get': 'list'})
+
+    entries = {}
+    for query in queries:
+        request = factory.get(
+            f'{path}?{query}' if query else path,
+            HTTP_HOST=base_url.netloc,
+            HTTP_ACCEPT='application/json',
+            secure=base_url.scheme == 'https',
+        )
+        response = view(request)
+        if response.status_code != 200:
+            # Например, страница за пределами каталога
+            continue
+        response.render()
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+
+        files = {}
+        for encoding, data in _compress(body).items():
+            name = digest + ENCODING_SUFFIXES[encoding]
+            file_path = os.path.join(root, name)
+            if not os.path.exists(file_path):
+                _write_atomic(file_path, data)
+            files[encoding] = name
+        entries[normalize_query(QueryDict(query))] = {'etag': digest[:32], 'files': files}
+
+    manifest = {
+        'generation': generation,
+        'base_url': f'{base_url.scheme}://{base_url.netloc}/',
+        'path': path,
+        'entries': entries,
+    }
+    _write_atomic(os.path.join(root, MANIFEST_NAME), json.dumps(manifest).encode('utf-8'))
+    _remove_unused(root, entries)
+    return manifest
+
+
+def _remove_unused(root, entries):
+    used = {name for entry in entries.values() for name in entry['files'].values()}
+    used.add(MANIFEST_NAME)
+    for name in os.listdir(root):
+        if name not in used and name.endswith(tuple(ENCODING_SUFFIXES.values())):
+            try:
+                os.remove(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+
+
+class SnapshotManifest:
+    """
+    Манифест снимков, загруженный в память процесса.
+    С диска перечитывается только при смене поколения каталога.
+    """
+
+    def __init__(self):
+        self._data = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        manifest_path = os.path.join(get_snapshot_dir(), MANIFEST_NAME)
+        try:
+            mtime = os.stat(manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            self._data = self._mtime = None
+            return
+        if mtime != self._mtime:
+            with open(manifest_path, 'rb') as fh:
+                self._data = json.load(fh)
+            self._mtime = mtime
+
+    def current(self):
+        """
+        Манифест текущего поколения каталога или None.
+        """
+        generation = get_catalog_generation()
+        data = self._data
+        if data is None or data['generation'] != generation:
+            with self._lock:
+                self._load()
+                data = self._data
+        if data is None or data['generation'] != generation:
+            return None
+        return data
+
+
+manifest = SnapshotManifest()
+
+
+_state_lock = threading.Lock()
+_pending = False
+_worker = None
+
+
+def _rebuild_loop():
+    global _pending, _worker
+    try:
+        while True:
+            # Небольшая пауза объединяет серию изменений в одну пересборку
+            time.sleep(getattr(settings, 'CATALOG_SNAPSHOT_REBUILD_DELAY', 1))
+            with _state_lock:
+                if not _pending:
+                    _worker = None
+                    return
+                _pending = False
+            try:
+                rebuild_once()
+            except Exception:
+                logger.exception('Не удалось пересобрать снимки каталога')
+    finally:
+        connections.close_all()
+
+
+def rebuild_once():
+    """
+    Пересобирает снимки, если они устарели и их не строит другой процесс.
+    Возвращает манифест или None, если пересборка не понадобилась.
+    """
+    if manifest.current() is not None:
+        return None
+    cache = generation_cache()
+    if not cache.add(REBUILD_LOCK_KEY, os.getpid(), 300):
+        return None
+    try:
+        return build_snapshots()
+    finally:
+        cache.delete(REBUILD_LOCK_KEY)
+
+
+def schedule_rebuild():
+    """
+    Пересобирает снимки в фоновом потоке. Повторные вызовы во время
+    сборки приводят только к одной дополнительной пересборке.
+    
+    Включается CATALOG_SNAPSHOT_AUTO_REBUILD и годится для одного процесса;
+    с несколькими воркерами снимки лучше строить из одного места -
+    командой build_catalog_snapshots --watch или по расписанию.
+    """
+    global _pending, _worker
+    if not getattr(settings, 'CATALOG_SNAPSHOT_AUTO_REBUILD', False):
+        return
+    with _state_lock:
+        _pending = True
+        if _worker is None:
+            _worker = threading.Thread(target=_rebuild_loop, name='catalog-snapshots')
+            _worker.start()
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+
+# Имя файла, полученное из хэша содержимого (sha256 в hex)
+HASHED_NAME_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_content_addressed(name):
+    """
+    True, если имя файла - хэш его содержимого: такой файл никогда не меняется.
+    """
+    stem = os.path.splitext(posixpath.basename(name))[0]
+    return bool(HASHED_NAME_RE.match(stem))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище, которое называет файлы по sha256 содержимого.
+
+    Каталог и расширение берутся из имени, предложенного upload_to,
+    а имя файла заменяется хэшем. Повторная загрузка того же содержимого
+    не создает копию: возвращается имя уже существующего файла.
+    """
+
+    def hashed_name(self, name, content):
+        hasher = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        ext = os.path.splitext(filename)[1].lower()
+        return posixpath.join(directory, hasher.hexdigest() + ext)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = self.hashed_name(name, content)
+        validate_file_name(name, allow_relative_path=True)
+        if self.exists(name):
+            # Обновляем время изменения: gc_media не тронет файл, пока запись о нем не сохранена
+            try:
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                pass
+        return super().save(name, content, max_length=max_length)
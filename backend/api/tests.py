@@ -1,3 +1,1498 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import uuid
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from time import time_ns
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.anonymous_purge import purge_queryset
+from api.anonymous_store import get_anonymous_store
+from api.cache import (
+    GENERATION_KEY, bump_catalog_generation, catalog_cache, get_catalog_generation, sneaker_card_cache,
+)
+from api.cache_backends import FileCache
+from api import favorites_cache
+from api.favorites_cache import favorites_owner, get_favorites
+from api.media_gc import delete_orphans, find_orphans
+from api.models import Cart, CartItem, CartItemQuerySet, Favorite, Order, OrderItem, Sneaker
+from api.renderers import FastJSONParser, FastJSONRenderer, orjson
+from api.search import SQLiteFTSBackend, get_search_backend
+from api.serializers.sneaker_serializers import SneakerListSerializer
+from api.snapshots import build_snapshots, manifest
+from api.storage import ContentAddressedStorage, is_content_addressed
+from api.views import SneakerViewSet
+from api.views.media_views import DEFAULT_CACHE_CONTROL, IMMUTABLE_CACHE_CONTROL
+
+# Кэши в памяти процесса: тесты не видят файловый кэш разработчика
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-shared'},
+}
+
+
+def clear_caches():
+    """
+    Сбрасывает кэши между тестами: ответы каталога и наборы избранного
+    не должны переходить из одного теста в другой.
+    """
+    for alias in TEST_CACHES:
+        caches[alias].clear()
+    catalog_cache.clear()
+    sneaker_card_cache.clear()
+
+
+def create_sneakers(count, **fields):
+    return Sneaker.objects.bulk_create([
+        Sneaker(title=f'Sneaker {index}', slug=f'sneaker-{index}', price=Decimal('10.50') + index, **fields)
+        for index in range(count)
+    ])
+
+
+class OrderCreateTests(TestCase):
+    """
+    Создание заказа: число запросов не зависит от количества позиций.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        # Корзина уже есть: первый заказ не должен отличаться созданием корзины
+        Cart.objects.create(user=cls.user)
+        cls.sneakers = create_sneakers(100)
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def order_payload(self, sneakers, quantity=2):
+        return {
+            'first_name': 'Иван',
+            'last_name': 'Иванов',
+            'email': 'buyer@example.com',
+            'phone': '+70000000000',
+            'address': 'Москва',
+            'items': [{'sneaker': sneaker.pk, 'quantity': quantity} for sneaker in sneakers],
+        }
+    
+    def create_order(self, sneakers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/orders/', self.order_payload(sneakers), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return len(queries)
+    
+    def test_query_count_does_not_depend_on_line_count(self):
+        single = self.create_order(self.sneakers[:1])
+        with self.assertNumQueries(single):
+            self.client.post('/api/orders/', self.order_payload(self.sneakers), format='json')
+        self.assertEqual(Order.objects.get(items__sneaker=self.sneakers[-1]).items.count(), 100)
+    
+    def test_query_count(self):
+        # Проверка кроссовок, заказ, позиции одним INSERT, очистка корзины
+        self.assertEqual(self.create_order(self.sneakers), 8)
+    
+    def test_total_and_prices(self):
+        self.create_order(self.sneakers[:3])
+        order = Order.objects.get()
+        self.assertEqual(order.total_price, sum(sneaker.price * 2 for sneaker in self.sneakers[:3]))
+        self.assertEqual(
+            sorted(order.items.values_list('sneaker_id', 'price', 'quantity')),
+            sorted((sneaker.pk, sneaker.price, 2) for sneaker in self.sneakers[:3]),
+        )
+    
+    def test_unknown_sneaker(self):
+        payload = self.order_payload(self.sneakers[:1])
+        payload['items'].append({'sneaker': 999999, 'quantity': 1})
+        response = self.client.post('/api/orders/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items', response.json())
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderFromCartTests(TestCase):
+    """
+    Оформление заказа из корзины: позиции копируются одним запросом.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        cls.cart = Cart.objects.create(user=cls.user)
+        cls.sneakers = create_sneakers(100)
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def fill_cart(self, sneakers, quantity=3):
+        CartItem.objects.upsert(self.cart, {sneaker.pk: quantity for sneaker in sneakers})
+        Cart.objects.filter(pk=self.cart.pk).bump_version()
+    
+    def checkout(self):
+        return self.client.post('/api/orders/create_from_cart/', {
+            'first_name': 'Иван',
+            'last_name': 'Иванов',
+            'email': 'buyer@example.com',
+            'phone': '+70000000000',
+            'address': 'Москва',
+        }, format='json')
+    
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.fill_cart(self.sneakers[:1])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.checkout().status_code, 201)
+        self.fill_cart(self.sneakers)
+        with self.assertNumQueries(len(queries)):
+            response = self.checkout()
+        self.assertEqual(len(response.json()['items']), 100)
+    
+    def test_order_and_cleared_cart(self):
+        self.fill_cart(self.sneakers[:3])
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201, response.content)
+        
+        order = Order.objects.get()
+        self.assertEqual(order.user, self.user)
+        self.assertEqual(order.total_price, sum(sneaker.price * 3 for sneaker in self.sneakers[:3]))
+        self.assertEqual(Decimal(response.json()['total_price']), order.total_price)
+        self.assertEqual(
+            sorted(order.items.values_list('sneaker_id', 'price', 'quantity')),
+            sorted((sneaker.pk, sneaker.price, 3) for sneaker in self.sneakers[:3]),
+        )
+        
+        self.cart.refresh_from_db()
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual((self.cart.items_count, self.cart.total_price), (0, 0))
+    
+    def test_empty_cart(self):
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+    
+    def test_drifted_items_count(self):
+        # Счетчик позиций разошелся с самими позициями - заказ все равно оформляется
+        self.fill_cart(self.sneakers[:2])
+        Cart.objects.filter(pk=self.cart.pk).update(items_count=0)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(len(response.json()['items']), 2)
+
+
+class OrderListTests(TestCase):
+    """
+    История заказов: количество товаров считается в SQL, курсор проходит всю историю.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        sneakers = create_sneakers(3)
+        cls.orders = Order.objects.bulk_create([
+            Order(
+                user=cls.user, first_name='Иван', last_name='Иванов', email='buyer@example.com',
+                phone='+70000000000', address='Москва', total_price=0,
+            )
+            for _ in range(25)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, sneaker=sneaker, price=sneaker.price, quantity=2)
+            for order in cls.orders for sneaker in sneakers
+        ])
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def test_items_count_without_n_plus_one(self):
+        # Страница заказов и COUNT для пагинации
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/orders/')
+        self.assertEqual({order['items_count'] for order in response.json()['results']}, {6})
+    
+    def test_cursor_walks_whole_history(self):
+        url, seen = '/api/orders/?pagination=cursor&page_size=10', []
+        while url:
+            with self.assertNumQueries(1):
+                data = self.client.get(url).json()
+            seen += [order['id'] for order in data['results']]
+            url = data['next']
+        self.assertEqual(seen, sorted((order.pk for order in self.orders), reverse=True))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class KeysetPaginationTests(TestCase):
+    """
+    Курсорная пагинация каталога: проход вперед и назад без пропусков и повторов.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        create_sneakers(25)
+        cls.expected = list(Sneaker.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+    
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+    
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        return [sneaker['id'] for sneaker in data['results']], data
+    
+    def test_forward_and_back(self):
+        url, seen, pages = '/api/sneakers/?pagination=cursor&page_size=10', [], []
+        while url:
+            ids, data = self.get_page(url)
+            self.assertNotIn('count', data)
+            seen += ids
+            pages.append(ids)
+            url = data['next']
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        
+        # С последней страницы назад - снова вторая, потом первая без ссылки назад
+        ids, data = self.get_page(data['previous'])
+        self.assertEqual(ids, pages[1])
+        ids, data = self.get_page(data['previous'])
+        self.assertEqual(ids, pages[0])
+        self.assertIsNone(data['previous'])
+    
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', 'dD14Jmk9MQ=='):
+            response = self.client.get('/api/sneakers/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+    
+    def test_page_number_pagination_by_default(self):
+        ids, data = self.get_page('/api/sneakers/')
+        self.assertEqual(data['count'], 25)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SearchTests(TestCase):
+    """
+    Полнотекстовый поиск: релевантность, синхронизация индекса и отсутствие лимита совпадений.
+    """
+    
+    def setUp(self):
+        if not isinstance(get_search_backend(), SQLiteFTSBackend):
+            self.skipTest('SQLite собран без FTS5')
+        clear_caches()
+        self.client = APIClient()
+    
+    def search(self, query, **params):
+        response = self.client.get('/api/sneakers/', {'search': query, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+    
+    def titles(self, query):
+        clear_caches()
+        return [sneaker['title'] for sneaker in self.search(query)['results']]
+    
+    def test_title_match_ranks_higher(self):
+        Sneaker.objects.create(title='Retro runner', slug='retro', price=1, description='Classic jordan silhouette')
+        Sneaker.objects.create(title='Jordan high', slug='jordan', price=1, description='Basketball')
+        Sneaker.objects.create(title='Court low', slug='court', price=1, description='Tennis')
+        self.assertEqual(self.titles('jordan'), ['Jordan high', 'Retro runner'])
+    
+    def test_index_follows_writes(self):
+        sneaker = Sneaker.objects.create(title='Air max', slug='air-max', price=1)
+        self.assertEqual(self.titles('air'), ['Air max'])
+        
+        Sneaker.objects.filter(pk=sneaker.pk).update(title='Dunk low')
+        self.assertEqual(self.titles('air'), [])
+        self.assertEqual(self.titles('dunk'), ['Dunk low'])
+        
+        sneaker.refresh_from_db()
+        sneaker.description = 'Suede upper'
+        Sneaker.objects.bulk_update([sneaker], ['description'])
+        self.assertEqual(self.titles('suede'), ['Dunk low'])
+        
+        Sneaker.objects.filter(pk=sneaker.pk).delete()
+        self.assertEqual(self.titles('dunk'), [])
+    
+    def test_all_matches_are_counted(self):
+        sneakers = create_sneakers(150)
+        get_search_backend().index_many(sneakers)
+        self.assertEqual(self.search('sneaker')['count'], 150)
+        self.assertEqual(len(self.search('sneaker', page=15)['results']), 10)
+    
+    def test_cursor_with_search_is_rejected(self):
+        response = self.client.get('/api/sneakers/', {'search': 'air', 'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pagination', response.json())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FastJSONTests(TestCase):
+    """
+    Рендерер и парсер на orjson дают те же байты и те же данные, что стандартные,
+    а без orjson и для отступов работают как стандартные.
+    """
+    DATA = {'price': Decimal('10.50'), 'items': [{'id': 1, 'title': 'Кроссовки'}], 'day': date(2024, 5, 17)}
+    
+    def assertSameBytes(self, data, **context):
+        self.assertEqual(
+            FastJSONRenderer().render(data, renderer_context=context),
+            JSONRenderer().render(data, renderer_context=context),
+        )
+    
+    def test_default_classes(self):
+        self.assertIs(api_settings.DEFAULT_RENDERER_CLASSES[0], FastJSONRenderer)
+        self.assertIs(api_settings.DEFAULT_PARSER_CLASSES[0], FastJSONParser)
+    
+    def test_fallbacks(self):
+        self.assertSameBytes(self.DATA, indent=2)
+        self.assertSameBytes(None)
+        with mock.patch('api.renderers.orjson', None):
+            self.assertSameBytes(self.DATA)
+            body = b'{"a": [1, "\\u0416"]}'
+            self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), {'a': [1, '\u0416']})
+    
+    @skipUnless(orjson, 'orjson не установлен')
+    def test_renderer_bytes(self):
+        moment = datetime(2024, 5, 17, 12, 30, 15, 123456, tzinfo=dt_timezone.utc)
+        self.assertSameBytes({
+            'price': Decimal('1234.50'),
+            'created_at': moment,
+            'naive': datetime(2024, 5, 17, 12, 30),
+            'day': date(2024, 5, 17),
+            'time': time(8, 15, 30, 500),
+            'title': 'Кроссовки "Air" \u2028\u2029 \U0001F600',
+            'nested': [{'id': 1, 'tags': ('a', 'b'), 'ratio': 0.1}, None, True],
+            1: 'numeric key',
+            'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'lazy': gettext_lazy('Not found.'),
+            'big': 2 ** 70,
+        })
+        self.assertSameBytes([])
+        self.assertSameBytes('plain')
+    
+    @skipUnless(orjson, 'orjson не установлен')
+    def test_api_response_bytes(self):
+        create_sneakers(5)
+        clear_caches()
+        response = APIClient().get('/api/sneakers/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+    
+    @skipUnless(orjson, 'orjson не установлен')
+    def test_parser_matches_json(self):
+        for body in (b'{"a": [1, 2.5, "\\u0416", null]}', b'{"id": 123456789012345678901234}'):
+            self.assertEqual(
+                FastJSONParser().parse(io.BytesIO(body)),
+                JSONParser().parse(io.BytesIO(body)),
+            )
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"a": '))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CartQueryCountTests(TestCase):
+    """
+    GET корзины выполняет фиксированное число запросов при любом числе позиций.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='password')
+        cls.sneakers = create_sneakers(20)
+    
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+    
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries), response.json()
+    
+    def test_user_cart(self):
+        self.client.force_authenticate(self.user)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.upsert(cart, {self.sneakers[0].pk: 1})
+        few, _ = self.count_queries('/api/cart/')
+        
+        CartItem.objects.upsert(cart, {sneaker.pk: 2 for sneaker in self.sneakers[1:]})
+        many, data = self.count_queries('/api/cart/')
+        self.assertEqual(len(data['items']), 20)
+        # Корзина и позиции с кроссовками одним prefetch
+        self.assertEqual((few, many), (2, 2))
+    
+    def test_anonymous_cart(self):
+        self.client.post('/api/anonymous/cart/add/', {'sneaker': self.sneakers[0].pk}, format='json')
+        few, _ = self.count_queries('/api/anonymous/cart/')
+        
+        self.client.post('/api/anonymous/cart/items/', {
+            'items': [{'sneaker': sneaker.pk, 'quantity': 2} for sneaker in self.sneakers[1:]],
+        }, format='json')
+        many, data = self.count_queries('/api/anonymous/cart/')
+        self.assertEqual(len(data['items']), 20)
+        # Только кроссовки корзины: состояние хранится вне базы
+        self.assertEqual((few, many), (1, 1))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CartUpsertTests(TestCase):
+    """
+    Повторные и одновременные добавления товара дают одну позицию с суммой количеств.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='password')
+        cls.sneaker = create_sneakers(1)[0]
+    
+    def setUp(self):
+        clear_caches()
+        self.cart = Cart.objects.create(user=self.user)
+    
+    def assertCartItem(self, quantity, version):
+        self.assertEqual(list(CartItem.objects.filter(cart=self.cart).values_list('quantity', flat=True)), [quantity])
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.version, version)
+    
+    def test_double_add_via_api(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for quantity in (1, 2):
+            response = client.post('/api/cart/add/', {'sneaker': self.sneaker.pk, 'quantity': quantity}, format='json')
+            self.assertEqual(response.status_code, 200, response.content)
+        self.assertCartItem(3, self.cart.version + 2)
+        self.assertEqual(self.cart.items_count, 3)
+    
+    def test_upsert_increment_and_set(self):
+        version = self.cart.version
+        CartItem.objects.upsert(self.cart, {self.sneaker.pk: 2})
+        CartItem.objects.upsert(self.cart, {self.sneaker.pk: 3})
+        self.assertCartItem(5, version)
+        CartItem.objects.upsert(self.cart, {self.sneaker.pk: 4}, increment=False)
+        self.assertCartItem(4, version)
+    
+    def test_fallback_does_not_bump_version(self):
+        version = self.cart.version
+        CartItem.objects.all()._upsert_fallback(self.cart, {self.sneaker.pk: 2}, True)
+        CartItem.objects.all()._upsert_fallback(self.cart, {self.sneaker.pk: 3}, True)
+        self.assertCartItem(5, version)
+    
+    def test_fallback_concurrent_insert(self):
+        # Позицию создали параллельно между UPDATE и INSERT: первый UPDATE ничего не нашел
+        CartItem.objects.upsert(self.cart, {self.sneaker.pk: 2})
+        update = CartItemQuerySet.update
+        calls = []
+        
+        def racing_update(queryset, **kwargs):
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else update(queryset, **kwargs)
+        
+        with mock.patch.object(CartItemQuerySet, 'update', racing_update):
+            CartItem.objects.all()._upsert_fallback(self.cart, {self.sneaker.pk: 3}, True)
+        self.assertEqual(len(calls), 2)
+        self.assertCartItem(5, self.cart.version)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CartConditionalRequestTests(TestCase):
+    """
+    ETag корзины: 304 на актуальный If-None-Match, 412 на устаревший If-Match,
+    короткий ответ на изменение при Prefer: return=minimal.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='password')
+        cls.sneakers = create_sneakers(2)
+    
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def add(self, sneaker, url='/api/cart/add/', **headers):
+        return self.client.post(url, {'sneaker': sneaker.pk, 'quantity': 1}, format='json', headers=headers)
+    
+    def test_not_modified(self):
+        etag = self.client.get('/api/cart/')['ETag']
+        response = self.client.get('/api/cart/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+        
+        self.add(self.sneakers[0])
+        response = self.client.get('/api/cart/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_stale_if_match(self):
+        etag = self.client.get('/api/cart/')['ETag']
+        response = self.add(self.sneakers[0], **{'If-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        
+        # Вторая вкладка с устаревшей версией: изменение откатывается
+        response = self.add(self.sneakers[1], **{'If-Match': etag})
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(list(CartItem.objects.values_list('sneaker_id', flat=True)), [self.sneakers[0].pk])
+        
+        response = self.add(self.sneakers[1], **{'If-Match': self.client.get('/api/cart/')['ETag']})
+        self.assertEqual(response.status_code, 200)
+    
+    def test_prefer_minimal(self):
+        self.add(self.sneakers[0])
+        response = self.add(self.sneakers[0], Prefer='return=minimal')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Preference-Applied'], 'return=minimal')
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(response.json(), {
+            'id': cart.pk,
+            'items': [{'sneaker': self.sneakers[0].pk, 'quantity': 2}],
+            'total_price': float(cart.total_price),
+            'items_count': 2,
+            'version': cart.version,
+        })
+        self.assertEqual(response['ETag'], self.client.get('/api/cart/')['ETag'])
+        
+        response = self.add(self.sneakers[0])
+        self.assertNotIn('Preference-Applied', response)
+        self.assertIn('total_price', response.json())
+    
+    def test_anonymous_cart(self):
+        self.client.force_authenticate(None)
+        url = '/api/anonymous/cart/add/'
+        self.add(self.sneakers[0], url)
+        etag = self.client.get('/api/anonymous/cart/')['ETag']
+        self.assertEqual(self.client.get('/api/anonymous/cart/', headers={'If-None-Match': etag}).status_code, 304)
+        
+        self.assertEqual(self.add(self.sneakers[1], url, **{'If-Match': etag}).status_code, 200)
+        self.assertEqual(self.add(self.sneakers[1], url, **{'If-Match': etag}).status_code, 412)
+        
+        response = self.add(self.sneakers[1], url, Prefer='return=minimal')
+        self.assertEqual(response['Preference-Applied'], 'return=minimal')
+        self.assertEqual(response.json()['items'], [{'sneaker': self.sneakers[1].pk, 'quantity': 2}])
+        self.assertEqual(response.json()['items_count'], 3)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class VisitorFieldsTests(TestCase):
+    """
+    ?include=is_favorite,in_cart_quantity в списке кроссовок для пользователя и анонима.
+    """
+    INCLUDE = {'include': 'is_favorite,in_cart_quantity'}
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='password')
+        cls.sneakers = create_sneakers(3)
+    
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+    
+    def get_visitor_fields(self, url='/api/sneakers/'):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, self.INCLUDE)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response['Cache-Control'], 'private')
+        # COUNT пагинации и сам список: аннотации не добавляют запросов
+        self.assertEqual(len(queries), 2)
+        return {
+            sneaker['id']: (sneaker['is_favorite'], sneaker['in_cart_quantity'])
+            for sneaker in response.json()['results']
+        }
+    
+    def expected(self):
+        first, second, third = (sneaker.pk for sneaker in self.sneakers)
+        return {first: (True, 0), second: (False, 3), third: (False, 0)}
+    
+    def test_authenticated(self):
+        self.client.force_authenticate(self.user)
+        Favorite.objects.create(user=self.user, sneaker=self.sneakers[0])
+        CartItem.objects.upsert(Cart.objects.create(user=self.user), {self.sneakers[1].pk: 3})
+        # Чужие избранное и корзина не видны
+        other = User.objects.create_user(username='other', password='password')
+        Favorite.objects.create(user=other, sneaker=self.sneakers[2])
+        self.assertEqual(self.get_visitor_fields(), self.expected())
+    
+    def test_anonymous(self):
+        self.client.post('/api/anonymous/favorites/add/', {'sneaker': self.sneakers[0].pk}, format='json')
+        self.client.post('/api/anonymous/cart/add/', {'sneaker': self.sneakers[1].pk, 'quantity': 3}, format='json')
+        self.assertEqual(self.get_visitor_fields(), self.expected())
+    
+    def test_not_in_cached_response(self):
+        self.client.force_authenticate(self.user)
+        Favorite.objects.create(user=self.user, sneaker=self.sneakers[0])
+        self.get_visitor_fields()
+        for sneaker in self.client.get('/api/sneakers/').json()['results']:
+            self.assertNotIn('is_favorite', sneaker)
+            self.assertNotIn('in_cart_quantity', sneaker)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FavoritesCacheTests(TestCase):
+    """
+    Кэш набора избранного: чтение без запросов и сброс при любых изменениях записей.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='password')
+        cls.sneakers = create_sneakers(3)
+    
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.owner = favorites_owner(user=self.user)
+    
+    def contains(self):
+        response = self.client.post('/api/favorites/contains/', {'ids': [s.pk for s in self.sneakers]}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['favorites']
+    
+    def add(self, *sneakers):
+        with self.captureOnCommitCallbacks(execute=True):
+            for sneaker in sneakers:
+                Favorite.objects.create(user=self.user, sneaker=sneaker)
+    
+    def test_cached_read(self):
+        self.add(self.sneakers[0])
+        self.assertEqual(list(get_favorites(self.owner)), [self.sneakers[0].pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(list(get_favorites(self.owner)), [self.sneakers[0].pk])
+    
+    def test_api_add_and_remove(self):
+        self.assertEqual(self.contains(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/favorites/add/', {'sneaker': self.sneakers[1].pk}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.contains(), [self.sneakers[1].pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/favorites/remove/', {'sneaker_id': self.sneakers[1].pk}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.contains(), [])
+    
+    def test_remove_rebuilds_once(self):
+        self.add(*self.sneakers[:2])
+        self.assertEqual(len(self.contains()), 2)
+        with mock.patch('api.favorites_cache._load', wraps=favorites_cache._load) as load:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.client.post('/api/favorites/remove/', {'sneaker_id': self.sneakers[0].pk}, format='json')
+            self.assertEqual(len(callbacks), 1)
+            self.assertEqual(self.contains(), [self.sneakers[1].pk])
+            self.assertEqual(self.contains(), [self.sneakers[1].pk])
+        self.assertEqual(load.call_count, 1)
+    
+    def test_queryset_delete(self):
+        self.add(*self.sneakers)
+        self.assertEqual(len(self.contains()), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.filter(sneaker=self.sneakers[0]).delete()
+        self.assertEqual(self.contains(), [self.sneakers[1].pk, self.sneakers[2].pk])
+    
+    def test_cascade_delete(self):
+        self.add(*self.sneakers[:2])
+        self.assertEqual(len(self.contains()), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Sneaker.objects.filter(pk=self.sneakers[0].pk).delete()
+        self.assertEqual(list(get_favorites(self.owner)), [self.sneakers[1].pk])
+    
+    def test_save_outside_api(self):
+        self.assertEqual(self.contains(), [])
+        self.add(self.sneakers[2])
+        self.assertEqual(self.contains(), [self.sneakers[2].pk])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SneakerBatchTests(TestCase):
+    """
+    Пакетное получение кроссовок: порядок запроса, отсутствующие ID и ошибки ввода.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.sneakers = create_sneakers(4)
+        Sneaker.objects.filter(pk=cls.sneakers[3].pk).update(available=False)
+    
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+    
+    def test_order_and_missing(self):
+        first, second, third, hidden = (sneaker.pk for sneaker in self.sneakers)
+        ids = [third, 999, first, hidden, third, second]
+        for response in (
+            self.client.get('/api/sneakers/batch/', {'ids': ','.join(map(str, ids))}),
+            self.client.post('/api/sneakers/batch/', {'ids': ids}, format='json'),
+        ):
+            self.assertEqual(response.status_code, 200, response.content)
+            data = response.json()
+            # Повторы схлопываются, недоступные кроссовки считаются отсутствующими
+            self.assertEqual([sneaker['id'] for sneaker in data['results']], [third, first, second])
+            self.assertEqual(data['missing'], [999, hidden])
+    
+    def test_max_batch_size(self):
+        ids = list(range(1, SneakerViewSet.max_batch_size + 2))
+        response = self.client.post('/api/sneakers/batch/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/sneakers/batch/', {'ids': ids[:-1]}, format='json')
+        self.assertEqual(response.status_code, 200)
+    
+    def test_malformed_input(self):
+        for body in ([1, 2], {'ids': 'a,b'}, {'ids': {'id': 1}}, {'ids': []}, {}, 'ids'):
+            response = self.client.post('/api/sneakers/batch/', body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(self.client.get('/api/sneakers/batch/').status_code, 400)
+        self.assertEqual(self.client.get('/api/sneakers/batch/', {'ids': '1,x'}).status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ListSerializerBenchmarkTests(TestCase):
+    """
+    Команда bench_list_serializer и колонки values() для быстрого пути списка.
+    """
+    
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_command_runs(self):
+        out = io.StringIO()
+        call_command('bench_list_serializer', rows=40, repeat=1, stdout=out)
+        self.assertIn('Ускорение', out.getvalue())
+    
+    def test_srcset_in_list(self):
+        variants = {'source': 'sneakers/a.jpg', 'webp': {'640': 'sneakers/a-640.webp', '320': 'sneakers/a-320.webp'}}
+        Sneaker.objects.bulk_create([
+            Sneaker(title='With image', slug='with-image', price=1, image='sneakers/a.jpg', image_variants=variants),
+        ])
+        clear_caches()
+        for params in ({}, {'fields': 'id,srcset'}, {'exclude': 'image_url,imageUrl'}):
+            response = APIClient().get('/api/sneakers/', params)
+            self.assertEqual(response.status_code, 200, response.content)
+            srcset = response.json()['results'][0]['srcset']['webp']
+            self.assertRegex(srcset, r'a-320\.webp 320w, .*a-640\.webp 640w$')
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    CATALOG_SNAPSHOT_BASE_URL='http://testserver',
+    CATALOG_SNAPSHOT_QUERIES=['', 'page=2'],
+)
+class CatalogSnapshotTests(TestCase):
+    """
+    Отдача снимков каталога middleware: сжатие, 304, устаревание и чужие пути.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        create_sneakers(15)
+    
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        settings_override = override_settings(CATALOG_SNAPSHOT_DIR=snapshot_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.manifest = build_snapshots()
+    
+    def test_served_from_snapshot(self):
+        response = self.client.get('/api/sneakers/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Disposition', response)
+        body = gzip.decompress(response.content)
+        self.assertEqual(json.loads(body)['count'], 15)
+        
+        response = self.client.get('/api/sneakers/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        
+        response = self.client.get('/api/sneakers/', {'page': 2})
+        self.assertEqual(response['ETag'], f'"{self.manifest["entries"]["page=2"]["etag"]}"')
+        self.assertNotIn('Content-Encoding', response)
+    
+    def test_stale_after_catalog_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Sneaker.objects.filter(pk=Sneaker.objects.first().pk).update(title='Renamed')
+        response = self.client.get('/api/sneakers/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('Renamed', response.content.decode())
+    
+    def test_other_paths_skip_manifest(self):
+        with mock.patch.object(manifest, 'current', wraps=manifest.current) as current:
+            self.client.get('/api/anonymous/cart/')
+            self.client.get('/api/sneakers/facets/')
+            self.assertFalse(current.called)
+            self.client.get('/api/sneakers/')
+            self.assertTrue(current.called)
+
+
+class CatalogCacheInvalidationTests(TestCase):
+    """
+    Кэш ответов каталога сбрасывается сменой поколения: при сохранении
+    и удалении кроссовок и при смене поколения другим процессом.
+    """
+    
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        # Общий кэш - файловый, как в settings: так его видят и другие процессы
+        settings_override = override_settings(CACHES={
+            **TEST_CACHES,
+            'shared': {'BACKEND': 'api.cache_backends.FileCache', 'LOCATION': cache_dir.name},
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.cache_dir = cache_dir.name
+        clear_caches()
+        self.client = APIClient()
+        self.sneaker = Sneaker.objects.create(title='Air max', slug='air-max', price=1)
+    
+    def titles(self):
+        response = self.client.get('/api/sneakers/')
+        self.assertEqual(response.status_code, 200)
+        return [sneaker['title'] for sneaker in response.json()['results']]
+    
+    def test_save_and_delete(self):
+        self.assertEqual(self.titles(), ['Air max'])
+        self.assertEqual(self.client.get(f'/api/sneakers/{self.sneaker.pk}/').json()['title'], 'Air max')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sneaker.title = 'Dunk low'
+            self.sneaker.save()
+        self.assertEqual(self.titles(), ['Dunk low'])
+        self.assertEqual(self.client.get(f'/api/sneakers/{self.sneaker.pk}/').json()['title'], 'Dunk low')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sneaker.delete()
+        self.assertEqual(self.titles(), [])
+        self.assertEqual(self.client.get(f'/api/sneakers/{self.sneaker.pk}/').status_code, 404)
+    
+    def test_generation_changed_by_other_process(self):
+        self.assertEqual(self.titles(), ['Air max'])
+        # Другой процесс меняет данные и поколение; ответ этого процесса в LRU устарел
+        Sneaker.objects.filter(pk=self.sneaker.pk).update(title='Dunk low')
+        self.assertEqual(self.titles(), ['Air max'])
+        FileCache(self.cache_dir, {}).set(GENERATION_KEY, time_ns(), None)
+        self.assertEqual(self.titles(), ['Dunk low'])
+    
+    def test_bumps_are_unique(self):
+        generations = {get_catalog_generation()}
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                bump_catalog_generation()
+            generations.add(get_catalog_generation())
+        self.assertEqual(len(generations), 4)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FastListSerializerTests(TestCase):
+    """
+    Быстрый путь списка (SneakerFastListSerializer) совпадает с построчной
+    сериализацией SneakerListSerializer.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        variants = {'source': 'sneakers/a.jpg', 'webp': {'320': 'sneakers/a-320.webp', '640': 'sneakers/a-640.webp'}}
+        Sneaker.objects.bulk_create([
+            Sneaker(title='Variants', slug='variants', price=Decimal('9990.50'), image='sneakers/a.jpg', image_variants=variants),
+            Sneaker(title='Image only', slug='image-only', price=Decimal('1.00'), image='sneakers/b.png'),
+            Sneaker(title='External', slug='external', price=Decimal('15'), image_url='https://cdn.example.com/c.jpg'),
+            Sneaker(title='No image', slug='no-image', price=Decimal('0.99'), available=False),
+        ])
+    
+    def serialize_both(self, params):
+        request = Request(APIRequestFactory().get('/api/sneakers/', params))
+        context = {'request': request}
+        queryset = Sneaker.objects.order_by('pk')
+        standard = [SneakerListSerializer(context=context).to_representation(obj) for obj in queryset]
+        fast = SneakerListSerializer(queryset, many=True, context=context).data
+        from_instances = SneakerListSerializer(list(queryset), many=True, context=context).data
+        return standard, list(fast), list(from_instances)
+    
+    def test_same_output(self):
+        for params in (
+            {},
+            {'fields': 'id,title,price'},
+            {'fields': 'srcset,imageUrl'},
+            {'exclude': 'srcset,image_url'},
+            {'exclude': 'price', 'fields': 'id,price,available'},
+        ):
+            standard, fast, from_instances = self.serialize_both(params)
+            self.assertEqual(fast, standard, params)
+            self.assertEqual(from_instances, standard, params)
+            # Ключи в том же порядке, что у обычного сериализатора
+            self.assertEqual([list(row) for row in fast], [list(row) for row in standard], params)
+    
+    def test_image_rows(self):
+        standard, fast, _ = self.serialize_both({})
+        self.assertEqual(fast, standard)
+        variants, image_only, external, no_image = fast
+        self.assertIn('a-320.webp 320w', variants['srcset']['webp'])
+        self.assertTrue(image_only['image_url'].endswith('sneakers/b.png'))
+        self.assertEqual(image_only['srcset'], {})
+        self.assertEqual(external['image_url'], 'https://cdn.example.com/c.jpg')
+        self.assertIsNone(no_image['image_url'])
+        self.assertEqual(variants['price'], '9990.50')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FacetsTests(TestCase):
+    """
+    Фасеты каталога: гистограмма цен и наличие одним агрегатным запросом.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        sneakers = Sneaker.objects.bulk_create([
+            Sneaker(title=f'Runner {price}', slug=f'runner-{price}', price=Decimal(price))
+            for price in range(10, 101, 10)
+        ] + [Sneaker(title='Hidden', slug='hidden', price=Decimal('500'), available=False)])
+        get_search_backend().index_many(sneakers)
+    
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+    
+    def get_facets(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/sneakers/facets/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(queries), 1)
+        return response.json()
+    
+    def test_histogram(self):
+        data = self.get_facets(buckets=3)
+        self.assertEqual(data['price'], {
+            'min': '10.00',
+            'max': '100.00',
+            'histogram': [
+                {'min': '10.00', 'max': '40.00', 'count': 3},
+                {'min': '40.00', 'max': '70.00', 'count': 3},
+                {'min': '70.00', 'max': '100.00', 'count': 4},
+            ],
+        })
+        self.assertEqual(data['availability'], {'available': 10, 'unavailable': 1})
+        self.assertEqual(data['count'], 10)
+    
+    def test_filters(self):
+        data = self.get_facets(buckets=2, min_price='50', max_price='55.5')
+        self.assertEqual([bucket['count'] for bucket in data['price']['histogram']], [1])
+        self.assertEqual(data['price']['min'], data['price']['max'])
+        
+        data = self.get_facets(min_price='1000')
+        self.assertEqual(data['price'], {'min': None, 'max': None, 'histogram': []})
+        
+        data = self.get_facets(search='runner', buckets=2)
+        self.assertEqual([bucket['count'] for bucket in data['price']['histogram']], [5, 5])
+    
+    def test_invalid_price(self):
+        for params in ({'min_price': 'abc'}, {'max_price': 'NaN'}, {'min_price': 'Infinity'}):
+            for url in ('/api/sneakers/facets/', '/api/sneakers/'):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400, (url, params))
+                self.assertIn(next(iter(params)), response.json())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FeedTests(TestCase):
+    """
+    Выгрузка каталога: отсутствующие товары помечены availability=out of stock.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.sneakers = create_sneakers(3)
+        Sneaker.objects.filter(pk=cls.sneakers[1].pk).update(available=False)
+    
+    def get_feed(self, **params):
+        response = APIClient().get('/api/sneakers/feed/', params)
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content)
+        if params.get('gzip'):
+            body = gzip.decompress(body)
+        return body.decode('utf-8')
+    
+    def test_csv_availability(self):
+        rows = list(csv.DictReader(io.StringIO(self.get_feed(feed_format='csv'))))
+        self.assertEqual(
+            [(int(row['id']), row['availability']) for row in rows],
+            [(self.sneakers[0].pk, 'in stock'), (self.sneakers[1].pk, 'out of stock'), (self.sneakers[2].pk, 'in stock')],
+        )
+    
+    def test_ndjson_availability(self):
+        rows = [json.loads(line) for line in self.get_feed(gzip='1').splitlines()]
+        self.assertEqual([row['availability'] for row in rows], ['in stock', 'out of stock', 'in stock'])
+        self.assertEqual([row['available'] for row in rows], [True, False, True])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MediaGarbageCollectionTests(TestCase):
+    """
+    Поиск и удаление файлов без ссылок: сверка с базой пакетами, свежие файлы не трогаются.
+    """
+    
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.storage = FileSystemStorage(location=media.name)
+        old = (time_ns() // 10 ** 9) - 7200
+        for name in (
+            'sneakers/used.jpg', 'sneakers/derivatives/used-320w.webp',
+            'sneakers/orphan.jpg', 'sneakers/derivatives/orphan-320w.webp',
+            'sneakers/fresh.jpg',
+        ):
+            self.storage.save(name, ContentFile(b'data'))
+            if name != 'sneakers/fresh.jpg':
+                os.utime(self.storage.path(name), (old, old))
+        Sneaker.objects.bulk_create([Sneaker(
+            title='Used', slug='used', price=1, image='sneakers/used.jpg',
+            image_variants={'source': 'sneakers/used.jpg', 'webp': {'320': 'sneakers/derivatives/used-320w.webp'}},
+        )])
+    
+    def test_find_orphans_in_batches(self):
+        # Не больше двух запросов на пакет: изображения и уменьшенные копии
+        with self.assertNumQueries(5):
+            orphans = sorted(find_orphans(self.storage, batch_size=2))
+        self.assertEqual(orphans, [('sneakers/derivatives/orphan-320w.webp', 4), ('sneakers/orphan.jpg', 4)])
+    
+    def test_delete_orphans(self):
+        deleted, reclaimed = delete_orphans(self.storage, find_orphans(self.storage))
+        self.assertEqual((deleted, reclaimed), (2, 8))
+        self.assertTrue(self.storage.exists('sneakers/used.jpg'))
+        self.assertTrue(self.storage.exists('sneakers/derivatives/used-320w.webp'))
+        self.assertTrue(self.storage.exists('sneakers/fresh.jpg'))
+        self.assertFalse(self.storage.exists('sneakers/orphan.jpg'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AnonymousLegacyImportTests(TestCase):
+    """
+    Перенос корзины и избранного из строк старой сессии: запросы к базе
+    только для сессии, которую еще не проверяли.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.sneakers = create_sneakers(2)
+    
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+    
+    def check(self, sneaker, legacy_queries=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/anonymous/favorites/check/', {'sneaker_id': sneaker.pk})
+        self.assertEqual(response.status_code, 200)
+        if legacy_queries is not None:
+            # Сессию Django читает аутентификация DRF, здесь считаем только поиск старых строк
+            tables = ('"api_cartitem"', '"api_favorite"')
+            found = [query['sql'] for query in queries if any(table in query['sql'] for table in tables)]
+            self.assertEqual(len(found), legacy_queries, found)
+        return response.json()['is_favorite']
+    
+    def test_no_queries_without_legacy_session(self):
+        with self.assertNumQueries(0):
+            self.assertFalse(self.check(self.sneakers[0]))
+        
+        # Посетитель уже пользуется новым хранилищем
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'legacy-session'
+        self.client.cookies[get_anonymous_store().cookie_name] = 'token'
+        self.assertFalse(self.check(self.sneakers[0], legacy_queries=0))
+    
+    def test_session_without_rows_is_checked_once(self):
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'legacy-session'
+        self.assertFalse(self.check(self.sneakers[0], legacy_queries=2))
+        self.assertFalse(self.check(self.sneakers[0], legacy_queries=0))
+    
+    def test_import_and_drop(self):
+        Favorite.objects.create(session_id='legacy-session', sneaker=self.sneakers[1])
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'legacy-session'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.check(self.sneakers[1]))
+        self.assertFalse(Favorite.objects.exists())
+        self.assertIn(get_anonymous_store().cookie_name, self.client.cookies)
+        self.assertTrue(self.check(self.sneakers[1]))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ImportSneakersTests(TestCase):
+    """
+    Команда import_sneakers: пакетная вставка, уникальные slug и пропуск битых строк.
+    """
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+    
+    def run_import(self, name, content, **options):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(content)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_sneakers', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+    
+    def test_csv(self):
+        Sneaker.objects.create(title='Air Max', slug='air-max', price=1)
+        out, err = self.run_import('catalog.csv', (
+            'title,price,available,description\n'
+            'Air Max,100.50,да,Classic\n'
+            'Air Max,120,0,\n'
+            ',10,1,\n'
+            'Dunk,not-a-price,1,\n'
+            'Dunk,99,,Suede\n'
+        ), batch_size=2)
+        self.assertIn('Импортировано: 3, пропущено: 2', out)
+        self.assertIn('Строка 4', err)
+        self.assertIn('Строка 5', err)
+        
+        imported = Sneaker.objects.exclude(slug='air-max').order_by('pk')
+        self.assertEqual(
+            [(s.title, s.price, s.available, s.description) for s in imported],
+            [('Air Max', Decimal('100.50'), True, 'Classic'), ('Air Max', Decimal('120'), False, None),
+             ('Dunk', Decimal('99'), True, 'Suede')],
+        )
+        slugs = list(Sneaker.objects.values_list('slug', flat=True))
+        self.assertEqual(len(slugs), len(set(slugs)))
+        self.assertIn('dunk', slugs)
+        if isinstance(get_search_backend(), SQLiteFTSBackend):
+            self.assertEqual(get_search_backend().search(Sneaker.objects.all(), 'suede').get().title, 'Dunk')
+    
+    def test_jsonl_bad_lines(self):
+        out, err = self.run_import('catalog.jsonl', '\n'.join([
+            '{"title": "Runner", "price": "10", "slug": "custom-slug"}',
+            '{"title": "Broken", ',
+            '[1, 2]',
+            '"just a string"',
+            '{"title": "No price"}',
+            '',
+            '{"title": "Trail", "price": 20, "available": false}',
+        ]))
+        self.assertIn('Импортировано: 2, пропущено: 4', out)
+        self.assertEqual(err.count('пропущена'), 4)
+        self.assertEqual(
+            list(Sneaker.objects.order_by('pk').values_list('title', 'slug', 'available')),
+            [('Runner', 'custom-slug', True), ('Trail', 'trail', False)],
+        )
+    
+    def test_invalid_options(self):
+        with self.assertRaises(CommandError):
+            self.run_import('catalog.csv', 'title,price\nA,1\n', batch_size=0)
+        with self.assertRaises(CommandError):
+            self.run_import('catalog.txt', 'title,price\nA,1\n')
+        self.assertFalse(Sneaker.objects.exists())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SparseFieldsetsTests(TestCase):
+    """
+    ?fields= и ?exclude=: состав ответа, вложенные поля через точку и сужение SELECT.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='password')
+        cls.sneakers = create_sneakers(2, description='Описание')
+        cls.cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.upsert(cls.cart, {sneaker.pk: 2 for sneaker in cls.sneakers})
+        Favorite.objects.create(user=cls.user, sneaker=cls.sneakers[0])
+        cls.order = Order.objects.create(
+            user=cls.user, first_name='Иван', last_name='Иванов', email='buyer@example.com',
+            phone='+70000000000', address='Москва', total_price=Decimal('21.00'),
+        )
+        OrderItem.objects.create(order=cls.order, sneaker=cls.sneakers[0], price=cls.sneakers[0].price, quantity=2)
+    
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), ' '.join(query['sql'] for query in queries)
+    
+    def test_sneaker_fields(self):
+        data, sql = self.get(f'/api/sneakers/{self.sneakers[0].pk}/?fields=id,title')
+        self.assertEqual(data, {'id': self.sneakers[0].pk, 'title': 'Sneaker 0'})
+        self.assertNotIn('"description"', sql)
+    
+    def test_sneaker_exclude(self):
+        data, _ = self.get(f'/api/sneakers/{self.sneakers[0].pk}/?exclude=description,image')
+        self.assertIn('title', data)
+        self.assertNotIn('description', data)
+        self.assertNotIn('image', data)
+    
+    def test_cart_nested(self):
+        data, sql = self.get('/api/cart/?fields=id,items.quantity,items.sneaker.title')
+        self.assertEqual(set(data), {'id', 'items'})
+        self.assertEqual(
+            sorted(data['items'], key=lambda item: item['sneaker']['title']),
+            [{'quantity': 2, 'sneaker': {'title': 'Sneaker 0'}}, {'quantity': 2, 'sneaker': {'title': 'Sneaker 1'}}],
+        )
+        self.assertNotIn('"description"', sql)
+    
+    def test_cart_nested_exclude(self):
+        data, _ = self.get('/api/cart/?exclude=items.sneaker.description,version')
+        self.assertNotIn('version', data)
+        self.assertEqual(len(data['items']), 2)
+        for item in data['items']:
+            self.assertIn('title', item['sneaker'])
+            self.assertNotIn('description', item['sneaker'])
+    
+    def test_favorites_nested(self):
+        data, _ = self.get('/api/favorites/?fields=sneaker.id,sneaker.title')
+        self.assertEqual(data, [{'sneaker': {'id': self.sneakers[0].pk, 'title': 'Sneaker 0'}}])
+    
+    def test_orders(self):
+        data, sql = self.get('/api/orders/?fields=id,total_price')
+        self.assertEqual(data['results'], [{'id': self.order.pk, 'total_price': '21.00'}])
+        self.assertNotIn('"address"', sql)
+        
+        data, _ = self.get(f'/api/orders/{self.order.pk}/?fields=id,items.quantity,items.sneaker.title')
+        self.assertEqual(data, {'id': self.order.pk, 'items': [{'quantity': 2, 'sneaker': {'title': 'Sneaker 0'}}]})
+
+
+class ContentAddressedMediaTests(TestCase):
+    """
+    Загрузки с хэшем содержимого в имени: дедупликация, Range, ETag и immutable.
+    """
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.storage = ContentAddressedStorage(location=self.root)
+        self.content = bytes(range(256)) * 4
+        self.name = self.storage.save('sneakers/photo.JPG', ContentFile(self.content))
+        settings_override = override_settings(MEDIA_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+    
+    def get(self, name, **headers):
+        response = self.client.get(f'/media/{name}', headers=headers)
+        self.addCleanup(response.close)
+        return response
+    
+    def test_hashed_name_dedup(self):
+        digest = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(self.name, f'sneakers/{digest}.jpg')
+        self.assertTrue(is_content_addressed(self.name))
+        self.assertEqual(self.storage.save('sneakers/other.jpg', ContentFile(self.content)), self.name)
+        self.assertEqual(os.listdir(os.path.join(self.root, 'sneakers')), [f'{digest}.jpg'])
+        self.assertNotEqual(self.storage.save('sneakers/photo.jpg', ContentFile(b'other')), self.name)
+    
+    def test_full_response(self):
+        response = self.get(self.name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['ETag'], f'"{os.path.splitext(os.path.basename(self.name))[0]}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+    
+    def test_not_modified(self):
+        etag = self.get(self.name)['ETag']
+        response = self.get(self.name, if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+    
+    def test_range(self):
+        response = self.get(self.name, range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        
+        response = self.get(self.name, range='bytes=-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+        
+        # If-Range с чужим ETag: диапазон игнорируется
+        response = self.get(self.name, range='bytes=10-19', if_range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+    
+    def test_unsatisfiable_range(self):
+        response = self.get(self.name, range=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+    
+    def test_plain_name_revalidated(self):
+        with open(os.path.join(self.root, 'plain.txt'), 'wb') as fh:
+            fh.write(b'plain')
+        response = self.get('plain.txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], DEFAULT_CACHE_CONTROL)
+        self.assertEqual(self.get('../plain.txt').status_code, 404)
+        self.assertEqual(self.get('missing.txt').status_code, 404)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PurgeAnonymousTests(TestCase):
+    """
+    Удаление корзин и избранного анонимных посетителей с истекшей сессией.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='password')
+        cls.sneakers = create_sneakers(2)
+        now = timezone.now()
+        Session.objects.create(session_key='live', session_data='', expire_date=now + timedelta(days=1))
+        Session.objects.create(session_key='expired', session_data='', expire_date=now - timedelta(days=1))
+        for session_id in ('live', 'expired', 'gone', 'vanished'):
+            cart = Cart.objects.create(session_id=session_id)
+            CartItem.objects.upsert(cart, {sneaker.pk: 1 for sneaker in cls.sneakers})
+            Favorite.objects.create(session_id=session_id, sneaker=cls.sneakers[0])
+        Cart.objects.create(user=cls.user)
+        Favorite.objects.create(user=cls.user, sneaker=cls.sneakers[0])
+    
+    def setUp(self):
+        clear_caches()
+    
+    def purge(self, *args):
+        out = io.StringIO()
+        call_command('purge_anonymous', *args, stdout=out)
+        return out.getvalue()
+    
+    def remaining(self):
+        return (
+            sorted(Cart.objects.values_list('session_id', flat=True), key=str),
+            sorted(Favorite.objects.values_list('session_id', flat=True), key=str),
+        )
+    
+    def test_db_sessions(self):
+        out = self.purge('--batch-size', '2')
+        self.assertIn('Удалено строк: 12', out)
+        self.assertEqual(self.remaining(), ([None, 'live'], [None, 'live']))
+        self.assertEqual(CartItem.objects.count(), 2)
+        # Повторный запуск ничего не находит
+        self.assertIn('Удалено строк: 0', self.purge())
+    
+    def test_dry_run(self):
+        out = self.purge('--dry-run')
+        self.assertIn(f'{Cart._meta.verbose_name_plural}: 3', out)
+        self.assertIn(f'{Favorite._meta.verbose_name_plural}: 3', out)
+        self.assertEqual(Cart.objects.count(), 5)
+    
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies', SESSION_COOKIE_AGE=3600)
+    def test_cookie_sessions_by_age(self):
+        stale = timezone.now() - timedelta(hours=2)
+        Cart.objects.filter(session_id__in=['expired', 'gone']).update(updated_at=stale)
+        Favorite.objects.filter(session_id='gone').update(added_at=stale)
+        self.purge()
+        self.assertEqual(self.remaining(), (
+            [None, 'live', 'vanished'], [None, 'expired', 'live', 'vanished'],
+        ))
+    
+    def test_batches(self):
+        queryset = Cart.objects.filter(session_id__in=['gone', 'vanished'])
+        with CaptureQueriesContext(connection) as queries:
+            removed = purge_queryset(queryset, batch_size=1)
+        self.assertEqual(removed, {'api.Cart': 2, 'api.CartItem': 4})
+        # Каждый пакет в своей транзакции; последняя выборка ID пустая
+        savepoints = [query for query in queries if query['sql'].startswith('SAVEPOINT')]
+        batches = [query for query in queries if query['sql'].endswith('LIMIT 1')]
+        self.assertEqual((len(savepoints), len(batches)), (3, 3))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CartTotalsTests(TestCase):
+    """
+    Хранимые итоги корзины: пересчет при изменении позиций, цен и удалении кроссовок.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='password')
+        cls.sneakers = create_sneakers(3)
+    
+    def setUp(self):
+        clear_caches()
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.upsert(self.cart, {self.sneakers[0].pk: 2, self.sneakers[1].pk: 1})
+        Cart.objects.filter(pk=self.cart.pk).bump_version()
+    
+    def totals(self):
+        self.cart.refresh_from_db(fields=['items_count', 'total_price'])
+        return self.cart.items_count, self.cart.total_price
+    
+    def test_bump_version(self):
+        # 2 * 10.50 + 11.50
+        self.assertEqual(self.totals(), (3, Decimal('32.50')))
+        
+        client = APIClient()
+        client.force_authenticate(self.user)
+        data = client.get('/api/cart/').json()
+        self.assertEqual((data['items_count'], Decimal(str(data['total_price']))), (3, Decimal('32.50')))
+    
+    def test_price_change(self):
+        sneaker = Sneaker.objects.get(pk=self.sneakers[0].pk)
+        sneaker.price = Decimal('20.00')
+        sneaker.save()
+        self.assertEqual(self.totals(), (3, Decimal('51.50')))
+        
+        Sneaker.objects.filter(pk=self.sneakers[1].pk).update(price=Decimal('1.00'))
+        self.assertEqual(self.totals(), (3, Decimal('41.00')))
+        
+        sneaker.price = Decimal('5.00')
+        Sneaker.objects.bulk_update([sneaker], ['price'])
+        self.assertEqual(self.totals(), (3, Decimal('11.00')))
+    
+    def test_unchanged_price_skips_refresh(self):
+        sneaker = Sneaker.objects.get(pk=self.sneakers[0].pk)
+        sneaker.title = 'Renamed'
+        with CaptureQueriesContext(connection) as queries:
+            sneaker.save()
+        self.assertFalse(any('UPDATE "api_cart" ' in query['sql'] for query in queries))
+    
+    def test_sneaker_delete(self):
+        Sneaker.objects.get(pk=self.sneakers[0].pk).delete()
+        self.assertEqual(self.totals(), (1, Decimal('11.50')))
+        
+        Sneaker.objects.filter(pk=self.sneakers[1].pk).delete()
+        self.assertEqual(self.totals(), (0, Decimal('0.00')))
+    
+    def test_check_cart_totals(self):
+        Cart.objects.filter(pk=self.cart.pk).update(items_count=99, total_price=Decimal('1.00'))
+        
+        out = io.StringIO()
+        call_command('check_cart_totals', '--dry-run', stdout=out)
+        self.assertIn(f'Корзина {self.cart.pk}: товаров 99 вместо 3', out.getvalue())
+        self.assertIn('Корзин с расхождениями: 1', out.getvalue())
+        self.assertEqual(self.totals(), (99, Decimal('1.00')))
+        
+        out = io.StringIO()
+        call_command('check_cart_totals', stdout=out)
+        self.assertIn('Исправлено корзин: 1', out.getvalue())
+        self.assertEqual(self.totals(), (3, Decimal('32.50')))
+        
+        out = io.StringIO()
+        call_command('check_cart_totals', '--dry-run', stdout=out)
+        self.assertIn('Корзин с расхождениями: 0', out.getvalue())
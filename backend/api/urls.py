@@ -22,11 +22,13 @@ urlpatterns = [
     path('cart/update/', CartViewSet.as_view({'post': 'update_item'}), name='cart-update'),
     path('cart/remove/', CartViewSet.as_view({'post': 'remove_item'}), name='cart-remove'),
     path('cart/clear/', CartViewSet.as_view({'post': 'clear'}), name='cart-clear'),
+    path('cart/items/', CartViewSet.as_view({'post': 'update_items'}), name='cart-items'),
     
     path('favorites/', FavoriteViewSet.as_view({'get': 'list'}), name='favorites'),
     path('favorites/add/', FavoriteViewSet.as_view({'post': 'add'}), name='favorites-add'),
     path('favorites/remove/', FavoriteViewSet.as_view({'post': 'remove'}), name='favorites-remove'),
     path('favorites/check/', FavoriteViewSet.as_view({'get': 'check'}), name='favorites-check'),
+    path('favorites/contains/', FavoriteViewSet.as_view({'get': 'contains', 'post': 'contains'}), name='favorites-contains'),
     
     # Маршруты для анонимных пользователей
     path('anonymous/cart/', AnonymousCartViewSet.as_view({'get': 'list'}), name='anonymous-cart'),
@@ -34,11 +36,17 @@ urlpatterns = [
     path('anonymous/cart/update/', AnonymousCartViewSet.as_view({'post': 'update_item'}), name='anonymous-cart-update'),
     path('anonymous/cart/remove/', AnonymousCartViewSet.as_view({'post': 'remove_item'}), name='anonymous-cart-remove'),
     path('anonymous/cart/clear/', AnonymousCartViewSet.as_view({'post': 'clear'}), name='anonymous-cart-clear'),
+    path('anonymous/cart/items/', AnonymousCartViewSet.as_view({'post': 'update_items'}), name='anonymous-cart-items'),
     
     path('anonymous/favorites/', AnonymousFavoriteViewSet.as_view({'get': 'list'}), name='anonymous-favorites'),
     path('anonymous/favorites/add/', AnonymousFavoriteViewSet.as_view({'post': 'add'}), name='anonymous-favorites-add'),
     path('anonymous/favorites/remove/', AnonymousFavoriteViewSet.as_view({'post': 'remove'}), name='anonymous-favorites-remove'),
     path('anonymous/favorites/check/', AnonymousFavoriteViewSet.as_view({'get': 'check'}), name='anonymous-favorites-check'),
+    path(
+        'anonymous/favorites/contains/',
+        AnonymousFavoriteViewSet.as_view({'get': 'contains', 'post': 'contains'}),
+        name='anonymous-favorites-contains'
+    ),
     
     # Маршруты для аутентификации (используем djoser)
     path('auth/', include('djoser.urls')),
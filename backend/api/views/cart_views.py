@@ -1,8 +1,33 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils.http import parse_etags
+from api.anonymous_store import AnonymousCart, get_anonymous_state
+from api.cache import get_catalog_generation
 from api.models import Cart, CartItem, Sneaker
-from api.serializers.cart_serializers import CartSerializer, CartItemCreateSerializer, CartItemUpdateSerializer
+from api.serializers.cart_serializers import (
+    CartSerializer, CartItemCreateSerializer, CartItemUpdateSerializer, CartItemsBulkSerializer
+)
+from api.serializers.mixins import apply_sparse_only
+
+
+class CartVersionMismatch(Exception):
+    """
+    Версия корзины не совпала с заголовком If-Match.
+    """
+
+
+def prefers_minimal(request):
+    """
+    Клиент попросил короткий ответ на изменение (Prefer: return=minimal).
+    """
+    preferences = request.headers.get('Prefer', '')
+    return any(
+        item.split(';')[0].strip().lower() == 'return=minimal'
+        for item in preferences.split(',')
+    )
 
 
 class BaseCartViewSet(viewsets.ViewSet):
@@ -10,9 +35,171 @@ class BaseCartViewSet(viewsets.ViewSet):
     Базовый ViewSet с общей функциональностью для работы с корзиной.
     """
     
+    # Колонки элемента корзины, нужные для prefetch при любом ?fields=
+    cart_item_only = ['cart']
+    
     def get_serializer_context(self):
         return {'request': self.request}
     
+    def get_cart_lookup(self, request):
+        """
+        Условие поиска корзины текущего пользователя (реализуется в наследниках).
+        """
+        raise NotImplementedError
+    
+    def get_cart(self, request):
+        """
+        Получаем или создаем корзину текущего пользователя.
+        """
+        cart, _ = Cart.objects.get_or_create(**self.get_cart_lookup(request))
+        return cart
+    
+    def get_cart_for_read(self, request):
+        """
+        Корзина вместе с хранимыми итогами одним запросом к одной строке.
+        """
+        cart = Cart.objects.filter(**self.get_cart_lookup(request)).first()
+        if cart is None:
+            cart = self.get_cart(request)
+        return cart
+    
+    def add_to_cart(self, cart, quantities, increment=True):
+        """
+        Добавляет товары ({sneaker_id: количество}) или задает их количество.
+        """
+        CartItem.objects.upsert(cart, quantities, increment=increment)
+    
+    def set_cart_quantity(self, cart, sneaker_id, quantity):
+        """
+        Меняет количество товара в корзине (0 - удаляет) и возвращает число измененных позиций.
+        """
+        items = CartItem.objects.filter(cart=cart, sneaker_id=sneaker_id)
+        if quantity <= 0:
+            changed, _ = items.delete()
+        else:
+            changed = items.update(quantity=quantity)
+        return changed
+    
+    def remove_from_cart(self, cart, sneaker_ids):
+        """
+        Удаляет товары из корзины и возвращает число удаленных позиций.
+        """
+        deleted, _ = CartItem.objects.filter(cart=cart, sneaker_id__in=sneaker_ids).delete()
+        return deleted
+    
+    def clear_cart(self, cart):
+        CartItem.objects.filter(cart=cart).delete()
+    
+    def get_cart_totals(self, cart, sneaker_ids):
+        """
+        Итоги корзины и количество указанных товаров для короткого ответа.
+        """
+        quantities = dict(
+            CartItem.objects.filter(cart=cart, sneaker_id__in=sneaker_ids).values_list('sneaker_id', 'quantity')
+        ) if sneaker_ids else {}
+        return cart.total_price or 0, cart.items_count, quantities
+    
+    def handle_exception(self, exc):
+        if isinstance(exc, CartVersionMismatch):
+            return Response(
+                {'error': 'Корзина была изменена, версия не совпадает с If-Match'},
+                status=status.HTTP_412_PRECONDITION_FAILED
+            )
+        return super().handle_exception(exc)
+    
+    def get_cart_etag(self, cart):
+        """
+        ETag корзины: id, версия и поколение каталога
+        (цены и описания кроссовок тоже входят в ответ).
+        """
+        return f'"{cart.pk}-{cart.version}-{get_catalog_generation()}"'
+    
+    def get_if_match_versions(self, request, cart):
+        """
+        Версии корзины из заголовка If-Match или None, если проверять нечего.
+        """
+        header = request.headers.get('If-Match')
+        if not header:
+            return None
+        etags = parse_etags(header)
+        if etags == ['*']:
+            return None
+        versions = []
+        for etag in etags:
+            parts = etag.removeprefix('W/').strip('"').split('-')
+            if len(parts) >= 2 and parts[0] == str(cart.pk) and parts[1].isdigit():
+                versions.append(int(parts[1]))
+        return versions
+    
+    def bump_cart_version(self, request, cart):
+        """
+        Увеличивает версию корзины и пересчитывает ее итоги после изменения;
+        вызывается внутри транзакции.
+        
+        При несовпадении с If-Match бросает CartVersionMismatch, и вся
+        транзакция вместе с изменением откатывается.
+        """
+        carts = Cart.objects.filter(pk=cart.pk)
+        expected = self.get_if_match_versions(request, cart)
+        if expected is not None:
+            if not carts.bump_version(expected):
+                raise CartVersionMismatch()
+        else:
+            carts.bump_version()
+        cart.refresh_from_db(fields=['version', 'items_count', 'total_price'])
+    
+    def get_cart_response(self, request, cart):
+        """
+        Ответ на GET корзины с ETag; 304, если клиент прислал актуальный If-None-Match.
+        """
+        etag = self.get_cart_etag(cart)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(self.get_cart_data(cart), headers=headers)
+    
+    def get_mutation_response(self, request, cart, sneaker_ids=()):
+        """
+        Ответ на изменение корзины: вся корзина или, при Prefer: return=minimal,
+        только измененные позиции, новые итоги и версия.
+        """
+        if not prefers_minimal(request):
+            return Response(self.get_cart_data(cart), headers={'ETag': self.get_cart_etag(cart)})
+        
+        total_price, items_count, quantities = self.get_cart_totals(cart, sneaker_ids)
+        data = {
+            'id': cart.pk,
+            # Удаленные позиции возвращаются с нулевым количеством
+            'items': [
+                {'sneaker': sneaker_id, 'quantity': quantities.get(sneaker_id, 0)}
+                for sneaker_id in sneaker_ids
+            ],
+            'total_price': total_price,
+            'items_count': items_count,
+            'version': cart.version,
+        }
+        return Response(data, headers={
+            'ETag': self.get_cart_etag(cart),
+            'Preference-Applied': 'return=minimal',
+        })
+    
+    def get_cart_data(self, cart):
+        """
+        Сериализует корзину за постоянное число запросов: элементы
+        с кроссовками загружаются одним prefetch-запросом (при ?fields= -
+        только нужные колонки), итоги хранятся в самой корзине.
+        """
+        serializer = CartSerializer(cart, context=self.get_serializer_context())
+        fields = serializer.fields
+        items_field = fields.get('items')
+        if items_field is not None:
+            items = apply_sparse_only(
+                CartItem.objects.select_related('sneaker'), items_field.child, extra=self.cart_item_only
+            )
+            prefetch_related_objects([cart], Prefetch('items', queryset=items))
+        return serializer.data
+    
     @action(detail=False, methods=['post'])
     def add_item(self, request):
         """
@@ -25,19 +212,12 @@ class BaseCartViewSet(viewsets.ViewSet):
             sneaker = serializer.validated_data['sneaker']
             quantity = serializer.validated_data.get('quantity', 1)
             
-            # Проверяем, есть ли уже такой товар в корзине
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                sneaker=sneaker,
-                defaults={'quantity': quantity}
-            )
-            
-            # Если товар уже есть, обновляем количество
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
+            # Добавляем товар или увеличиваем его количество одним атомарным запросом
+            with transaction.atomic():
+                self.add_to_cart(cart, {sneaker.pk: quantity})
+                self.bump_cart_version(request, cart)
             
-            return Response(CartSerializer(cart).data)
+            return self.get_mutation_response(request, cart, [sneaker.pk])
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -53,21 +233,17 @@ class BaseCartViewSet(viewsets.ViewSet):
             sneaker_id = serializer.validated_data['sneaker_id']
             quantity = serializer.validated_data['quantity']
             
-            try:
-                cart_item = CartItem.objects.get(cart=cart, sneaker_id=sneaker_id)
-                
-                if quantity <= 0:
-                    cart_item.delete()
-                else:
-                    cart_item.quantity = quantity
-                    cart_item.save()
-                
-                return Response(CartSerializer(cart).data)
-            except CartItem.DoesNotExist:
+            with transaction.atomic():
+                changed = self.set_cart_quantity(cart, sneaker_id, quantity)
+                if changed:
+                    self.bump_cart_version(request, cart)
+            
+            if not changed:
                 return Response(
                     {'error': 'Товар не найден в корзине'},
                     status=status.HTTP_404_NOT_FOUND
                 )
+            return self.get_mutation_response(request, cart, [sneaker_id])
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -84,17 +260,54 @@ class BaseCartViewSet(viewsets.ViewSet):
                 {'error': 'Необходимо указать ID товара'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
         try:
-            cart_item = CartItem.objects.get(cart=cart, sneaker_id=sneaker_id)
-            cart_item.delete()
-            
-            return Response(CartSerializer(cart).data)
-        except CartItem.DoesNotExist:
+            sneaker_id = int(sneaker_id)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'Некорректный ID товара'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        with transaction.atomic():
+            deleted = self.remove_from_cart(cart, [sneaker_id])
+            if deleted:
+                self.bump_cart_version(request, cart)
+        
+        if not deleted:
             return Response(
                 {'error': 'Товар не найден в корзине'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        
+        return self.get_mutation_response(request, cart, [sneaker_id])
+    
+    @action(detail=False, methods=['post'])
+    def update_items(self, request):
+        """
+        Добавление или установка количества нескольких товаров одним запросом.
+        
+        Тело: {"items": [{"sneaker": 1, "quantity": 2}, ...], "mode": "add" | "set"}.
+        Все изменения выполняются в одной транзакции.
+        """
+        cart = self.get_cart(request)
+        serializer = CartItemsBulkSerializer(data=request.data)
+        
+        if serializer.is_valid():
+            quantities = serializer.validated_data['quantities']
+            increment = serializer.validated_data['mode'] == 'add'
+            # В режиме set нулевое количество удаляет товар, в режиме add ничего не меняет
+            removed = [] if increment else [sneaker_id for sneaker_id, quantity in quantities.items() if not quantity]
+            quantities = {sneaker_id: quantity for sneaker_id, quantity in quantities.items() if quantity}
+            
+            with transaction.atomic():
+                if removed:
+                    self.remove_from_cart(cart, removed)
+                self.add_to_cart(cart, quantities, increment=increment)
+                self.bump_cart_version(request, cart)
+            
+            return self.get_mutation_response(request, cart, [*removed, *quantities])
+        
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['post'])
     def clear(self, request):
@@ -102,9 +315,11 @@ class BaseCartViewSet(viewsets.ViewSet):
         Очистка корзины.
         """
         cart = self.get_cart(request)
-        CartItem.objects.filter(cart=cart).delete()
+        with transaction.atomic():
+            self.clear_cart(cart)
+            self.bump_cart_version(request, cart)
         
-        return Response(CartSerializer(cart).data)
+        return self.get_mutation_response(request, cart)
 
 
 class CartViewSet(BaseCartViewSet):
@@ -113,43 +328,85 @@ class CartViewSet(BaseCartViewSet):
     """
     permission_classes = [permissions.IsAuthenticated]
     
-    def get_cart(self, request):
+    def get_cart_lookup(self, request):
         """
-        Получаем или создаем корзину для авторизованного пользователя.
+        Корзина авторизованного пользователя.
         """
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        return cart
+        return {'user': request.user}
     
     def list(self, request):
         """
         Получение корзины пользователя.
         """
-        cart = self.get_cart(request)
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        cart = self.get_cart_for_read(request)
+        return self.get_cart_response(request, cart)
 
 
 class AnonymousCartViewSet(BaseCartViewSet):
     """
     ViewSet для работы с корзиной анонимного пользователя.
+    
+    Корзина хранится не в базе, а в хранилище из ANONYMOUS_STORE_BACKEND
+    (кэш или подписанная cookie) и попадает в базу только при регистрации
+    или оформлении заказа (см. api.anonymous_store).
     """
+    permission_classes = [permissions.AllowAny]
     
     def get_cart(self, request):
+        # Изменения блокируют состояние посетителя до записи после ответа
+        return AnonymousCart(get_anonymous_state(request, for_update=request.method not in permissions.SAFE_METHODS))
+    
+    def get_cart_for_read(self, request):
+        return self.get_cart(request)
+    
+    def add_to_cart(self, cart, quantities, increment=True):
+        cart.state.add_to_cart(quantities, increment=increment)
+    
+    def set_cart_quantity(self, cart, sneaker_id, quantity):
+        return cart.state.set_cart_quantity(sneaker_id, quantity)
+    
+    def remove_from_cart(self, cart, sneaker_ids):
+        return cart.state.remove_from_cart(sneaker_ids)
+    
+    def clear_cart(self, cart):
+        cart.state.clear_cart()
+    
+    def get_cart_totals(self, cart, sneaker_ids):
+        cart.load_items(Sneaker.objects.only('price'))
+        quantities = {
+            sneaker_id: cart.state.cart[sneaker_id][0]
+            for sneaker_id in sneaker_ids if sneaker_id in cart.state.cart
+        }
+        return cart.total_price, cart.items_count, quantities
+    
+    def bump_cart_version(self, request, cart):
         """
-        Получаем или создаем корзину для анонимного пользователя по ID сессии.
+        Проверяет If-Match и увеличивает версию. Состояние сохраняется
+        только при успешном ответе, так что при 412 изменение теряется.
         """
-        session_id = request.session.session_key
-        if not session_id:
-            request.session.create()
-            session_id = request.session.session_key
-        
-        cart, _ = Cart.objects.get_or_create(session_id=session_id)
-        return cart
+        expected = self.get_if_match_versions(request, cart)
+        if expected is not None and cart.version not in expected:
+            raise CartVersionMismatch()
+        cart.state.version += 1
+        cart.state.touch()
+    
+    def get_cart_data(self, cart):
+        """
+        Кроссовки корзины загружаются одним запросом (при ?fields= - только нужные колонки).
+        """
+        serializer = CartSerializer(cart, context=self.get_serializer_context())
+        fields = serializer.fields
+        items_field = fields.get('items')
+        sneaker_field = items_field.child.fields.get('sneaker') if items_field is not None else None
+        if sneaker_field is not None:
+            cart.load_items(apply_sparse_only(Sneaker.objects.all(), sneaker_field, extra=['price']))
+        elif items_field is not None or 'total_price' in fields or 'items_count' in fields:
+            cart.load_items(Sneaker.objects.only('price'))
+        return serializer.data
     
     def list(self, request):
         """
         Получение корзины анонимного пользователя.
         """
-        cart = self.get_cart(request)
-        serializer = CartSerializer(cart)
-        return Response(serializer.data) 
\ No newline at end of file
+        cart = self.get_cart_for_read(request)
+        return self.get_cart_response(request, cart)
@@ -1,8 +1,14 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from api.anonymous_store import get_anonymous_state
+from api.cache import sneaker_card_cache
+from api.favorites_cache import favorites_owner, get_favorites
 from api.models import Favorite, Sneaker
-from api.serializers.favorite_serializers import FavoriteSerializer, FavoriteCreateSerializer
+from api.serializers.favorite_serializers import (
+    FavoriteSerializer, FavoriteCreateSerializer, FavoriteMembershipSerializer
+)
+from api.serializers.mixins import apply_sparse_only
 
 
 class BaseFavoriteViewSet(viewsets.ViewSet):
@@ -13,6 +19,96 @@ class BaseFavoriteViewSet(viewsets.ViewSet):
     def get_serializer_context(self):
         return {'request': self.request}
     
+    def get_favorites_data(self, favorites):
+        """
+        Сериализует избранное {sneaker_id: (id записи, added_at)}.
+        
+        Карточки кроссовок берутся из sneaker_card_cache (ключ включает
+        поколение каталога и ?fields=), недостающие загружаются одним in_bulk.
+        Кроссовки, удаленные из каталога, пропускаются.
+        """
+        serializer = FavoriteSerializer(context=self.get_serializer_context())
+        fields = serializer.fields
+        sneaker_field = fields.get('sneaker')
+        
+        cards = {}
+        if sneaker_field is not None:
+            keys = {
+                sneaker_id: sneaker_card_cache.make_key(self.request, 'favorite-card', sneaker_id)
+                for sneaker_id in favorites
+            }
+            found = sneaker_card_cache.get_many(keys.values())
+            cards = {sneaker_id: found[key] for sneaker_id, key in keys.items() if key in found}
+            missing = [sneaker_id for sneaker_id in favorites if sneaker_id not in cards]
+            if missing:
+                sneakers = apply_sparse_only(Sneaker.objects.all(), sneaker_field).in_bulk(missing)
+                for sneaker_id, sneaker in sneakers.items():
+                    cards[sneaker_id] = sneaker_field.to_representation(sneaker)
+                    sneaker_card_cache.set(keys[sneaker_id], cards[sneaker_id])
+        
+        data = []
+        for sneaker_id, (favorite_id, added_at) in favorites.items():
+            if sneaker_field is not None and sneaker_id not in cards:
+                continue
+            values = {
+                'id': favorite_id,
+                'sneaker': cards.get(sneaker_id),
+                'added_at': fields['added_at'].to_representation(added_at) if 'added_at' in fields else None,
+            }
+            data.append({name: values[name] for name in fields})
+        return data
+    
+    def get_owner_filter(self, request):
+        """
+        Условие поиска избранного текущего пользователя или сессии.
+        """
+        user, session_id = self.get_user_or_session(request)
+        return favorites_owner(user, session_id)
+    
+    def get_favorite_entries(self, request):
+        """
+        Избранное из кэша набора: {sneaker_id: (id записи, added_at)}.
+        """
+        return get_favorites(self.get_owner_filter(request))
+    
+    def add_favorite(self, request, sneaker):
+        """
+        Добавляет товар в избранное; False, если он там уже был.
+        """
+        user, session_id = self.get_user_or_session(request)
+        _, created = Favorite.objects.get_or_create(
+            user=user,
+            session_id=session_id,
+            sneaker=sneaker
+        )
+        return created
+    
+    def remove_favorite(self, request, sneaker_id):
+        """
+        Удаляет товар из избранного; False, если его там не было.
+        """
+        # Кэш набора сбрасывает обработчик post_delete после фиксации транзакции
+        deleted, _ = Favorite.objects.filter(sneaker_id=sneaker_id, **self.get_owner_filter(request)).delete()
+        return bool(deleted)
+    
+    def is_favorite(self, request, sneaker_id):
+        return sneaker_id in self.get_favorite_entries(request)
+    
+    def get_favorite_ids(self, request, sneaker_ids):
+        """
+        Те из sneaker_ids, что лежат в избранном (проверка по кэшу набора).
+        """
+        return set(sneaker_ids) & self.get_favorite_entries(request).keys()
+    
+    def get_sneaker_id(self, value):
+        """
+        ID товара из запроса или None, если он не указан или некорректен.
+        """
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    
     @action(detail=False, methods=['post'])
     def add(self, request):
         """
@@ -23,28 +119,24 @@ class BaseFavoriteViewSet(viewsets.ViewSet):
         if serializer.is_valid():
             sneaker = serializer.validated_data['sneaker']
             
-            # Получаем данные пользователя или сессии
-            user, session_id = self.get_user_or_session(request)
-            
-            # Проверяем, есть ли уже такой товар в избранном
-            favorite, created = Favorite.objects.get_or_create(
-                user=user,
-                session_id=session_id,
-                sneaker=sneaker
-            )
-            
-            if created:
+            if self.add_favorite(request, sneaker):
                 return Response({'status': 'Товар добавлен в избранное'})
             return Response({'status': 'Товар уже в избранном'})
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    def list(self, request):
+        """
+        Получение списка избранных товаров.
+        """
+        return Response(self.get_favorites_data(self.get_favorite_entries(request)))
+    
     @action(detail=False, methods=['post'])
     def remove(self, request):
         """
         Удаление товара из избранного.
         """
-        sneaker_id = request.data.get('sneaker_id')
+        sneaker_id = self.get_sneaker_id(request.data.get('sneaker_id'))
         
         if not sneaker_id:
             return Response(
@@ -52,33 +144,19 @@ class BaseFavoriteViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Получаем данные пользователя или сессии
-        user, session_id = self.get_user_or_session(request)
-        
-        # Формируем фильтр для поиска избранного
-        filter_params = {'sneaker_id': sneaker_id}
-        if user:
-            filter_params['user'] = user
-        else:
-            filter_params['session_id'] = session_id
-        
-        try:
-            favorite = Favorite.objects.get(**filter_params)
-            favorite.delete()
-            
+        if self.remove_favorite(request, sneaker_id):
             return Response({'status': 'Товар удален из избранного'})
-        except Favorite.DoesNotExist:
-            return Response(
-                {'error': 'Товар не найден в избранном'},
-                status=status.HTTP_404_NOT_FOUND
-            )
+        return Response(
+            {'error': 'Товар не найден в избранном'},
+            status=status.HTTP_404_NOT_FOUND
+        )
     
     @action(detail=False, methods=['get'])
     def check(self, request):
         """
         Проверка, находится ли товар в избранном.
         """
-        sneaker_id = request.query_params.get('sneaker_id')
+        sneaker_id = self.get_sneaker_id(request.query_params.get('sneaker_id'))
         
         if not sneaker_id:
             return Response(
@@ -86,19 +164,23 @@ class BaseFavoriteViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Получаем данные пользователя или сессии
-        user, session_id = self.get_user_or_session(request)
-        
-        # Формируем фильтр для поиска избранного
-        filter_params = {'sneaker_id': sneaker_id}
-        if user:
-            filter_params['user'] = user
-        else:
-            filter_params['session_id'] = session_id
+        return Response({'is_favorite': self.is_favorite(request, sneaker_id)})
+    
+    @action(detail=False, methods=['get', 'post'])
+    def contains(self, request):
+        """
+        Пакетная проверка избранного: ?ids=1,2,3 или POST {"ids": [1, 2, 3]}.
+        Возвращает ID из запроса, которые лежат в избранном, в порядке запроса.
+        """
+        data = request.data if request.method == 'POST' else request.query_params
+        serializer = FavoriteMembershipSerializer(data=data)
         
-        is_favorite = Favorite.objects.filter(**filter_params).exists()
+        if serializer.is_valid():
+            ids = list(dict.fromkeys(serializer.validated_data['ids']))
+            favorite_ids = self.get_favorite_ids(request, ids)
+            return Response({'favorites': [sneaker_id for sneaker_id in ids if sneaker_id in favorite_ids]})
         
-        return Response({'is_favorite': is_favorite})
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class FavoriteViewSet(BaseFavoriteViewSet):
@@ -112,41 +194,22 @@ class FavoriteViewSet(BaseFavoriteViewSet):
         Возвращает пользователя и None вместо session_id.
         """
         return request.user, None
-    
-    def list(self, request):
-        """
-        Получение списка избранных товаров пользователя.
-        """
-        favorites = Favorite.objects.filter(user=request.user)
-        serializer = FavoriteSerializer(favorites, many=True)
-        return Response(serializer.data)
 
 
 class AnonymousFavoriteViewSet(BaseFavoriteViewSet):
     """
     ViewSet для работы с избранным анонимного пользователя.
+    
+    Избранное хранится в хранилище из ANONYMOUS_STORE_BACKEND,
+    а не в базе (см. api.anonymous_store).
     """
+    permission_classes = [permissions.AllowAny]
     
-    def get_user_or_session(self, request):
-        """
-        Возвращает None вместо пользователя и session_id.
-        """
-        session_id = request.session.session_key
-        if not session_id:
-            request.session.create()
-            session_id = request.session.session_key
-        
-        return None, session_id
+    def add_favorite(self, request, sneaker):
+        return get_anonymous_state(request, for_update=True).add_favorite(sneaker.pk)
     
-    def list(self, request):
-        """
-        Получение списка избранных товаров анонимного пользователя.
-        """
-        session_id = request.session.session_key
-        if not session_id:
-            request.session.create()
-            session_id = request.session.session_key
-        
-        favorites = Favorite.objects.filter(session_id=session_id)
-        serializer = FavoriteSerializer(favorites, many=True)
-        return Response(serializer.data) 
\ No newline at end of file
+    def remove_favorite(self, request, sneaker_id):
+        return get_anonymous_state(request, for_update=True).remove_favorite(sneaker_id)
+    
+    def get_favorite_entries(self, request):
+        return get_anonymous_state(request).favorite_entries()
@@ -0,0 +1,150 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from api.storage import is_content_addressed
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Файлы с хэшем в имени не меняются - браузер может хранить их бессрочно
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Остальные файлы (например, уменьшенные копии) кэшируются с перепроверкой по ETag
+DEFAULT_CACHE_CONTROL = 'public, max-age=86400'
+
+
+class FileRange:
+    """
+    Файл, ограниченный диапазоном байт.
+
+    fileno() позволяет WSGI-серверу отдать диапазон через sendfile
+    (смещение берется из текущей позиции, длина - из Content-Length),
+    а read() не выходит за конец диапазона при обычной отдаче.
+    """
+
+    def __init__(self, fh, start, length):
+        fh.seek(start)
+        self.fh = fh
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fh.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.fh.fileno()
+
+    def close(self):
+        self.fh.close()
+
+
+def parse_range(header, size):
+    """
+    Разбирает заголовок Range с одним диапазоном. Возвращает (start, end)
+    включительно, None для неподдерживаемого заголовка (отдается весь файл)
+    или False, если диапазон невыполним.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Суффикс: последние N байт
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Отдает загруженные файлы из MEDIA_ROOT.
+
+    Поддерживает условные запросы (ETag, Last-Modified), Range и
+    Cache-Control: immutable для файлов с хэшем содержимого в имени.
+    Тело отдается через wsgi.file_wrapper, то есть через sendfile там,
+    где его поддерживает WSGI-сервер.
+    """
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    try:
+        stat = os.stat(fullpath)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('Файл не найден')
+    if not os.path.isfile(fullpath):
+        raise Http404('Файл не найден')
+
+    size = stat.st_size
+    if is_content_addressed(path):
+        etag = quote_etag(os.path.splitext(os.path.basename(path))[0])
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = quote_etag(f'{stat.st_mtime_ns:x}-{size:x}')
+        cache_control = DEFAULT_CACHE_CONTROL
+
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': cache_control,
+        'Accept-Ranges': 'bytes',
+    }
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if conditional is not None:
+        for header, value in headers.items():
+            conditional[header] = value
+        return conditional
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if range_header:
+        # If-Range: диапазон отдается, только если файл не изменился
+        if_range = request.headers.get('If-Range')
+        if if_range is None or if_range == etag:
+            byte_range = parse_range(range_header, size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    fh = open(fullpath, 'rb')
+    if byte_range is None:
+        response = FileResponse(fh, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(fh, start, end - start + 1), content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    if encoding:
+        response['Content-Encoding'] = encoding
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -2,11 +2,17 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from api.anonymous_store import materialize
 from api.models import Order, OrderItem, Cart, CartItem
-from api.serializers.order_serializers import OrderSerializer, OrderCreateSerializer, OrderDetailSerializer
+from api.pagination import KeysetPaginationMixin
+from api.serializers.order_serializers import (
+    OrderSerializer, OrderCreateSerializer, OrderDetailSerializer, OrderFromCartSerializer,
+)
+from api.serializers.mixins import apply_sparse_only
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     """
     ViewSet для работы с заказами пользователя.
     
@@ -19,7 +25,26 @@ class OrderViewSet(viewsets.ModelViewSet):
         """
         Получаем только заказы текущего пользователя.
         """
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        # Порядок совпадает с индексом (user, -created_at, -id)
+        queryset = Order.objects.filter(user=self.request.user).order_by('-created_at', '-id')
+        
+        if self.action in ['list', 'retrieve', 'cancel']:
+            # Для ?fields= выбираем только нужные колонки (created_at нужен курсору)
+            serializer = self.get_serializer()
+            queryset = apply_sparse_only(queryset, serializer, extra=['created_at'])
+            
+            # Количество товаров считается в SQL, а не по позициям каждого заказа
+            if 'items_count' in serializer.fields:
+                queryset = queryset.with_items_count()
+            
+            items_field = serializer.fields.get('items')
+            if items_field is not None:
+                items = apply_sparse_only(
+                    OrderItem.objects.select_related('sneaker'), items_field.child, extra=['order']
+                )
+                queryset = queryset.prefetch_related(Prefetch('items', queryset=items))
+        
+        return queryset
     
     def get_serializer_class(self):
         """
@@ -47,9 +72,10 @@ class OrderViewSet(viewsets.ModelViewSet):
         # Сохраняем заказ
         order = serializer.save(user=self.request.user)
         
-        # После создания заказа очищаем корзину пользователя
-        cart, _ = Cart.objects.get_or_create(user=self.request.user)
-        CartItem.objects.filter(cart=cart).delete()
+        # После создания заказа очищаем корзину пользователя (если она есть)
+        carts = Cart.objects.filter(user=self.request.user)
+        CartItem.objects.filter(cart__in=carts).delete()
+        carts.bump_version()
         
         return order
     
@@ -78,36 +104,29 @@ class OrderViewSet(viewsets.ModelViewSet):
     def create_from_cart(self, request):
         """
         Создание заказа на основе текущей корзины пользователя.
+        
+        Позиции копируются из корзины в заказ одним запросом с текущими ценами,
+        корзина очищается в той же транзакции.
         """
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        cart_items = CartItem.objects.filter(cart=cart)
+        serializer = OrderFromCartSerializer(data=request.data, context=self.get_serializer_context())
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        if not cart_items.exists():
+        with transaction.atomic():
+            # Корзина, собранная до входа в аккаунт, добавляется к корзине пользователя
+            # в той же транзакции, что и заказ
+            materialize(request, request.user)
+            # Пустоту корзины определяет число скопированных строк, а не items_count:
+            # денормализованный счетчик может разойтись с позициями
+            cart = Cart.objects.filter(user=request.user).only('pk').first()
+            order = None
+            if cart is not None:
+                order = Order.objects.create_from_cart(cart, user=request.user, **serializer.validated_data)
+        if order is None:
             return Response(
                 {'error': 'Корзина пуста'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Создаем данные для сериализатора
-        order_data = {
-            'first_name': request.data.get('first_name', ''),
-            'last_name': request.data.get('last_name', ''),
-            'email': request.data.get('email', ''),
-            'phone': request.data.get('phone', ''),
-            'address': request.data.get('address', ''),
-            'items': [
-                {
-                    'sneaker': item.sneaker.id,
-                    'quantity': item.quantity
-                }
-                for item in cart_items
-            ]
-        }
-        
-        serializer = OrderCreateSerializer(data=order_data, context=self.get_serializer_context())
-        
-        if serializer.is_valid():
-            order = self.perform_create(serializer)
-            return Response(OrderDetailSerializer(order).data, status=status.HTTP_201_CREATED)
-        
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST) 
\ No newline at end of file
+        prefetch_related_objects([order], Prefetch('items', queryset=OrderItem.objects.select_related('sneaker')))
+        return Response(OrderDetailSerializer(order).data, status=status.HTTP_201_CREATED)
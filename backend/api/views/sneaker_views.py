@@ -1,15 +1,36 @@
-from rest_framework import viewsets, permissions
-from api.models import Sneaker
+from decimal import Decimal, InvalidOperation
+
+from django.http import StreamingHttpResponse
+from django.db.models import (
+    BooleanField, Case, Count, DecimalField, Exists, ExpressionWrapper, IntegerField, Max, Min, OuterRef, Q,
+    Subquery, Value, When,
+)
+from django.db.models.functions import Coalesce
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from api.anonymous_store import get_anonymous_state
+from api.models import CartItem, Favorite, Sneaker
 from api.serializers.sneaker_serializers import (
     SneakerSerializer, 
     SneakerListSerializer, 
     SneakerDetailSerializer,
-    SneakerCreateUpdateSerializer
+    SneakerCreateUpdateSerializer,
+    get_requested_visitor_fields,
 )
 from rest_framework.parsers import MultiPartParser, FormParser
+from api.pagination import KeysetPaginationMixin
+from api.renderers import FastJSONParser
+from api.serializers.mixins import apply_sparse_only
+from api.search import get_search_backend
+from api.cache import catalog_cache
+from api.feed import FEED_FORMATS, feed_queryset, parse_updated_since, render_feed
 
+PRICE_QUANTUM = Decimal('0.01')
 
-class SneakerViewSet(viewsets.ModelViewSet):
+
+class SneakerViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     """
     ViewSet для отображения и управления кроссовками.
     
@@ -20,6 +41,9 @@ class SneakerViewSet(viewsets.ModelViewSet):
     serializer_class = SneakerSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     parser_classes = [MultiPartParser, FormParser]  # Для обработки загрузки файлов
+    facet_buckets = 10
+    max_facet_buckets = 50
+    max_batch_size = 100
     
     def get_serializer_context(self):
         """
@@ -28,45 +52,346 @@ class SneakerViewSet(viewsets.ModelViewSet):
         context = super().get_serializer_context()
         return context
     
+    def get_keyset_pagination_error(self):
+        """
+        Результаты поиска отсортированы по релевантности, а курсор -
+        по (created_at, id): вместе они дали бы пропуски и повторы.
+        """
+        if self.request.query_params.get('search'):
+            return 'Курсорная пагинация недоступна вместе с ?search='
+        return None
+    
     def get_serializer_class(self):
         """
         Возвращает соответствующий сериализатор в зависимости от действия.
         """
         if self.action == 'list':
             return SneakerListSerializer
-        elif self.action == 'retrieve':
+        elif self.action in ['retrieve', 'batch']:
             return SneakerDetailSerializer
         elif self.action in ['create', 'update', 'partial_update']:
             return SneakerCreateUpdateSerializer
         return SneakerSerializer
     
+    def list(self, request, *args, **kwargs):
+        """
+        Список кроссовок из кэша каталога (пересобирается при изменении каталога).
+        
+        С ?include=is_favorite,in_cart_quantity ответ зависит от посетителя,
+        поэтому собирается без кэша.
+        """
+        if get_requested_visitor_fields(request):
+            return Response(self.build_list_data(), headers={'Cache-Control': 'private'})
+        
+        key = catalog_cache.make_key(request, 'list')
+        data = catalog_cache.get_or_build(key, self.build_list_data)
+        return Response(data)
+    
+    def build_list_data(self):
+        """
+        Собирает данные списка: выбираются только нужные колонки через values(),
+        строки сериализуются быстрым путем SneakerFastListSerializer.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.values(*self.get_serializer(many=True).get_values_fields())
+        
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data).data
+        
+        serializer = self.get_serializer(queryset, many=True)
+        return serializer.data
+    
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Детальная информация о кроссовках из кэша каталога.
+        """
+        key = catalog_cache.make_key(request, 'retrieve', str(kwargs.get(self.lookup_url_kwarg or self.lookup_field)))
+        data = catalog_cache.get_or_build(
+            key, lambda: super(SneakerViewSet, self).retrieve(request, *args, **kwargs).data
+        )
+        return Response(data)
+    
     def get_permissions(self):
         """
         Изменять данные могут только администраторы.
         """
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [permissions.IsAdminUser()]
+        if self.action == 'batch':
+            # POST здесь только способ передать список ID - это чтение
+            return [permissions.AllowAny()]
         return super().get_permissions()
     
     def get_queryset(self):
         """
         Получаем кроссовки с возможностью фильтрации.
         """
-        queryset = Sneaker.objects.filter(available=True)
+        queryset = self.filter_catalog(Sneaker.objects.filter(available=True))
+        if self.action == 'retrieve':
+            # Для ?fields= выбираем только нужные колонки
+            queryset = apply_sparse_only(queryset, self.get_serializer())
+        elif self.action == 'list':
+            queryset = self.annotate_visitor_fields(queryset, get_requested_visitor_fields(self.request))
+        return queryset
+    
+    def annotate_visitor_fields(self, queryset, fields):
+        """
+        Добавляет is_favorite и in_cart_quantity текущего посетителя
+        в тот же SQL-запрос, что и сам список.
         
+        Для пользователя это Exists/Subquery по избранному и корзине,
+        для анонимного посетителя - условия по его данным из хранилища
+        (api.anonymous_store), в базе их нет.
+        """
+        if not fields:
+            return queryset
+        user = self.request.user
+        annotations = {}
+        if user.is_authenticated:
+            if 'is_favorite' in fields:
+                annotations['is_favorite'] = Exists(
+                    Favorite.objects.filter(user=user, sneaker=OuterRef('pk'))
+                )
+            if 'in_cart_quantity' in fields:
+                annotations['in_cart_quantity'] = Coalesce(
+                    Subquery(
+                        CartItem.objects.filter(cart__user=user, sneaker=OuterRef('pk')).values('quantity')[:1]
+                    ),
+                    0,
+                )
+        else:
+            state = get_anonymous_state(self.request)
+            if 'is_favorite' in fields:
+                annotations['is_favorite'] = ExpressionWrapper(
+                    Q(pk__in=list(state.favorites)), output_field=BooleanField()
+                ) if state.favorites else Value(False)
+            if 'in_cart_quantity' in fields:
+                annotations['in_cart_quantity'] = Case(
+                    *[When(pk=sneaker_id, then=Value(line[0])) for sneaker_id, line in state.cart.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ) if state.cart else Value(0)
+        return queryset.annotate(**annotations)
+    
+    def get_price_param(self, name):
+        """
+        Цена из параметра запроса или None; некорректное значение - ошибка 400.
+        """
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            price = Decimal(value)
+        except InvalidOperation:
+            price = None
+        if price is None or not price.is_finite():
+            raise ValidationError({name: 'Некорректная цена'})
+        return price
+    
+    def filter_catalog(self, queryset):
+        """
+        Применяет к queryset фильтры каталога из параметров запроса.
+        """
         # Фильтрация по минимальной цене
-        min_price = self.request.query_params.get('min_price')
-        if min_price:
+        min_price = self.get_price_param('min_price')
+        if min_price is not None:
             queryset = queryset.filter(price__gte=min_price)
         
         # Фильтрация по максимальной цене
-        max_price = self.request.query_params.get('max_price')
-        if max_price:
+        max_price = self.get_price_param('max_price')
+        if max_price is not None:
             queryset = queryset.filter(price__lte=max_price)
         
-        # Поиск по названию
+        # Полнотекстовый поиск по названию и описанию (с сортировкой по релевантности)
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(title__icontains=search)
+            queryset = get_search_backend().search(queryset, search)
+            
+        return queryset
+    
+    @action(detail=False, methods=['get', 'post'], parser_classes=[FastJSONParser, FormParser, MultiPartParser])
+    def batch(self, request):
+        """
+        Несколько кроссовок за один запрос: ?ids=1,2,3 или POST {"ids": [1, 2, 3]}.
+        Порядок результатов совпадает с порядком ID, отсутствующие ID
+        возвращаются в поле missing.
+        """
+        ids = self.parse_batch_ids(request)
+        if ids is None:
+            return Response(
+                {'error': 'Необходимо указать список ID товаров'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(ids) > self.max_batch_size:
+            return Response(
+                {'error': f'Можно запросить не более {self.max_batch_size} товаров за раз'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        key = catalog_cache.make_key(request, 'batch', tuple(ids))
+        return Response(catalog_cache.get_or_build(key, lambda: self.build_batch_data(ids)))
+    
+    def parse_batch_ids(self, request):
+        """
+        Список уникальных ID в порядке запроса или None при ошибке.
+        """
+        if request.method == 'POST':
+            # Тело может быть любым JSON, например массивом
+            if not isinstance(request.data, dict):
+                return None
+            raw = request.data.get('ids')
+            if isinstance(raw, str):
+                raw = raw.split(',')
+        else:
+            raw = request.query_params.get('ids', '').split(',')
+        
+        if not isinstance(raw, (list, tuple)):
+            return None
+        try:
+            ids = [int(value) for value in raw if str(value).strip()]
+        except (TypeError, ValueError):
+            return None
+        return list(dict.fromkeys(ids)) or None
+    
+    def build_batch_data(self, ids):
+        """
+        Загружает все запрошенные кроссовки одним запросом in_bulk.
+        """
+        serializer = self.get_serializer()
+        queryset = apply_sparse_only(Sneaker.objects.filter(available=True), serializer)
+        found = queryset.in_bulk(ids)
+        
+        sneakers = [found[pk] for pk in ids if pk in found]
+        return {
+            'results': self.get_serializer(sneakers, many=True).data,
+            'missing': [pk for pk in ids if pk not in found],
+        }
+    
+    @action(detail=False, methods=['get'])
+    def feed(self, request):
+        """
+        Потоковая выгрузка всего каталога для маркетплейсов и поисковиков.
+        
+        Параметры: feed_format=ndjson|csv, gzip=1, updated_since=<дата или дата-время>.
+        """
+        fmt = request.query_params.get('feed_format', 'ndjson')
+        if fmt not in FEED_FORMATS:
+            return Response(
+                {'error': 'Поддерживаются форматы: ' + ', '.join(FEED_FORMATS)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        updated_since = None
+        if request.query_params.get('updated_since'):
+            updated_since = parse_updated_since(request.query_params['updated_since'])
+            if updated_since is None:
+                return Response(
+                    {'error': 'Некорректное значение updated_since'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        compress = request.query_params.get('gzip', '').lower() in ['1', 'true', 'yes']
+        response = StreamingHttpResponse(
+            render_feed(feed_queryset(updated_since), fmt, request=request, compress=compress),
+            content_type=FEED_FORMATS[fmt],
+        )
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        if fmt == 'csv':
+            response['Content-Disposition'] = 'attachment; filename="sneakers.csv"'
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Распределение цен (гистограмма), минимальная/максимальная цена
+        и количество товаров по наличию для текущих фильтров.
+        """
+        key = catalog_cache.make_key(request, 'facets')
+        return Response(catalog_cache.get_or_build(key, self.build_facets_data))
+    
+    def build_facets_data(self):
+        """
+        Считает фасеты агрегатными запросами, не загружая строки.
+        """
+        try:
+            buckets = int(self.request.query_params.get('buckets', self.facet_buckets))
+        except ValueError:
+            buckets = self.facet_buckets
+        buckets = max(1, min(buckets, self.max_facet_buckets))
+        
+        # Фильтры те же, что у списка, но без условия наличия - его считаем отдельно
+        queryset = self.filter_catalog(Sneaker.objects.all()).order_by()
+        available = Q(available=True)
+        prices = queryset.filter(available).values('price')
+        lowest = Subquery(prices.order_by('price')[:1])
+        highest = Subquery(prices.order_by('-price')[:1])
+        
+        # Корзины гистограммы - условные COUNT в том же агрегатном запросе;
+        # границы считаются в SQL от минимальной и максимальной цены,
+        # последняя корзина включает max_price
+        bucket_counts = {}
+        for index in range(buckets):
+            condition = available
+            if index:
+                condition &= Q(price__gte=self._bucket_bound(lowest, highest, index, buckets))
+            if index < buckets - 1:
+                condition &= Q(price__lt=self._bucket_bound(lowest, highest, index + 1, buckets))
+            bucket_counts[f'bucket_{index}'] = Count('id', filter=condition)
+        
+        stats = queryset.aggregate(
+            total_count=Count('id'),
+            available_count=Count('id', filter=available),
+            min_price=Min('price', filter=available),
+            max_price=Max('price', filter=available),
+            **bucket_counts,
+        )
+        
+        min_price, max_price = stats['min_price'], stats['max_price']
+        histogram = []
+        if min_price is not None:
+            width = (max_price - min_price) / buckets
+            if width:
+                counts = {index: stats[f'bucket_{index}'] for index in range(buckets)}
+            else:
+                buckets, counts = 1, {0: stats['available_count']}
             
-        return queryset 
\ No newline at end of file
+            for index in range(buckets):
+                lower = min_price + width * index
+                upper = max_price if index == buckets - 1 else min_price + width * (index + 1)
+                histogram.append({
+                    'min': self._format_price(lower),
+                    'max': self._format_price(upper),
+                    'count': counts.get(index, 0),
+                })
+        
+        return {
+            'price': {
+                'min': self._format_price(min_price),
+                'max': self._format_price(max_price),
+                'histogram': histogram,
+            },
+            'availability': {
+                'available': stats['available_count'],
+                'unavailable': stats['total_count'] - stats['available_count'],
+            },
+            'count': stats['available_count'],
+        }
+    
+    @staticmethod
+    def _bucket_bound(lowest, highest, index, buckets):
+        """
+        Нижняя граница корзины гистограммы как выражение SQL.
+        """
+        return lowest + (highest - lowest) * Value(Decimal(index) / buckets, output_field=DecimalField())
+    
+    @staticmethod
+    def _format_price(value):
+        """
+        Цена в том же строковом формате, что и в сериализаторах.
+        """
+        if value is None:
+            return None
+        return '{:f}'.format(value.quantize(PRICE_QUANTUM))
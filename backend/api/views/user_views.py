@@ -2,6 +2,8 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth.models import User
+from api.anonymous_store import materialize
+from api.favorites_cache import favorites_owner, forget_favorites
 from api.models import UserProfile, Cart, Favorite
 from api.serializers.user_serializers import UserSerializer, UserProfileSerializer, UserRegistrationSerializer
 
@@ -43,6 +45,7 @@ class UserViewSet(viewsets.ModelViewSet):
         session_id = request.session.session_key
         if session_id:
             self._transfer_session_data_to_user(session_id, user)
+        materialize(request, user)
         
         return Response(UserSerializer(user).data, status=status.HTTP_201_CREATED)
     
@@ -78,6 +81,7 @@ class UserViewSet(viewsets.ModelViewSet):
                 fav.save()
             else:
                 fav.delete()  # Удаляем дубликат
+        forget_favorites(favorites_owner(session_id=session_id))
     
     @action(detail=False, methods=['get', 'put', 'patch'])
     def profile(self, request):
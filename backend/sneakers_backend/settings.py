@@ -53,6 +53,8 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Добавлено для CORS
+    'api.middleware.CatalogSnapshotMiddleware',  # Готовые снимки первых страниц каталога
+    'api.middleware.AnonymousStoreMiddleware',  # Корзина и избранное анонимных посетителей
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -133,6 +135,16 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Хранилище загрузок: имя файла - хэш содержимого, одинаковые файлы не дублируются
+STORAGES = {
+    'default': {
+        'BACKEND': 'api.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -148,7 +160,17 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    # JSON через orjson, если он установлен (иначе стандартный модуль json)
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 # Djoser настройки
@@ -166,3 +188,52 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+
+# Кэши: default - в памяти процесса, shared - общий для всех воркеров.
+# Файловый кэш (с атомарным add для блокировок) работает без внешних сервисов;
+# для нескольких машин его нужно заменить на Redis или Memcached
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'api.cache_backends.FileCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Кэш ответов каталога (список и детальная страница кроссовок).
+# Поколение каталога хранится в общем кэше: запись в одном воркере
+# сбрасывает ответы во всех остальных
+CATALOG_CACHE_ALIAS = 'shared'
+CATALOG_CACHE_MAX_ENTRIES = 512
+CATALOG_CACHE_TIMEOUT = 300
+
+# Уменьшенные копии изображений кроссовок (ширины в пикселях и форматы)
+IMAGE_DERIVATIVE_WIDTHS = [320, 640, 960]
+IMAGE_DERIVATIVE_FORMATS = ['avif', 'webp']
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Предвычисленные сжатые снимки первых страниц каталога
+CATALOG_SNAPSHOT_DIR = os.path.join(BASE_DIR, 'snapshots')
+CATALOG_SNAPSHOT_BASE_URL = 'http://localhost:8000'
+CATALOG_SNAPSHOT_QUERIES = ['', 'page=2', 'page=3']
+# Пересборка в фоновом потоке каждого процесса - только для запуска в один процесс;
+# с несколькими воркерами снимки строит build_catalog_snapshots --watch
+CATALOG_SNAPSHOT_AUTO_REBUILD = False
+
+# Корзина и избранное анонимных посетителей хранятся вне базы:
+# CacheAnonymousStore (кэш Django) или SignedCookieAnonymousStore (подписанная cookie)
+ANONYMOUS_STORE_BACKEND = 'api.anonymous_store.CacheAnonymousStore'
+# Кэш должен быть общим для воркеров, иначе корзина видна только одному процессу
+ANONYMOUS_STORE_CACHE_ALIAS = 'shared'
+ANONYMOUS_STORE_TIMEOUT = 60 * 60 * 24 * 30
+# Ограничение числа товаров в анонимной корзине и в избранном
+ANONYMOUS_STORE_MAX_ITEMS = 50
+
+# Кэш наборов избранного пользователей (общий для воркеров; короткое время жизни -
+# страховка от изменений в обход сигналов) и карточек кроссовок в списке избранного
+FAVORITES_CACHE_ALIAS = 'shared'
+FAVORITES_CACHE_TIMEOUT = 60 * 5
+SNEAKER_CARD_CACHE_MAX_ENTRIES = 5000
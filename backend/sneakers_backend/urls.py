@@ -15,9 +15,12 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+import re
+
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from api.views.media_views import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -26,6 +29,7 @@ urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
 ]
 
-# Добавляем обработку медиа файлов в режиме разработки
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Медиа файлы: Range, ETag и бессрочное кэширование файлов с хэшем в имени
+urlpatterns += [
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+]
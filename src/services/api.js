@@ -51,6 +51,19 @@ export const fetchSneakerById = async (id) => {
   }
 };
 
+// Несколько кроссовок одним запросом (порядок сохраняется, отсутствующие id пропускаются)
+export const fetchSneakersByIds = async (ids) => {
+  try {
+    const response = await axios.get(`${API_URL}sneakers/batch/`, {
+      params: { ids: ids.join(',') }
+    });
+    return response.data.results;
+  } catch (error) {
+    console.error('Error fetching sneakers by ids:', error);
+    throw error;
+  }
+};
+
 // Корзина
 export const fetchCart = async () => {
   try {
@@ -80,6 +93,22 @@ export const addItemToCart = async (sneakerId, quantity = 1) => {
   }
 };
 
+// Несколько товаров одним запросом: mode = 'add' (прибавить) или 'set' (установить количество)
+export const updateCartItems = async (items, mode = 'add') => {
+  try {
+    const endpoint = getAuthToken() ? 'cart/items/' : 'anonymous/cart/items/';
+    const authInstance = createAuthInstance();
+    const response = await authInstance.post(`${API_URL}${endpoint}`, {
+      items: items.map(({ sneakerId, quantity }) => ({ sneaker: sneakerId, quantity })),
+      mode
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Error updating cart items:', error);
+    throw error;
+  }
+};
+
 export const updateCartItem = async (sneakerId, quantity) => {
   try {
     const authInstance = createAuthInstance();
@@ -168,6 +197,19 @@ export const checkIsFavorite = async (sneakerId) => {
   }
 };
 
+// Проверка сразу нескольких товаров: возвращает ID тех, что в избранном
+export const checkFavorites = async (sneakerIds) => {
+  try {
+    const endpoint = getAuthToken() ? 'favorites/contains/' : 'anonymous/favorites/contains/';
+    const authInstance = createAuthInstance();
+    const response = await authInstance.post(`${API_URL}${endpoint}`, { ids: sneakerIds });
+    return response.data.favorites;
+  } catch (error) {
+    console.error('Error checking favorites:', error);
+    return [];
+  }
+};
+
 // Заказы
 export const fetchOrders = async () => {
   try {